@@ -1,4 +1,6 @@
-from .language_recognition.utils import recognize_language_file, recognize_languages_dir
-from .tokenizer import subtokenize_identifier, get_identifiers_sequence_from_code, \
+from .language_recognition.utils import recognize_language_file, recognize_languages_dir, \
+    recognize_languages_files
+from .tokenizer import subtokenize_identifier, subtokenize_identifiers, \
+    get_identifiers_sequence_from_code, \
     get_identifiers_sequence_from_file, get_functions_from_file, get_classes_from_file, \
     tokenize_list_of_repositories
@@ -0,0 +1,107 @@
+"""
+Benchmark of the representations of identifiers with their coordinates: the dataclass with
+a __dict__ per instance, the dataclass with __slots__, and the compact IdentifierColumns.
+Measures the memory of the identifiers and the cost of sending them between processes.
+"""
+import argparse
+import dataclasses
+import os
+import pickle
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from ..tokenizer import get_data_from_file
+from ..utils import IdentifierColumns, IdentifierData
+from .traversal import best_time, FILES, tests_dir
+
+
+@dataclasses.dataclass
+class DictIdentifierData:
+    """
+    IdentifierData with a __dict__ per instance, as it was before __slots__.
+    """
+    identifier: str
+    start_byte: int
+    start_line: int
+    start_column: int
+
+
+def get_identifiers(copies: int) -> List[IdentifierData]:
+    """
+    Parse large files built from the test files and gather their subtokens with coordinates.
+    :param copies: the number of copies of every test file in the large files.
+    :return: a list of IdentifierData objects of all the files.
+    """
+    identifiers = []
+    for lang, file in FILES.items():
+        with open(os.path.join(tests_dir, file), "rb") as fin:
+            code = fin.read() * copies
+        identifiers.extend(get_data_from_file(file, lang, False, True, identifiers_verbose=True,
+                                              subtokenize=True, code=code).identifiers)
+    return identifiers
+
+
+def get_memory(build: Callable[[], Any]) -> int:
+    """
+    Measure the memory that is allocated for an object and kept while it is alive.
+    :param build: the function that creates the object.
+    :return: the size in bytes.
+    """
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def benchmark_identifiers(copies: int, repeats: int) -> Dict[str, Dict[str, float]]:
+    """
+    Measure the memory, the size of pickles, and the time of pickling and unpickling for
+    every representation of the same identifiers.
+    :param copies: the number of copies of every test file in the large files.
+    :param repeats: the number of runs of pickling and unpickling.
+    :return: a dictionary with the names of the representations as keys and their results.
+    """
+    identifiers = get_identifiers(copies)
+    fields = [dataclasses.astuple(identifier) for identifier in identifiers]
+    builders = {"dataclasses": lambda: [DictIdentifierData(*row) for row in fields],
+                "slots": lambda: [IdentifierData(*row) for row in fields],
+                "columns": lambda: IdentifierColumns(identifiers)}
+    results = {}
+    for name, build in builders.items():
+        obj = build()
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        results[name] = {"identifiers": len(identifiers), "memory": get_memory(build),
+                         "pickle": len(data),
+                         "transfer": best_time(lambda: pickle.loads(pickle.dumps(
+                             obj, protocol=pickle.HIGHEST_PROTOCOL)), repeats)}
+    return results
+
+
+def main(copies: int, repeats: int) -> None:
+    """
+    Run the benchmark and print the table of results.
+    :param copies: the number of copies of every test file in the large files.
+    :param repeats: the number of runs of pickling and unpickling.
+    :return: None.
+    """
+    results = benchmark_identifiers(copies, repeats)
+    print(f"{'representation':<16}{'identifiers':>12}{'memory, MB':>12}{'pickle, MB':>12}"
+          f"{'transfer, s':>13}")
+    for name, res in results.items():
+        print(f"{name:<16}{res['identifiers']:>12}{res['memory'] / 1024 ** 2:>12.2f}"
+              f"{res['pickle'] / 1024 ** 2:>12.2f}{res['transfer']:>13.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--copies", type=int, default=100,
+                        help="The number of copies of every test file in the large files. "
+                             "The default value is 100.")
+    parser.add_argument("-r", "--repeats", type=int, default=3,
+                        help="The number of runs of pickling and unpickling. "
+                             "The default value is 3.")
+    args = parser.parse_args()
+    main(args.copies, args.repeats)
@@ -0,0 +1,108 @@
+"""
+Benchmark of scheduling the files for the pool: one task per file in the order of discovery
+against the largest files first with the small files grouped into chunks.
+"""
+import argparse
+import os
+from tempfile import TemporaryDirectory
+from typing import Dict, List, Tuple
+
+from joblib import delayed, Parallel
+
+from ..tokenizer import CHUNK_SIZE, PROCESSES, get_data_from_files
+from ..utils import schedule_files
+from .traversal import best_time, FILES, tests_dir
+
+
+def create_repository(directory: str, small: int, large: int) -> List[Tuple[str, str]]:
+    """
+    Create a skewed synthetic repository: many small files and one large file that is
+    discovered last.
+    :param directory: the path to the directory of the repository.
+    :param small: the number of small files, copies of the test files.
+    :param large: the number of copies of the Python test file in the large file.
+    :return: a list of tuples (full_path_to_file, lang) in the order of discovery.
+    """
+    files = []
+    langs = sorted(FILES)
+    for index in range(small):
+        lang = langs[index % len(langs)]
+        with open(os.path.join(tests_dir, FILES[lang]), "rb") as fin:
+            code = fin.read()
+        file = os.path.join(directory, f"{index}_{FILES[lang]}")
+        with open(file, "wb") as fout:
+            fout.write(code)
+        files.append((file, lang))
+    with open(os.path.join(tests_dir, FILES["Python"]), "rb") as fin:
+        code = fin.read() * large
+    file = os.path.join(directory, "large.py")
+    with open(file, "wb") as fout:
+        fout.write(code)
+    files.append((file, "Python"))
+    return files
+
+
+def benchmark_scheduling(small: int, large: int, workers: int, chunk_size: int,
+                         repeats: int) -> Dict[str, float]:
+    """
+    Time the parsing of a skewed synthetic repository with both ways of scheduling.
+    :param small: the number of small files.
+    :param large: the number of copies of the Python test file in the large file.
+    :param workers: the number of processes.
+    :param chunk_size: the target total size of the chunks of small files in bytes.
+    :param repeats: the number of runs of every way of scheduling.
+    :return: a dictionary with the numbers of tasks and timings.
+    """
+    with TemporaryDirectory() as td, Parallel(workers, return_as="generator") as pool:
+        files = create_repository(td, small, large)
+        chunks = {"unscheduled": [[file] for file in files],
+                  "scheduled": schedule_files(files, chunk_size)}
+
+        def run(name: str) -> int:
+            tasks = [delayed(get_data_from_files)(chunk, False, True, subtokenize=True)
+                     for chunk in chunks[name]]
+            return sum(len(result) for result in pool(tasks))
+
+        run("unscheduled")  # Starting the processes.
+        times = {name: best_time(lambda: run(name), repeats) for name in chunks}
+    return {"files": len(files), "unscheduled tasks": len(chunks["unscheduled"]),
+            "scheduled tasks": len(chunks["scheduled"]), "unscheduled": times["unscheduled"],
+            "scheduled": times["scheduled"],
+            "speedup": times["unscheduled"] / times["scheduled"]}
+
+
+def main(small: int, large: int, workers: int, chunk_size: int, repeats: int) -> None:
+    """
+    Run the benchmark and print the results.
+    :param small: the number of small files.
+    :param large: the number of copies of the Python test file in the large file.
+    :param workers: the number of processes.
+    :param chunk_size: the target total size of the chunks of small files in bytes.
+    :param repeats: the number of runs of every way of scheduling.
+    :return: None.
+    """
+    res = benchmark_scheduling(small, large, workers, chunk_size, repeats)
+    print(f"{'files':>8}{'tasks':>8}{'chunks':>8}{'unscheduled, s':>16}{'scheduled, s':>14}"
+          f"{'speedup':>10}")
+    print(f"{res['files']:>8}{res['unscheduled tasks']:>8}{res['scheduled tasks']:>8}"
+          f"{res['unscheduled']:>16.4f}{res['scheduled']:>14.4f}{res['speedup']:>9.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--small", type=int, default=5000,
+                        help="The number of small files in the repository. "
+                             "The default value is 5000.")
+    parser.add_argument("-c", "--copies", type=int, default=5000,
+                        help="The number of copies of the Python test file in the large file. "
+                             "The default value is 5000.")
+    parser.add_argument("-w", "--workers", type=int, default=PROCESSES,
+                        help="The number of processes, by default the number of CPUs.")
+    parser.add_argument("--chunk_size", type=int, default=CHUNK_SIZE,
+                        help="The target total size of the chunks of small files in bytes. "
+                             "The default value is 65536.")
+    parser.add_argument("-r", "--repeats", type=int, default=3,
+                        help="The number of runs of every way of scheduling. "
+                             "The default value is 3.")
+    args = parser.parse_args()
+    main(args.small, args.copies, args.workers, args.chunk_size, args.repeats)
@@ -0,0 +1,363 @@
+"""
+Throughput benchmark suite of the hot paths: the AST traversal, parsing the files of every
+language, the subtokenizer, Pygments, saving, and the whole pipeline in the local mode on
+a synthetic corpus with several numbers of workers. The results are saved as JSON, so the runs
+on different commits can be compared.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+from tempfile import TemporaryDirectory
+from typing import Dict, List, Optional
+
+from ..saver import OutputFormats
+from ..subtokenizer import TokenParser
+from ..tokenizer import PROCESSES, PygmentsParser, get_data_from_file, \
+    tokenize_list_of_repositories
+from ..utils import SUPPORTED_LANGUAGES, get_latest_commit
+from .traversal import benchmark_language, best_time, FILES, tests_dir
+
+# The test files of all the supported languages, including the ones parsed with Pygments.
+CORPUS_FILES = {**FILES,
+                "Scala": "test.scala",
+                "Swift": "test.swift",
+                "Kotlin": "test.kt",
+                "Haskell": "test.hs"}
+
+SECTIONS = ["traversal", "parsing", "pygments", "subtokenizer", "saving", "pipeline"]
+
+
+def read_test_code(lang: str, copies: int = 1) -> bytes:
+    """
+    Read the test file of a language.
+    :param lang: the language of code.
+    :param copies: the number of copies of the test file that are concatenated.
+    :return: the code.
+    """
+    with open(os.path.join(tests_dir, CORPUS_FILES[lang]), "rb") as fin:
+        return fin.read() * copies
+
+
+def generate_corpus(directory: str, repositories: int, files: int, size: int,
+                    size_sigma: float, depth: int, languages: Dict[str, float],
+                    seed: int = 0) -> List[str]:
+    """
+    Generate synthetic local repositories from the test files. The sizes of the files follow
+    the log-normal distribution, and every file consists of whole copies of a test file, so
+    it stays valid code.
+    :param directory: the path to the directory of the corpus.
+    :param repositories: the number of repositories.
+    :param files: the number of files in every repository.
+    :param size: the median size of the files in bytes.
+    :param size_sigma: the standard deviation of the logarithm of the sizes, 0 for equal sizes.
+    :param depth: the maximum number of nested directories of the files.
+    :param languages: a dictionary with the languages of the files as keys and their weights
+                      in the corpus as values.
+    :param seed: the seed of the random generator, the same seed gives the same corpus.
+    :return: a list of paths to the repositories.
+    """
+    rng = random.Random(seed)
+    langs = sorted(languages)
+    weights = [languages[lang] for lang in langs]
+    codes = {lang: read_test_code(lang) for lang in langs}
+    paths = []
+    for count_repository in range(repositories):
+        repository = os.path.join(directory, f"repository{count_repository}")
+        for count_file in range(files):
+            lang = rng.choices(langs, weights)[0]
+            file_size = rng.lognormvariate(math.log(size), size_sigma)
+            copies = max(1, round(file_size / len(codes[lang])))
+            subdirectories = [f"dir{rng.randrange(3)}" for _ in range(rng.randint(0, depth))]
+            file_directory = os.path.join(repository, *subdirectories)
+            os.makedirs(file_directory, exist_ok=True)
+            extension = os.path.splitext(CORPUS_FILES[lang])[1]
+            with open(os.path.join(file_directory, f"file{count_file}{extension}"), "wb") as fout:
+                fout.write(codes[lang] * copies)
+        paths.append(repository)
+    return paths
+
+
+def benchmark_traversal(languages: List[str], copies: int,
+                        repeats: int) -> Dict[str, Dict[str, float]]:
+    """
+    Time TreeSitterParser.traverse_tree on large files of every tree-sitter language.
+    :param languages: the languages to benchmark.
+    :param copies: the number of copies of the test file in the large file.
+    :param repeats: the number of runs.
+    :return: a dictionary with the languages as keys and their results as values.
+    """
+    results = {}
+    for lang in languages:
+        if lang in SUPPORTED_LANGUAGES["tree-sitter"]:
+            res = benchmark_language(lang, copies, repeats)
+            results[lang] = {"bytes": res["bytes"], "nodes": res["nodes"], "time": res["deque"],
+                             "nodes/s": res["nodes"] / res["deque"]}
+    return results
+
+
+def benchmark_parsing(languages: List[str], copies: int,
+                      repeats: int) -> Dict[str, Dict[str, float]]:
+    """
+    Time get_data_from_file on large files of every language, with objects, subtokenized
+    identifiers, and their parameters.
+    :param languages: the languages to benchmark.
+    :param copies: the number of copies of the test file in the large file.
+    :param repeats: the number of runs.
+    :return: a dictionary with the languages as keys and their results as values.
+    """
+    results = {}
+    for lang in languages:
+        code = read_test_code(lang, copies)
+        file = CORPUS_FILES[lang]
+
+        def parse() -> int:
+            return len(get_data_from_file(file, lang, True, True, identifiers_verbose=True,
+                                          subtokenize=True, code=code).identifiers)
+
+        identifiers = parse()
+        parsing_time = best_time(parse, repeats)
+        results[lang] = {"bytes": len(code), "identifiers": identifiers, "time": parsing_time,
+                         "MB/s": len(code) / parsing_time / 1024 ** 2}
+    return results
+
+
+def benchmark_pygments(languages: List[str], copies: int,
+                       repeats: int) -> Dict[str, Dict[str, float]]:
+    """
+    Time the lexing with PygmentsParser on large files of every Pygments language.
+    :param languages: the languages to benchmark.
+    :param copies: the number of copies of the test file in the large file.
+    :param repeats: the number of runs.
+    :return: a dictionary with the languages as keys and their results as values.
+    """
+    results = {}
+    for lang in languages:
+        if lang not in SUPPORTED_LANGUAGES["pygments"]:
+            continue
+        code = read_test_code(lang, copies).decode("utf-8")
+
+        def lex() -> int:
+            return len(PygmentsParser.get_identifiers_sequence_from_code(code, lang))
+
+        identifiers = lex()
+        lexing_time = best_time(lex, repeats)
+        results[lang] = {"characters": len(code), "identifiers": identifiers,
+                         "time": lexing_time, "identifiers/s": identifiers / lexing_time}
+    return results
+
+
+def benchmark_subtokenizer(languages: List[str], copies: int,
+                           repeats: int) -> Dict[str, Dict[str, float]]:
+    """
+    Time TokenParser.split on the identifiers of the test files and TokenParser.stem on their
+    subtokens, without the cache of subtokens.
+    :param languages: the languages of the test files.
+    :param copies: the number of copies of the identifiers of the test files.
+    :param repeats: the number of runs.
+    :return: a dictionary with "split" and "stem" as keys and their results as values.
+    """
+    tokens = []
+    for lang in languages:
+        tokens.extend(get_data_from_file(CORPUS_FILES[lang], lang, False, True,
+                                         code=read_test_code(lang)).identifiers)
+    tokens *= copies
+    parser = TokenParser(cache_size=0)
+    words = [word for token in tokens for word in parser.split(token)]
+
+    def split() -> int:
+        return sum(1 for token in tokens for _ in parser.split(token))
+
+    def stem() -> int:
+        return sum(1 for word in words if parser.stem(word))
+
+    split_time = best_time(split, repeats)
+    stem_time = best_time(stem, repeats)
+    return {"split": {"tokens": len(tokens), "time": split_time,
+                      "tokens/s": len(tokens) / split_time},
+            "stem": {"tokens": len(words), "time": stem_time, "tokens/s": len(words) / stem_time}}
+
+
+def benchmark_saving(languages: List[str], repositories: int,
+                     repeats: int) -> Dict[str, Dict[str, float]]:
+    """
+    Time OutputFormats.save_wabbit and OutputFormats.save_json on the parsed test files with
+    the granularity of files, in both modes.
+    :param languages: the languages of the test files.
+    :param repositories: the number of copies of the repository of the test files.
+    :param repeats: the number of runs.
+    :return: a dictionary with the names of the format and the mode as keys and their results.
+    """
+    results = {}
+    for mode in ["counters", "sequences"]:
+        files = [get_data_from_file(CORPUS_FILES[lang], lang, False, True, subtokenize=True,
+                                    code=read_test_code(lang), count_identifiers=mode == "counters")
+                 for lang in languages]
+        reps2files = {f"repository{index}/": files for index in range(repositories)}
+        for output_format, save in [("wabbit", OutputFormats.save_wabbit),
+                                    ("json", OutputFormats.save_json)]:
+            with TemporaryDirectory() as td:
+                saving_time = best_time(lambda: save(reps2files, mode, "files", td, "test.txt"),
+                                        repeats)
+                size = os.path.getsize(os.path.join(td, "test.txt"))
+            results[f"{output_format} {mode}"] = {"files": repositories * len(files),
+                                                  "bytes": size, "time": saving_time,
+                                                  "MB/s": size / saving_time / 1024 ** 2}
+    return results
+
+
+def benchmark_pipeline(repositories: int, files: int, size: int, size_sigma: float, depth: int,
+                       languages: Dict[str, float], workers: List[int], repeats: int,
+                       seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """
+    Time tokenize_list_of_repositories in the local mode on a synthetic corpus, see
+    generate_corpus, with several numbers of workers.
+    :param repositories: the number of repositories.
+    :param files: the number of files in every repository.
+    :param size: the median size of the files in bytes.
+    :param size_sigma: the standard deviation of the logarithm of the sizes.
+    :param depth: the maximum number of nested directories of the files.
+    :param languages: a dictionary with the languages of the files as keys and their weights.
+    :param workers: the numbers of workers to benchmark.
+    :param repeats: the number of runs for every number of workers.
+    :param seed: the seed of the random generator of the corpus.
+    :return: a dictionary with the numbers of workers as keys and their results as values.
+    """
+    results = {}
+    with TemporaryDirectory() as td:
+        paths = generate_corpus(os.path.join(td, "corpus"), repositories, files, size,
+                                size_sigma, depth, languages, seed)
+        corpus_size = sum(os.path.getsize(os.path.join(root, file))
+                          for path in paths for root, _, names in os.walk(path)
+                          for file in names)
+        repositories_file = os.path.join(td, "repositories.txt")
+        with open(repositories_file, "w") as fout:
+            fout.write("\n".join(paths))
+        for count_workers in workers:
+            output_dir = os.path.join(td, f"output{count_workers}")
+            pipeline_time = best_time(lambda: tokenize_list_of_repositories(
+                repositories_file, output_dir, repositories, "counters", "files", None, True,
+                "wabbit", subtokenize=True, workers=count_workers), repeats)
+            results[str(count_workers)] = {"files": repositories * files, "bytes": corpus_size,
+                                           "time": pipeline_time,
+                                           "MB/s": corpus_size / pipeline_time / 1024 ** 2}
+    return results
+
+
+def get_commit() -> Optional[str]:
+    """
+    Get the commit of the benchmarked code.
+    :return: the commit hash, None if the code isn't in a Git repository.
+    """
+    try:
+        return get_latest_commit(os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_languages(values: List[str]) -> Dict[str, float]:
+    """
+    Parse the language mix of the corpus from the command line.
+    :param values: a list of languages with optional weights, e.g. ["Python:3", "Java"].
+    :return: a dictionary with the languages as keys and their weights as values, 1 by default.
+    """
+    languages = {}
+    for value in values:
+        lang, _, weight = value.partition(":")
+        if lang not in CORPUS_FILES:
+            raise ValueError(f"{lang} is an unsupported language!")
+        languages[lang] = float(weight) if weight else 1.0
+    return languages
+
+
+def main(output: str, sections: List[str], languages: Dict[str, float], copies: int,
+         repositories: int, files: int, size: int, size_sigma: float, depth: int,
+         workers: List[int], repeats: int, seed: int) -> None:
+    """
+    Run the benchmarks, save the results as JSON, and print them.
+    :param output: the path to the output JSON file.
+    :param sections: the benchmarks to run, see SECTIONS.
+    :param languages: a dictionary with the languages as keys and their weights in the corpus.
+    :param copies: the number of copies of the test files in the large files.
+    :param repositories: the number of repositories in the corpus.
+    :param files: the number of files in every repository of the corpus.
+    :param size: the median size of the files of the corpus in bytes.
+    :param size_sigma: the standard deviation of the logarithm of the sizes.
+    :param depth: the maximum number of nested directories of the files.
+    :param workers: the numbers of workers of the pipeline.
+    :param repeats: the number of runs of every benchmark.
+    :param seed: the seed of the random generator of the corpus.
+    :return: None.
+    """
+    langs = sorted(languages)
+    benchmarks = {
+        "traversal": lambda: benchmark_traversal(langs, copies, repeats),
+        "parsing": lambda: benchmark_parsing(langs, copies, repeats),
+        "pygments": lambda: benchmark_pygments(langs, copies, repeats),
+        "subtokenizer": lambda: benchmark_subtokenizer(langs, copies, repeats),
+        "saving": lambda: benchmark_saving(langs, copies, repeats),
+        "pipeline": lambda: benchmark_pipeline(repositories, files, size, size_sigma, depth,
+                                               languages, workers, repeats, seed)}
+    results = {}
+    for section in sections:
+        results[section] = benchmarks[section]()
+        for name, res in results[section].items():
+            print(f"{section:<14}{name:<20}" + "  ".join(
+                f"{key}: {value:.4g}" if isinstance(value, float) else f"{key}: {value}"
+                for key, value in res.items()))
+    report = {"commit": get_commit(), "python": platform.python_version(),
+              "platform": platform.platform(), "cpus": os.cpu_count(),
+              "parameters": {"languages": languages, "copies": copies,
+                             "repositories": repositories, "files": files, "size": size,
+                             "size_sigma": size_sigma, "depth": depth, "workers": workers,
+                             "repeats": repeats, "seed": seed},
+              "results": results}
+    with open(output, "w") as fout:
+        json.dump(report, fout, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", default="benchmark.json",
+                        help="The path to the output JSON file. "
+                             "The default value is 'benchmark.json'.")
+    parser.add_argument("-s", "--sections", nargs="*", choices=SECTIONS, default=SECTIONS,
+                        help="The benchmarks to run. By default, all of them.")
+    parser.add_argument("-l", "--languages", nargs="*", default=sorted(CORPUS_FILES),
+                        help="The languages to benchmark, with optional weights in the corpus "
+                             "after a colon, e.g. 'Python:3'. By default, all the languages "
+                             "with the same weights.")
+    parser.add_argument("-c", "--copies", type=int, default=100,
+                        help="The number of copies of the test files in the benchmarked files. "
+                             "The default value is 100.")
+    parser.add_argument("--repositories", type=int, default=4,
+                        help="The number of repositories in the corpus. "
+                             "The default value is 4.")
+    parser.add_argument("--files", type=int, default=500,
+                        help="The number of files in every repository of the corpus. "
+                             "The default value is 500.")
+    parser.add_argument("--size", type=int, default=8192,
+                        help="The median size of the files of the corpus in bytes. "
+                             "The default value is 8192.")
+    parser.add_argument("--size_sigma", type=float, default=1.0,
+                        help="The standard deviation of the logarithm of the sizes of the "
+                             "files, 0 for equal sizes. The default value is 1.")
+    parser.add_argument("--depth", type=int, default=3,
+                        help="The maximum number of nested directories of the files of the "
+                             "corpus. The default value is 3.")
+    parser.add_argument("-w", "--workers", type=int, nargs="*",
+                        default=sorted({1, 2, PROCESSES}),
+                        help="The numbers of workers of the pipeline. By default, 1, 2, and "
+                             "the number of CPUs.")
+    parser.add_argument("-r", "--repeats", type=int, default=3,
+                        help="The number of runs of every benchmark. The default value is 3.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="The seed of the random generator of the corpus. "
+                             "The default value is 0.")
+    args = parser.parse_args()
+    main(args.output, args.sections, parse_languages(args.languages), args.copies,
+         args.repositories, args.files, args.size, args.size_sigma, args.depth, args.workers,
+         args.repeats, args.seed)
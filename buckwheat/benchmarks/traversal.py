@@ -0,0 +1,99 @@
+"""
+Benchmark of the AST traversal: the deque walker against the cursor walker.
+"""
+import argparse
+import os
+import time
+from typing import Callable, Dict, List
+
+from ..parsing.utils import get_parser
+from ..tokenizer import TreeSitterParser
+
+tests_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tests", "test_files"))
+
+# Test files that are concatenated into large files for every benchmarked language.
+FILES = {"JavaScript": "test.js",
+         "Python": "test.py",
+         "Java": "test.java",
+         "Go": "test.go",
+         "C++": "test.cpp",
+         "Ruby": "test.rb",
+         "TypeScript": "test.ts",
+         "PHP": "test.php",
+         "C#": "test.cs",
+         "C": "test.c",
+         "Shell": "test.sh",
+         "Rust": "test.rs"}
+
+
+def best_time(function: Callable[[], int], repeats: int) -> float:
+    """
+    Run a function several times and return the best wall-clock time.
+    :param function: the function to time.
+    :param repeats: the number of runs.
+    :return: the smallest time of a single run in seconds.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_language(lang: str, copies: int, repeats: int) -> Dict[str, float]:
+    """
+    Build a large file of a given language from the test files and time both walkers on it.
+    :param lang: the language of code.
+    :param copies: the number of copies of the test file in the large file.
+    :param repeats: the number of runs of every walker.
+    :return: a dictionary with the size of the file, the number of found nodes, and timings.
+    """
+    with open(os.path.join(tests_dir, FILES[lang]), "rb") as fin:
+        code = fin.read() * copies
+    root = get_parser(TreeSitterParser.PARSERS[lang]).parse(code).root_node
+    types = TreeSitterParser.merge_nodes_for_lang(lang)
+    kinds = TreeSitterParser.get_node_kinds(lang)[-1]
+
+    def deque_walker() -> int:
+        return sum(1 for _ in TreeSitterParser.traverse_tree(root, types))
+
+    def cursor_walker() -> int:
+        return sum(1 for _ in TreeSitterParser.traverse_tree_cursor(root, kinds))
+
+    nodes = deque_walker()
+    assert nodes == cursor_walker(), f"The walkers found different nodes in {lang}!"
+    deque_time = best_time(deque_walker, repeats)
+    cursor_time = best_time(cursor_walker, repeats)
+    return {"bytes": len(code), "nodes": nodes, "deque": deque_time, "cursor": cursor_time,
+            "speedup": deque_time / cursor_time}
+
+
+def main(languages: List[str], copies: int, repeats: int) -> None:
+    """
+    Run the benchmark and print the table of results.
+    :param languages: the languages to benchmark.
+    :param copies: the number of copies of the test file in the large file.
+    :param repeats: the number of runs of every walker.
+    :return: None.
+    """
+    print(f"{'language':<12}{'bytes':>12}{'nodes':>10}{'deque, s':>12}{'cursor, s':>12}"
+          f"{'speedup':>10}")
+    for lang in languages:
+        res = benchmark_language(lang, copies, repeats)
+        print(f"{lang:<12}{res['bytes']:>12}{res['nodes']:>10}{res['deque']:>12.4f}"
+              f"{res['cursor']:>12.4f}{res['speedup']:>9.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-l", "--languages", nargs="*", choices=sorted(FILES),
+                        default=sorted(FILES), help="Languages to benchmark. By default, all "
+                                                    "the tree-sitter languages.")
+    parser.add_argument("-c", "--copies", type=int, default=200,
+                        help="The number of copies of the test file in the benchmarked file. "
+                             "The default value is 200.")
+    parser.add_argument("-r", "--repeats", type=int, default=5,
+                        help="The number of runs of every walker. The default value is 5.")
+    args = parser.parse_args()
+    main(args.languages, args.copies, args.repeats)
@@ -0,0 +1,262 @@
+"""
+Caching-related functionality.
+"""
+from collections import namedtuple
+import hashlib
+import logging
+import os
+import pickle
+from tempfile import NamedTemporaryFile
+from typing import Any, List, Optional, Tuple
+
+import pygments
+
+from .parsing.utils import get_tree_sitter_dir
+from .utils import FileData, get_full_path
+
+# The version of the format of the cache, must be changed together with the parsing results
+CACHE_VERSION = 3
+# The default maximum size of the cache on disk in bytes
+MAX_CACHE_SIZE = 1024 ** 3
+# After the eviction, the cache takes this share of its maximum size
+EVICTION_RATIO = 0.9
+
+TokenizationCacheInfo = namedtuple("TokenizationCacheInfo",
+                                   ["hits", "misses", "repositories", "maxsize", "currsize"])
+
+
+def get_blob_sha(file: str) -> str:
+    """
+    Get the hash of the contents of the file, the same as its Git blob SHA.
+    :param file: the path to the file.
+    :return: the hexadecimal SHA-1 hash.
+    """
+    with open(file, "rb") as fin:
+        code = fin.read()
+    sha = hashlib.sha1(f"blob {len(code)}\0".encode())
+    sha.update(code)
+    return sha.hexdigest()
+
+
+def get_grammar_version() -> str:
+    """
+    Get the version of the parsers: the commits of the tree-sitter grammars and the version of
+    Pygments.
+    :return: the version as a string.
+    """
+    grammar_hashes = os.path.join(get_tree_sitter_dir(), os.pardir, "grammar_hashes.txt")
+    with open(grammar_hashes) as fin:
+        return fin.read() + pygments.__version__
+
+
+class TokenizationCache:
+    """
+    On-disk cache of the parsed files, keyed by the contents of the file, its language, and the
+    parameters of parsing. The FileData objects are pickled into separate files, the least
+    recently used ones are evicted when the cache gets larger than its maximum size.
+    The cache also keeps the lists of files of the tokenized repositories, so the repositories
+    with the same commit are read from the cache without recognizing the languages.
+    """
+    def __init__(self, directory: str, parameters: Tuple[Any, ...],
+                 max_size: int = MAX_CACHE_SIZE):
+        """
+        :param directory: the path to the directory of the cache.
+        :param parameters: the parameters of parsing that change the FileData objects.
+        :param max_size: the maximum size of the cache on disk in bytes.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        config = repr((CACHE_VERSION, get_grammar_version(), parameters))
+        self.config = hashlib.sha1(config.encode()).hexdigest()
+        self.hits = 0
+        self.misses = 0
+        self.repositories = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.size = sum(size for _, size, _ in self.get_entries())
+
+    def get_path(self, kind: str, key: str) -> str:
+        """
+        Get the path to an entry of the cache.
+        :param kind: the kind of the entry: "files" or "repositories".
+        :param key: the key of the entry.
+        :return: the path to the file of the entry.
+        """
+        return os.path.join(self.directory, kind, key[:2], key[2:] + ".pickle")
+
+    def get_entries(self) -> List[Tuple[float, int, str]]:
+        """
+        Get all the entries of the cache.
+        :return: a list of tuples (the time of the last use, size in bytes, path).
+        """
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def read(self, kind: str, key: str) -> Optional[Any]:
+        """
+        Read an entry of the cache and mark it as recently used.
+        :param kind: the kind of the entry: "files" or "repositories".
+        :param key: the key of the entry.
+        :return: the unpickled entry or None if there's no such entry.
+        """
+        path = self.get_path(kind, key)
+        try:
+            with open(path, "rb") as fin:
+                entry = pickle.load(fin)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return entry
+
+    def write(self, kind: str, key: str, entry: Any) -> None:
+        """
+        Write an entry of the cache. The entry is replaced atomically, so the interrupted runs
+        don't leave broken entries.
+        :param kind: the kind of the entry: "files" or "repositories".
+        :param key: the key of the entry.
+        :param entry: the entry to pickle.
+        :return: None.
+        """
+        path = self.get_path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            self.size -= os.stat(path).st_size
+        except FileNotFoundError:
+            pass
+        with NamedTemporaryFile("wb", dir=os.path.dirname(path), delete=False) as fout:
+            pickle.dump(entry, fout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(fout.name, path)
+        self.size += os.stat(path).st_size
+
+    def get_file_key(self, file: str, lang: str, blob_sha: Optional[str] = None) -> str:
+        """
+        Get the key of a file: its contents, its language, and the parameters of parsing.
+        :param file: the path to the file.
+        :param lang: the language of code.
+        :param blob_sha: if not None, the Git blob SHA of the file, then the file isn't read.
+        :return: the key as a hexadecimal string.
+        """
+        if blob_sha is None:
+            blob_sha = get_blob_sha(file)
+        return hashlib.sha1(f"{blob_sha} {lang} {self.config}".encode()).hexdigest()
+
+    def contains_file(self, key: str) -> bool:
+        """
+        Check whether the cache has a file, updating the statistics of hits and misses.
+        :param key: the key of the file.
+        :return: True if the parsed file is in the cache.
+        """
+        path = self.get_path("files", key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def get_file(self, key: str, file: str) -> Optional[FileData]:
+        """
+        Get a parsed file from the cache.
+        :param key: the key of the file.
+        :param file: the current path to the file, the cached file can have another one.
+        :return: the FileData object or None if the file was evicted.
+        """
+        file_data = self.read("files", key)
+        if file_data is None:
+            return None
+        file_data.path = file
+        for obj in file_data.objects:
+            obj.path = obj.source = file
+        return file_data
+
+    def set_file(self, key: str, file_data: FileData) -> None:
+        """
+        Put a parsed file into the cache.
+        :param key: the key of the file.
+        :param file_data: the FileData object.
+        :return: None.
+        """
+        self.write("files", key, file_data)
+
+    def get_repository_key(self, repository_name: str, bare: bool = False) -> str:
+        """
+        Get the key of a repository: its name and the parameters of parsing.
+        :param repository_name: the correct name of the repository for links, with the commit.
+        :param bare: True if the languages were recognized by the extensions in a bare
+                     repository, the lists of files differ from the ones of Enry.
+        :return: the key as a hexadecimal string.
+        """
+        return hashlib.sha1(f"{repository_name} {bare} {self.config}".encode()).hexdigest()
+
+    def get_repository(self, repository_name: str, directory: str, bare: bool = False) -> \
+            Optional[List[Tuple[str, str, str]]]:
+        """
+        Get the parsed files of a repository that was already tokenized with the same commit.
+        :param repository_name: the correct name of the repository for links, with the commit.
+        :param directory: the path to the directory of the repository.
+        :param bare: True if the languages are recognized by the extensions in a bare repository.
+        :return: a list of tuples (key, full_path_to_file, lang) or None if the repository
+                 wasn't tokenized or some of its files were evicted.
+        """
+        files = self.read("repositories", self.get_repository_key(repository_name, bare))
+        if files is None:
+            return None
+        for key, _, _ in files:
+            try:
+                os.utime(self.get_path("files", key))
+            except FileNotFoundError:
+                return None
+        self.repositories += 1
+        self.hits += len(files)
+        return [(key, get_full_path(file, directory), lang) for key, file, lang in files]
+
+    def set_repository(self, repository_name: str, directory: str,
+                       files: List[Tuple[str, str, str]], bare: bool = False) -> None:
+        """
+        Save the list of parsed files of a tokenized repository.
+        :param repository_name: the correct name of the repository for links, with the commit.
+        :param directory: the path to the directory of the repository.
+        :param files: a list of tuples (key, full_path_to_file, lang).
+        :param bare: True if the languages were recognized by the extensions in a bare repository.
+        :return: None.
+        """
+        self.write("repositories", self.get_repository_key(repository_name, bare),
+                   [(key, os.path.relpath(file, directory), lang) for key, file, lang in files])
+
+    def evict(self) -> None:
+        """
+        If the cache is larger than its maximum size, remove the least recently used entries.
+        :return: None.
+        """
+        if self.size <= self.max_size:
+            return
+        entries = sorted(self.get_entries())
+        self.size = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if self.size <= self.max_size * EVICTION_RATIO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            evicted += 1
+        logging.debug(f"Evicted {evicted} entries from the cache.")
+
+    def cache_info(self) -> TokenizationCacheInfo:
+        """
+        Get the statistics of the cache.
+        :return: the numbers of hits and misses of files, the number of the repositories that
+                 were read from the cache, the maximum and the current size in bytes.
+        """
+        return TokenizationCacheInfo(self.hits, self.misses, self.repositories, self.max_size,
+                                     self.size)
@@ -0,0 +1,289 @@
+"""
+In-process recognition of the languages of files by their names, with Enry for the ambiguous
+and unknown cases. The rules follow the ones of Enry: hidden, vendored, and documentation files
+are skipped, as well as symbolic links. Only the files whose names can't belong to a supported
+language are skipped without running Enry.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import os
+import re
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .utils import link_file, recognize_languages_dir
+
+# The extensions of the files that are always in the same supported language, from Linguist.
+EXTENSIONS = {
+    ".c": "C", ".cats": "C", ".idc": "C",
+    ".csx": "C#", ".linq": "C#",
+    ".c++": "C++", ".cc": "C++", ".cp": "C++", ".cpp": "C++", ".cxx": "C++", ".h++": "C++",
+    ".hpp": "C++", ".hxx": "C++", ".inl": "C++", ".ino": "C++", ".ipp": "C++", ".tcc": "C++",
+    ".tpp": "C++",
+    ".go": "Go",
+    ".hs": "Haskell", ".hs-boot": "Haskell", ".hsc": "Haskell",
+    ".java": "Java",
+    ".js": "JavaScript", "._js": "JavaScript", ".bones": "JavaScript", ".cjs": "JavaScript",
+    ".es6": "JavaScript", ".jake": "JavaScript", ".jsb": "JavaScript", ".jscad": "JavaScript",
+    ".jsfl": "JavaScript", ".jsm": "JavaScript", ".jss": "JavaScript", ".mjs": "JavaScript",
+    ".njs": "JavaScript", ".pac": "JavaScript", ".sjs": "JavaScript", ".ssjs": "JavaScript",
+    ".xsjs": "JavaScript", ".xsjslib": "JavaScript",
+    ".kt": "Kotlin", ".ktm": "Kotlin", ".kts": "Kotlin",
+    ".aw": "PHP", ".ctp": "PHP", ".php3": "PHP", ".php4": "PHP", ".php5": "PHP", ".phps": "PHP",
+    ".phpt": "PHP", ".phtml": "PHP",
+    ".py": "Python", ".gyp": "Python", ".gypi": "Python", ".lmi": "Python", ".py3": "Python",
+    ".pyde": "Python", ".pyi": "Python", ".pyp": "Python", ".pyt": "Python", ".pyw": "Python",
+    ".tac": "Python", ".wsgi": "Python", ".xpy": "Python",
+    ".rb": "Ruby", ".builder": "Ruby", ".eye": "Ruby", ".gemspec": "Ruby", ".god": "Ruby",
+    ".jbuilder": "Ruby", ".mspec": "Ruby", ".podspec": "Ruby", ".rabl": "Ruby", ".rake": "Ruby",
+    ".rbuild": "Ruby", ".rbw": "Ruby", ".rbx": "Ruby", ".ru": "Ruby", ".ruby": "Ruby",
+    ".thor": "Ruby", ".watchr": "Ruby",
+    ".rs.in": "Rust",
+    ".scala": "Scala", ".kojo": "Scala", ".sbt": "Scala",
+    ".sh": "Shell", ".bash": "Shell", ".bats": "Shell", ".command": "Shell", ".ksh": "Shell",
+    ".sh.in": "Shell", ".tmux": "Shell", ".tool": "Shell", ".zsh": "Shell",
+    ".swift": "Swift"
+}
+
+# The extensions that are shared by a supported language and other languages or formats.
+# The contents of such files are classified by Enry, the languages are only the most probable
+# guesses for the cases where the contents aren't available.
+AMBIGUOUS_EXTENSIONS = {
+    ".h": "C",  # C, C++, Objective-C
+    ".cs": "C#",  # C#, Smalltalk
+    ".cake": "C#",  # C#, CoffeeScript
+    ".hh": "C++",  # C++, Hack
+    ".inc": "PHP",  # PHP, C++, Assembly, Pascal, SQL, and others
+    ".jsx": "JavaScript",  # JavaScript, JSX
+    ".es": "JavaScript",  # JavaScript, Erlang
+    ".php": "PHP",  # PHP, Hack
+    ".pluginspec": "Ruby",  # Ruby, XML
+    ".rs": "Rust",  # Rust, RenderScript
+    ".sc": "Scala",  # Scala, SuperCollider
+    ".ts": "TypeScript",  # TypeScript, XML, video
+    ".tsx": "TSX"  # TSX, XML
+}
+
+# The extensions of the files that are never in a supported language: data, markup, prose,
+# binary files, and the popular languages that aren't supported. Such files are skipped, and
+# the files with all the other unknown extensions are classified by Enry.
+UNSUPPORTED_EXTENSIONS = {
+    ".7z", ".a", ".avi", ".bin", ".bmp", ".bz2", ".class", ".clj", ".coffee", ".cfg", ".conf",
+    ".css", ".csv", ".dart", ".dat", ".diff", ".dll", ".doc", ".docx", ".dylib", ".el", ".eot",
+    ".erb", ".ex", ".exs", ".exe", ".gif", ".gradle", ".gz", ".html", ".htm", ".ico", ".ini",
+    ".ipynb", ".jar", ".jpeg", ".jpg", ".json", ".less", ".lock", ".log", ".lua", ".m", ".map",
+    ".md", ".mk", ".mov", ".mp3", ".mp4", ".o", ".obj", ".ogg", ".otf", ".patch", ".pdf",
+    ".pem", ".pl", ".pm", ".png", ".properties", ".proto", ".ps1", ".pyc", ".r", ".rst",
+    ".sass", ".scss", ".so", ".sql", ".svg", ".tar", ".tex", ".tgz", ".toml", ".ttf", ".tsv",
+    ".txt", ".vue", ".wav", ".webp", ".woff", ".woff2", ".xml", ".xz", ".yaml", ".yml", ".zip"
+}
+
+# The names of the files that are always in the same supported language.
+FILENAMES = {
+    "APKBUILD": "Shell", "PKGBUILD": "Shell",
+    "Berksfile": "Ruby", "Brewfile": "Ruby", "Capfile": "Ruby", "Gemfile": "Ruby",
+    "Guardfile": "Ruby", "Podfile": "Ruby", "Rakefile": "Ruby", "Thorfile": "Ruby",
+    "Jakefile": "JavaScript"
+}
+
+# The regular expressions for the relative paths of the vendored files and directories.
+VENDOR_RE = re.compile("|".join([
+    r"(^|/)cache/", r"^[Dd]ependencies/", r"(^|/)dist/", r"^deps/", r"(^|/)configure$",
+    r"(^|/)config\.guess$", r"(^|/)config\.sub$", r"(^|/)cpplint\.py", r"(^|/)node_modules/",
+    r"(^|/)bower_components/", r"(^|/)Godeps/_workspace/", r"(^|/)testdata/",
+    r"(\.|-)min\.(js|css)$", r"(^|/)bootstrap([^/.]*)(\..*)?\.(js|css|less|scss|styl)$",
+    r"(^|/)materialize\.(css|less|scss|styl|js)$", r"(^|/)select2/.*\.(css|scss|js)$",
+    r"(3rd|[Tt]hird)[-_]?[Pp]arty/", r"(^|/)vendors?/", r"(^|/)extern(al)?/",
+    r"(^|/)[Vv]+endor/", r"^debian/", r"(^|/)jquery([^.]*)\.js$",
+    r"(^|/)jquery\-\d\.\d+(\.\d+)?\.js$", r"(^|/)prototype(.*)\.js$", r"(^|/)effects\.js$",
+    r"(^|/)controls\.js$", r"(^|/)dragdrop\.js$", r"(.*?)\.d\.ts$",
+    r"(^|/)mootools([^.]*)\d+\.\d+\.\d+([^.]*)\.js$", r"(^|/)dojo\.js$",
+    r"(^|/)MochiKit\.js$", r"(^|/)yahoo-([^.]*)\.js$", r"(^|/)yui([^.]*)\.js$",
+    r"(^|/)ckeditor\.js$", r"(^|/)tiny_mce([^.]*)\.js$", r"(^|/)ace-builds/",
+    r"(^|/)MathJax/", r"(^|/)Chart\.js$", r"(^|/)shBrush([^.]*)\.js$", r"(^|/)shCore\.js$",
+    r"(^|/)angular([^.]*)\.js$", r"(^|/)d3(\.v\d+)?([^.]*)\.js$", r"(^|/)react(-[^.]*)?\.js$",
+    r"(^|/)modernizr\-\d\.\d+(\.\d+)?\.js$", r"(^|/)docs?/_?(build|themes?|templates?|static)/",
+    r"(^|/)env/", r"(^|/)fabfile\.py$", r"(^|/)waf$", r"(^|/)Carthage/", r"(^|/)Sparkle/",
+    r"(^|/)gradlew$", r"(^|/)gradle/wrapper/", r"(^|/)mvnw$", r"(^|/)\.mvn/wrapper/",
+    r"-vsdoc\.js$", r"\.intellisense\.js$", r"(^|/)html5shiv\.js$", r"^[Tt]ests?/fixtures/",
+    r"^[Ss]pecs?/fixtures/", r"(^|/)cordova([^.]*)\.js$", r"foundation(\..*)?\.js$",
+    r"(^|/)Vagrantfile$", r"(^|/)activator$", r"(^|/)puphpet/", r"(^|/)Jenkinsfile$"
+]))
+
+# The regular expressions for the relative paths of the documentation files and directories.
+DOCUMENTATION_RE = re.compile("|".join([
+    r"^[Dd]ocs?/", r"(^|/)[Dd]ocumentation/", r"(^|/)[Jj]avadoc/", r"^[Mm]an/",
+    r"^[Ee]xamples/", r"^[Dd]emos?/", r"(^|/)CHANGE(S|LOG)?(\.|$)", r"(^|/)CONTRIBUTING(\.|$)",
+    r"(^|/)COPYING(\.|$)", r"(^|/)INSTALL(\.|$)", r"(^|/)LICEN[CS]E(\.|$)",
+    r"(^|/)[Ll]icen[cs]e(\.|$)", r"(^|/)README(\.|$)", r"(^|/)[Rr]eadme(\.|$)",
+    r"^[Ss]amples?/"
+]))
+
+# The default number of threads that walk the directories
+WALK_THREADS = 8
+
+
+def is_skipped(path: str) -> bool:
+    """
+    Check whether a file or a directory is skipped, like in Enry: hidden, vendored,
+    and documentation files.
+    :param path: the relative path to the file, the paths to directories end with a slash.
+    :return: True if the file or the whole directory is skipped.
+    """
+    return path.startswith(".") or "/." in path or VENDOR_RE.search(path) is not None or \
+        DOCUMENTATION_RE.search(path) is not None
+
+
+def classify_path(path: str) -> Tuple[Optional[str], bool]:
+    """
+    Recognize the supported language of a file by its name and its extensions.
+    :param path: the path to the file.
+    :return: a tuple (the language, True if the language depends on the contents of the file).
+             The language is the most probable guess for the ambiguous extensions, and None
+             for the unsupported and the unknown names. The files with unknown names, including
+             the files without extensions, depend on their contents.
+    """
+    name = os.path.basename(path)
+    if name in FILENAMES:
+        return FILENAMES[name], False
+    # Trying the extensions from the longest one: "test.sh.in" has ".sh.in" and ".in".
+    index = name.find(".", 1)
+    extension = ""
+    while index != -1:
+        extension = name[index:].lower()
+        if extension in EXTENSIONS:
+            return EXTENSIONS[extension], False
+        if extension in AMBIGUOUS_EXTENSIONS:
+            return AMBIGUOUS_EXTENSIONS[extension], True
+        index = name.find(".", index + 1)
+    return None, extension not in UNSUPPORTED_EXTENSIONS
+
+
+def scan_directory(directory: str, path: str) -> Tuple[List[str], List[str]]:
+    """
+    List the files and the subdirectories of a directory, skipping the ones that Enry skips.
+    :param directory: the path to the root directory.
+    :param path: the relative path to the listed directory, empty or ending with a slash.
+    :return: a tuple (relative paths to the files, relative paths to the subdirectories).
+    """
+    files = []
+    subdirectories = []
+    with os.scandir(os.path.join(directory, path)) as entries:
+        for entry in entries:
+            if entry.is_symlink():
+                continue
+            if entry.is_dir():
+                if not is_skipped(path + entry.name + "/"):
+                    subdirectories.append(path + entry.name + "/")
+            elif entry.is_file() and not is_skipped(path + entry.name):
+                files.append(path + entry.name)
+    return files, subdirectories
+
+
+def walk_directory(directory: str, threads: int = WALK_THREADS) -> List[str]:
+    """
+    List all the files in a directory and its subdirectories that Enry classifies. The
+    subdirectories are listed in parallel.
+    :param directory: the path to the directory.
+    :param threads: the number of threads that list the directories.
+    :return: a list of relative paths to the files in the same order as Enry walks them.
+    """
+    files = []
+    with ThreadPoolExecutor(threads) as executor:
+        pending = {executor.submit(scan_directory, directory, "")}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory_files, subdirectories = future.result()
+                files.extend(directory_files)
+                for subdirectory in subdirectories:
+                    pending.add(executor.submit(scan_directory, directory, subdirectory))
+    # Enry walks the files and directories of every directory in the lexical order.
+    return sorted(files, key=lambda file: file.split("/"))
+
+
+def recognize_ambiguous_files(directory: str, files: List[str]) -> Dict[str, List[str]]:
+    """
+    Recognize the languages of the files by their contents with a single run of Enry.
+    The files are linked into a temporary directory with the same relative paths.
+    :param directory: the path to the root directory.
+    :param files: a list of relative paths to the files.
+    :return: dictionary {language1: [files], language2: [files], ...}
+    """
+    with TemporaryDirectory() as td:
+        for file in files:
+            link_file(os.path.join(directory, file), os.path.join(td, file))
+        return recognize_languages_dir(td)
+
+
+def classify_languages_dir(directory: str, threads: int = WALK_THREADS) -> Dict[str, List[str]]:
+    """
+    Recognize the supported languages in the directory and return a dictionary in the same
+    format as recognize_languages_dir. The languages are recognized in-process by the names of
+    the files, and only the files with ambiguous and unknown names are passed to Enry in
+    a single run.
+    :param directory: the path to the directory.
+    :param threads: the number of threads that list the directories.
+    :return: dictionary {language1: [files], language2: [files], ...}
+    """
+    lang2files = {}
+    ambiguous_files = []
+    for file in walk_directory(directory, threads):
+        lang, ambiguous = classify_path(file)
+        if ambiguous:
+            ambiguous_files.append(file)
+        elif lang is not None:
+            lang2files.setdefault(lang, []).append(file)
+    if ambiguous_files:
+        for lang, files in recognize_ambiguous_files(directory, ambiguous_files).items():
+            lang2files.setdefault(lang, []).extend(files)
+    # The files are in the order of walking, like in Enry.
+    return {lang: sorted(files, key=lambda file: file.split("/"))
+            for lang, files in lang2files.items()}
+
+
+def get_parent_directories(path: str) -> List[str]:
+    """
+    Get the relative paths to all the parent directories of a file.
+    :param path: the relative path to the file.
+    :return: a list of the relative paths to the directories, ending with slashes.
+    """
+    parts = path.split("/")[:-1]
+    return ["/".join(parts[:index]) + "/" for index in range(1, len(parts) + 1)]
+
+
+def recognize_languages_paths(paths: List[str], read: Optional[Callable[[str], bytes]] = None) \
+        -> Dict[str, List[str]]:
+    """
+    Recognize the supported languages of the files by their paths and return a dictionary in
+    the same format as recognize_languages_dir. With a function that reads the files, the files
+    with ambiguous and unknown names are written into a temporary directory with the same
+    relative paths and classified by Enry in a single run, like in classify_languages_dir.
+    Otherwise, the ambiguous extensions are resolved to the most probable languages, and the
+    unknown names are skipped.
+    :param paths: a list of relative paths to files.
+    :param read: if not None, the function that returns the contents of a file by its path,
+                 e.g. from the Git objects of a bare repository.
+    :return: dictionary {language1: [files], language2: [files], ...}
+    """
+    lang2files = {}
+    ambiguous_files = []
+    for path in paths:
+        if any(is_skipped(directory) for directory in get_parent_directories(path)) or \
+                is_skipped(path):
+            continue
+        lang, ambiguous = classify_path(path)
+        if ambiguous and read is not None:
+            ambiguous_files.append(path)
+        elif lang is not None:
+            lang2files.setdefault(lang, []).append(path)
+    if ambiguous_files:
+        with TemporaryDirectory() as td:
+            for path in ambiguous_files:
+                os.makedirs(os.path.dirname(os.path.join(td, path)), exist_ok=True)
+                with open(os.path.join(td, path), "wb") as fout:
+                    fout.write(read(path))
+            for lang, files in recognize_languages_dir(td).items():
+                lang2files.setdefault(lang, []).extend(files)
+    # The files are in the order of walking, like in classify_languages_dir.
+    return {lang: sorted(files, key=lambda file: file.split("/"))
+            for lang, files in lang2files.items()}
@@ -1,12 +1,16 @@
 """
 The downloading of Enry
 """
+from collections import OrderedDict
 import json
 import logging
 import os
 import platform
+import shutil
 import subprocess
-from typing import Dict, List
+from tempfile import TemporaryDirectory
+import threading
+from typing import Dict, List, Optional
 import urllib.request
 
 DOWNLOAD_URLS = {
@@ -21,6 +25,13 @@ FILENAMES = {
     "Darwin": "enry.tar.gz"
 }
 
+# The number of the most recently classified files whose languages are memoized
+FILES_CACHE_SIZE = 2 ** 16
+
+# (path, mtime, size) -> language, the least recently used files are evicted first
+_files_cache = OrderedDict()
+_files_cache_lock = threading.Lock()
+
 
 def identify_system() -> str:
     """
@@ -88,6 +99,64 @@ def recognize_languages_dir(directory: str) -> Dict[str, List[str]]:
     return json.loads(res)
 
 
+def link_file(source: str, destination: str) -> None:
+    """
+    Create a hard link to the file, or copy it if the hard link can't be created.
+    :param source: the path to the file.
+    :param destination: the path to the link, its directory is created if necessary.
+    :return: None.
+    """
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:  # Hard links don't work between file systems.
+        shutil.copyfile(source, destination)
+
+
+def recognize_languages_files(paths: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Recognize the languages of arbitrary files with a single run of Enry. The files are linked
+    into a temporary directory, so the files that Enry skips in directories (hidden, vendored,
+    and documentation files) aren't recognized. The results for the most recent
+    `FILES_CACHE_SIZE` files are memoized by their paths, modification times, and sizes.
+    :param paths: a list of paths to files.
+    :return: dictionary {path: language or None if the language isn't recognized}.
+    """
+    keys = {}
+    for path in paths:
+        if not os.path.isfile(path):
+            raise ValueError("Expected path to file path but got '%s'" % path)
+        stat = os.stat(path)
+        keys[path] = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    results = {}
+    with _files_cache_lock:
+        for path, key in keys.items():
+            if key in _files_cache:
+                _files_cache.move_to_end(key)
+                results[path] = _files_cache[key]
+    missing = {key: path for path, key in keys.items() if path not in results}
+    if missing:
+        languages = {}
+        with TemporaryDirectory() as td:
+            # Every file is in its own directory to keep the original names.
+            links = {}
+            for index, (key, path) in enumerate(missing.items()):
+                link = os.path.join(str(index), os.path.basename(path))
+                link_file(path, os.path.join(td, link))
+                links[link] = key
+            for lang, files in recognize_languages_dir(td).items():
+                for file in files:
+                    if file in links:
+                        languages[links[file]] = lang
+        with _files_cache_lock:
+            for path, key in keys.items():
+                if path not in results:
+                    results[path] = _files_cache[key] = languages.get(key)
+            while len(_files_cache) > FILES_CACHE_SIZE:
+                _files_cache.popitem(last=False)
+    return {path: results[path] for path in paths}
+
+
 def recognize_language_file(file_path: str) -> Dict[str, str]:
     """
     Recognize the language of a file.
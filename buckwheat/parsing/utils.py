@@ -5,7 +5,7 @@ import logging
 import os
 import urllib.request
 
-from tree_sitter import Language, Parser
+from tree_sitter import Language, Parser, Query
 
 from ..language_recognition.utils import identify_system
 
@@ -23,7 +23,9 @@ FILENAMES = {
     "Darwin": "tree-sitter.tar.gz"
 }
 
+LANGUAGES = {}
 PARSERS = {}
+QUERIES = {}
 
 
 def get_tree_sitter_dir() -> str:
@@ -68,6 +70,18 @@ def main() -> None:
     logging.info("Parser successfully initialized.")
 
 
+def get_language(lang: str) -> Language:
+    """
+    Load the tree-sitter language for a specific grammar.
+    :param lang: language to use.
+    :return: language.
+    """
+    global LANGUAGES
+    if lang not in LANGUAGES:
+        LANGUAGES[lang] = Language(get_tree_sitter_so(), lang)
+    return LANGUAGES[lang]
+
+
 def get_parser(lang: str) -> Parser:
     """
     Initialize parser for a specific language.
@@ -77,8 +91,21 @@ def get_parser(lang: str) -> Parser:
     global PARSERS
     if lang not in PARSERS:
         parser = Parser()
-        parser.set_language(Language(get_tree_sitter_so(), lang))
+        parser.set_language(get_language(lang))
         PARSERS[lang] = parser
     else:
         parser = PARSERS[lang]
     return parser
+
+
+def get_query(lang: str, source: str) -> Query:
+    """
+    Compile a query for a specific language. Every query is compiled only once.
+    :param lang: language to use.
+    :param source: the source of the query in the tree-sitter query language.
+    :return: query.
+    """
+    global QUERIES
+    if (lang, source) not in QUERIES:
+        QUERIES[(lang, source)] = get_language(lang).query(source)
+    return QUERIES[(lang, source)]
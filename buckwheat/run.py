@@ -5,10 +5,13 @@ import argparse
 import logging
 import sys
 
+from .cache import MAX_CACHE_SIZE
 from .language_recognition.utils import main as initialize_enry
 from .parsing.utils import main as initialize_parser
-from .tokenizer import tokenize_list_of_repositories
-from .utils import PARSING_MODES, GRANULARITIES, OUTPUT_FORMATS
+from .subtokenizer import TokenParser
+from .tokenizer import CHUNK_SIZE, PREFETCH, PROCESSES, tokenize_list_of_repositories
+from .utils import PARSING_MODES, GRANULARITIES, OUTPUT_FORMATS, COMPRESSIONS, SHARDINGS, \
+    TREE_SITTER_BACKENDS, DECODING_ERRORS
 
 
 def main(args: argparse.Namespace) -> None:
@@ -25,7 +28,20 @@ def main(args: argparse.Namespace) -> None:
                                   gran=args.granularity, languages=args.languages, local=args.local,
                                   output_format=args.format,
                                   identifiers_verbose=args.identifiers_verbose,
-                                  subtokenize=args.subtokenize)
+                                  subtokenize=args.subtokenize, backend=args.backend,
+                                  decoding_errors=args.decoding_errors,
+                                  subtokenizer_cache_size=args.subtokenizer_cache_size,
+                                  workers=args.workers, prefetch=args.prefetch,
+                                  clone_timeout=args.clone_timeout,
+                                  max_clone_size=None if args.max_clone_size is None
+                                  else args.max_clone_size * 1024 * 1024,
+                                  chunk_size=args.chunk_size, cache_dir=args.cache_dir,
+                                  max_cache_size=args.max_cache_size * 1024 * 1024,
+                                  bare=args.bare, compress=args.compress, shards=args.shards,
+                                  shard_by=args.shard_by,
+                                  shard_size=None if args.shard_size is None
+                                  else args.shard_size * 1024 * 1024,
+                                  shard_records=args.shard_records, resume=args.resume)
 
 
 if __name__ == "__main__":
@@ -55,7 +71,9 @@ if __name__ == "__main__":
                              "languages supported in a given parsing granularity.")
     parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS,
                         default="wabbit", help="The output format for saving. "
-                                               "'wabbit' for Vowpal Wabbit, 'json' for JSON.")
+                                               "'wabbit' for Vowpal Wabbit, 'json' for JSON, "
+                                               "'jsonl' for JSON Lines, 'ids' for flat arrays "
+                                               "of token IDs with a shared vocabulary.")
     parser.add_argument("-v", "--identifiers_verbose", action="store_true",
                         help="If passed, all the identifiers will be saved with their coordinates "
                              "(starting byte, starting line, starting column). Doesn't work for "
@@ -64,6 +82,67 @@ if __name__ == "__main__":
                         help="If passed, all the tokens will be split into subtokens by "
                              "camelCase and snake_case, and also stemmed. For the details of "
                              "subtokenization, see subtokenizer.py.")
+    parser.add_argument("--backend", choices=TREE_SITTER_BACKENDS, default="walker",
+                        help="The backend of extracting identifiers, classes, and functions from "
+                             "tree-sitter trees. 'walker' traverses the trees in Python, 'query' "
+                             "runs a single tree-sitter query per file. The results are the same.")
+    parser.add_argument("--decoding_errors", choices=DECODING_ERRORS, default="replace",
+                        help="The handling of identifiers that are not valid UTF-8. 'strict' "
+                             "skips the whole file, 'replace' replaces the invalid bytes with "
+                             "U+FFFD, 'skip' skips only the invalid identifiers.")
+    parser.add_argument("--subtokenizer_cache_size", type=int, default=TokenParser.CACHE_SIZE,
+                        help="The number of the most recent identifiers whose subtokens are "
+                             "cached in every process, 0 to disable the cache. Only matters "
+                             "with -s.")
+    parser.add_argument("-w", "--workers", type=int, default=PROCESSES,
+                        help="The number of processes that parse the files. The files of all the "
+                             "repositories in a batch share one queue. By default, the number "
+                             "of CPUs.")
+    parser.add_argument("--chunk_size", type=int, default=CHUNK_SIZE,
+                        help="The target total size in bytes of the small files that are parsed "
+                             "by a process as one task, 0 to parse every file separately. "
+                             "The default value is 65536.")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH,
+                        help="The number of repositories that are cloned in advance, while the "
+                             "previous ones are parsed. The default value is 2.")
+    parser.add_argument("--clone_timeout", type=float,
+                        help="If passed, the repositories that take longer to clone than this "
+                             "number of seconds are skipped.")
+    parser.add_argument("--max_clone_size", type=int,
+                        help="If passed, the repositories that take more than this number of "
+                             "megabytes on disk are skipped.")
+    parser.add_argument("--cache_dir",
+                        help="If passed, the parsed files are cached in this directory, so the "
+                             "following runs only parse the changed files.")
+    parser.add_argument("--max_cache_size", type=int, default=MAX_CACHE_SIZE // (1024 * 1024),
+                        help="The maximum size of the cache in megabytes, the least recently "
+                             "used files are evicted. The default value is 1024.")
+    parser.add_argument("--bare", action="store_true",
+                        help="If passed, the repositories are cloned without checking out the "
+                             "files, and only the necessary files and the files with ambiguous "
+                             "names are read from Git.")
+    parser.add_argument("--compress", choices=COMPRESSIONS,
+                        help="If passed, the output files are compressed with this codec while "
+                             "they are written: 'gzip', 'bz2', or 'xz'. Not available for the "
+                             "'ids' format.")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="If passed, the output is written concurrently into this number of "
+                             "shard files for all the batches instead of a file per batch, and "
+                             "the files are listed in manifest.json.")
+    parser.add_argument("--shard_by", choices=SHARDINGS, default="round_robin",
+                        help="The assignment of the repositories to the shards: 'round_robin' "
+                             "or 'repository' for the hash of the repository name. "
+                             "The default value is 'round_robin'.")
+    parser.add_argument("--shard_size", type=int,
+                        help="If passed, a shard continues in a new file after its file "
+                             "reaches this size in megabytes before compression.")
+    parser.add_argument("--shard_records", type=int,
+                        help="If passed, a shard continues in a new file after its file "
+                             "reaches this number of bags.")
+    parser.add_argument("--resume", action="store_true",
+                        help="If passed, the batches that were completed by a previous run "
+                             "into the same output directory are skipped, and the rest are "
+                             "tokenized again. Not available with shards.")
     parser.add_argument("--local", action="store_true",
                         help="If passed, switches the tokenization into the local mode, where "
                              "the input list must contain paths to local directories.")
@@ -1,17 +1,36 @@
 """
 Output-related functionality
 """
+from array import array
+import bz2
 from collections import Counter
 import dataclasses
+import gzip
+import hashlib
+import io
 import json
+import lzma
 from operator import itemgetter
 import os
-from typing import Dict, List, Union
+from queue import Queue
+from tempfile import NamedTemporaryFile
+import threading
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, TextIO, Type, \
+    Union
+import zlib
 
-from .utils import IdentifiersTypes, ObjectTypes, FileData, IdentifierData
+from .utils import COMPRESSIONS, IdentifiersTypes, ObjectTypes, FileData, IdentifierData, \
+    ObjectData
 
+# The functions that open the compressed files, by the names of the compressions
+COMPRESSED_OPENERS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+# The name of the file that lists the output files in the output directory
+MANIFEST = "manifest.json"
+# The name of the file that records the completed batches of a run in the output directory
+RUN_MANIFEST = "run.json"
 
-def merge_bags(files: List[FileData]) -> Counter:
+
+def merge_bags(files: Iterable[FileData]) -> Counter:
     """
     Transform sequences of identifiers in FileData objects into Counter objects and merge them.
     :param files: a list of FileData objects.
@@ -19,10 +38,1032 @@ def merge_bags(files: List[FileData]) -> Counter:
     """
     repository_tokens = Counter()
     for file in files:
-        repository_tokens += Counter(file.identifiers)
+        # Merging in place, the identifiers can be either a sequence or a Counter object.
+        repository_tokens.update(file.identifiers)
     return repository_tokens
 
 
+class CompressedOutput:
+    """
+    A text file that is compressed in a background thread. The written text is gathered into
+    large blocks that are passed to the thread through a bounded queue. The compressors of
+    the standard library release the GIL, so the compression runs in parallel with parsing and
+    saving, and the main thread only waits if the compression falls behind.
+    """
+    BLOCK_SIZE = 1024 * 1024  # The size of the blocks in characters.
+    QUEUE_SIZE = 16  # The number of blocks that wait for the compression.
+
+    def __init__(self, path: str, compress: str):
+        """
+        :param path: the path to the compressed file.
+        :param compress: the compression: "gzip", "bz2", or "xz".
+        """
+        self.fout = COMPRESSED_OPENERS[compress](path, "wb")
+        self.queue = Queue(self.QUEUE_SIZE)
+        self.blocks = []  # type: List[str]
+        self.size = 0
+        self.error = None  # type: Optional[Exception]
+        self.thread = threading.Thread(target=self.compress, daemon=True)
+        self.thread.start()
+
+    def compress(self) -> None:
+        """
+        Compress the blocks from the queue until the end of the output, in the thread.
+        :return: None.
+        """
+        while True:
+            block = self.queue.get()
+            if block is None:
+                break
+            if self.error is None:
+                try:
+                    self.fout.write(block)
+                except Exception as error:  # Raised in the main thread.
+                    self.error = error
+
+    def write(self, text: str) -> int:
+        """
+        Write the text to the file.
+        :param text: the text.
+        :return: the number of written characters.
+        """
+        self.blocks.append(text)
+        self.size += len(text)
+        if self.size >= self.BLOCK_SIZE:
+            self.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        """
+        Pass the gathered text to the compression.
+        :return: None.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.blocks:
+            self.queue.put("".join(self.blocks).encode("utf-8"))
+            self.blocks = []
+            self.size = 0
+
+    def close(self) -> None:
+        """
+        Compress the rest of the text and close the file.
+        :return: None.
+        """
+        if self.thread is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.fout.close()
+        if self.error is not None:
+            raise self.error
+
+
+def open_output_file(path: str) -> TextIO:
+    """
+    Open an output file for reading, decompressing it by its extension.
+    :param path: the path to the output file.
+    :return: the file object of the text.
+    """
+    for compress, extension in COMPRESSIONS.items():
+        if path.endswith(extension):
+            return io.TextIOWrapper(COMPRESSED_OPENERS[compress](path, "rb"), encoding="utf-8")
+    return open(path)
+
+
+def get_counter(identifiers: Union[List[str], Counter],
+                identifiers_type: IdentifiersTypes) -> Counter:
+    """
+    Get the counts of tokens, without recounting the ones that were counted by the workers.
+    :param identifiers: a list of tokens or a Counter object of tokens.
+    :param identifiers_type: type of the tokens.
+    :return: a Counter object of tokens and their counts.
+    """
+    if identifiers_type == IdentifiersTypes.COUNTER:
+        return identifiers
+    return Counter(identifiers)
+
+
+def counter_to_wabbit(tokens_counter: Counter) -> str:
+    """
+    Transforms a Counter object into a saving format of Wabbit:
+    "token1:count1, token2:count2..."
+    :param tokens_counter: a Counter object of tokens and their count.
+    :return: string "token1:count1, token2:count2..." sorted by descending count.
+    """
+    sorted_tokens = sorted(tokens_counter.items(), key=itemgetter(1), reverse=True)
+    formatted_tokens = []
+    for token in sorted_tokens:
+        formatted_tokens.append("{token}:{count}"
+                                .format(token=token[0], count=str(token[1])))
+    return " ".join(formatted_tokens)
+
+
+def sequence_to_wabbit(sequence: Union[List[str], List[IdentifierData]],
+                       identifiers_type: IdentifiersTypes) -> str:
+    """
+    Transforms a sequence of tokens and their parameters into a saving format of Wabbit:
+    "token1:parameters token2:parameters...".
+    :param sequence: a list of tokens as either strings or IdentifierData objects.
+    :param identifiers_type: type of the sequence.
+    :return: string "token1:parameters token2:parameters..." sorted as in original code.
+    """
+    if identifiers_type == IdentifiersTypes.STRING:
+        return " ".join(sequence)
+    elif identifiers_type == IdentifiersTypes.VERBOSE:
+        formatted_tokens = []
+        for token in sequence:
+            parameters = ",".join([str(parameter) for parameter in
+                                   [token.start_byte, token.start_line,
+                                    token.start_column]])
+            formatted_tokens.append("{token}:{parameters}".format(token=token.identifier,
+                                                                  parameters=parameters))
+        return " ".join(formatted_tokens)
+
+
+def get_object_name(file: FileData, obj: ObjectData) -> str:
+    """
+    Compose the name of the object from the path to its file and its lines.
+    :param file: the FileData object of the file with the object.
+    :param obj: the ObjectData object.
+    :return: string "path#Lstart-Lend", with lines counted from 1.
+    """
+    return f"{file.path}#L{obj.start_line + 1}-L{obj.end_line + 1}"
+
+
+class OutputWriter:
+    """
+    The base class for saving the bags of tokens into a file incrementally, one repository
+    and one file at a time: start_repository, write_file for every file of the repository,
+    and finish_repository. The output file is only created with the first repository.
+    Only the bags of the current repository are kept in memory, and only for "projects".
+    """
+
+    def __init__(self, mode: str, gran: str, output_dir: str, filename: str,
+                 compress: Optional[str] = None):
+        """
+        :param mode: the mode of parsing. Either "counters" or "sequences".
+        :param gran: granularity of parsing. Values are ["projects", "files", "classes",
+                     "functions"].
+        :param output_dir: full path to the output directory.
+        :param filename: the name of the output file. When run again, overwrites the data.
+        :param compress: if not None, the output file is compressed in a background thread:
+                         "gzip", "bz2", or "xz". The extension of the compression is added
+                         to the name of the file.
+        """
+        self.mode = mode
+        self.gran = gran
+        self.path = os.path.abspath(os.path.join(output_dir, filename))
+        self.compress = compress
+        if compress is not None:
+            self.path += COMPRESSIONS[compress]
+        self.fout = None  # type: Optional[Union[TextIO, CompressedOutput]]
+        self.repository_name = None  # type: Optional[str]
+        self.repository_tokens = Counter()
+        # The statistics of the output: the uncompressed size in bytes, the number of bags
+        # and of repositories.
+        self.size = 0
+        self.records = 0
+        self.repositories = 0
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def start_repository(self, repository_name: str) -> None:
+        """
+        Start saving a new repository.
+        :param repository_name: the name of the repository.
+        :return: None.
+        """
+        if self.fout is None:
+            if self.compress is None:
+                self.fout = open(self.path, "w+")
+            else:
+                self.fout = CompressedOutput(self.path, self.compress)
+            self.open_output()
+        self.repository_name = repository_name
+        self.repository_tokens = Counter()
+        self.repositories += 1
+
+    def write_file(self, file: FileData) -> None:
+        """
+        Save the bags of a file of the current repository.
+        :param file: the FileData object.
+        :return: None.
+        """
+        if self.gran == "projects":
+            # If the granularity is "projects", all identifiers for each project are merged.
+            self.repository_tokens.update(file.identifiers)
+        elif self.gran == "files":
+            self.write_file_bag(file)
+        else:
+            for obj in file.objects:
+                if (self.gran == "functions" and obj.object_type == ObjectTypes.FUNCTION) or \
+                        (self.gran == "classes" and obj.object_type == ObjectTypes.CLASS):
+                    self.write_object_bag(file, obj)
+
+    def finish_repository(self) -> None:
+        """
+        Finish saving the current repository.
+        :return: None.
+        """
+        self.repository_name = None
+        self.repository_tokens = Counter()
+
+    def write_repository(self, repository_name: str, files: Iterable[FileData]) -> None:
+        """
+        Save a whole repository.
+        :param repository_name: the name of the repository.
+        :param files: the FileData objects of the repository.
+        :return: None.
+        """
+        self.start_repository(repository_name)
+        for file in files:
+            self.write_file(file)
+        self.finish_repository()
+
+    def close(self) -> None:
+        """
+        Finish the output file, if it was created.
+        :return: None.
+        """
+        if self.fout is not None:
+            self.close_output()
+            self.fout.close()
+            self.fout = None
+
+    def write(self, text: str) -> None:
+        """
+        Write the text to the output file.
+        :param text: the text.
+        :return: None.
+        """
+        self.fout.write(text)
+        self.size += len(text) if text.isascii() else len(text.encode("utf-8"))
+
+    def get_paths(self) -> List[str]:
+        """
+        Get the paths to all the files of the output.
+        :return: a list of paths, empty if the output wasn't created.
+        """
+        return [self.path] if os.path.exists(self.path) else []
+
+    def open_output(self) -> None:
+        """
+        Write the beginning of the output file.
+        :return: None.
+        """
+        pass
+
+    def close_output(self) -> None:
+        """
+        Write the end of the output file.
+        :return: None.
+        """
+        pass
+
+    def write_file_bag(self, file: FileData) -> None:
+        """
+        Save the bag of a file, by default with the path to the file as its name.
+        :param file: the FileData object.
+        :return: None.
+        """
+        self.write_bag(file.path, file.identifiers, file.identifiers_type)
+
+    def write_object_bag(self, file: FileData, obj: ObjectData) -> None:
+        """
+        Save the bag of an object, by default with the path to its file and its lines as its name.
+        :param file: the FileData object of the file with the object.
+        :param obj: the ObjectData object.
+        :return: None.
+        """
+        self.write_bag(get_object_name(file, obj), obj.identifiers, obj.identifiers_type)
+
+    def write_bag(self, name: str, identifiers: Union[List[str], List[IdentifierData], Counter],
+                  identifiers_type: IdentifiersTypes) -> None:
+        """
+        Save the bag of a file or an object.
+        :param name: the name of the bag.
+        :param identifiers: a list of tokens as either strings or IdentifierData objects,
+                            or a Counter object of tokens that were counted by the workers.
+        :param identifiers_type: type of the tokens.
+        :return: None.
+        """
+        raise NotImplementedError
+
+
+class WabbitWriter(OutputWriter):
+    """
+    Save the bags of tokens in the Vowpal Wabbit format: one bag per line, in the format
+    "name token1:parameters token2:parameters...".
+    """
+
+    def finish_repository(self) -> None:
+        if self.gran == "projects":
+            repository_tokens = counter_to_wabbit(self.repository_tokens)
+            if len(repository_tokens) != 0:  # Skipping empty repositories.
+                self.write("{name} {tokens}\n"
+                           .format(name=self.repository_name, tokens=repository_tokens))
+                self.records += 1
+        super().finish_repository()
+
+    def write_bag(self, name: str, identifiers: Union[List[str], List[IdentifierData], Counter],
+                  identifiers_type: IdentifiersTypes) -> None:
+        if self.mode == "counters":
+            tokens = counter_to_wabbit(get_counter(identifiers, identifiers_type))
+        else:
+            tokens = sequence_to_wabbit(identifiers, identifiers_type)
+        if len(tokens) != 0:  # Skipping empty files and objects.
+            self.write("{name} {tokens}\n".format(name=name, tokens=tokens))
+            self.records += 1
+
+
+class JsonWriter(OutputWriter):
+    """
+    Save the bags of tokens as a JSON file: a dictionary with repositories names as keys and
+    their bags of tokens as values. The bags are also dictionaries with bags' names as keys and
+    sequences of tokens and their parameters as values, or token counters for "projects".
+    The output is the same as dumping the whole dictionary with an indent of 4 spaces.
+    """
+    INDENT = 4
+
+    def __init__(self, mode: str, gran: str, output_dir: str, filename: str,
+                 compress: Optional[str] = None):
+        super().__init__(mode, gran, output_dir, filename, compress)
+        self.repositories_count = 0
+        self.bags_count = 0
+        # The bags of the current file: several objects can share a name.
+        self.file_bags = {}  # type: Dict[str, Any]
+
+    def write_key(self, key: str, level: int, count: int) -> None:
+        """
+        Write the key of an item of a dictionary nested in the output dictionary.
+        :param key: the key of the item.
+        :param level: the level of nesting of the dictionary, 1 for the output dictionary.
+        :param count: the number of items in the dictionary that were already written.
+        :return: None.
+        """
+        if count:
+            self.write(",")
+        self.write("\n" + " " * (self.INDENT * level) + json.dumps(key, ensure_ascii=False)
+                   + ": ")
+
+    def write_item(self, key: str, value: Any, level: int, count: int) -> None:
+        """
+        Write an item of a dictionary nested in the output dictionary.
+        :param key: the key of the item.
+        :param value: the value of the item, serializable to JSON.
+        :param level: the level of nesting of the dictionary, 1 for the output dictionary.
+        :param count: the number of items in the dictionary that were already written.
+        :return: None.
+        """
+        self.write_key(key, level, count)
+        self.write(json.dumps(value, ensure_ascii=False, indent=self.INDENT)
+                   .replace("\n", "\n" + " " * (self.INDENT * level)))
+        self.records += 1
+
+    def open_output(self) -> None:
+        self.write("{")
+
+    def close_output(self) -> None:
+        self.write("\n}" if self.repositories_count else "}")
+
+    def start_repository(self, repository_name: str) -> None:
+        super().start_repository(repository_name)
+        self.bags_count = 0
+        if self.gran != "projects":
+            self.write_key(repository_name, 1, self.repositories_count)
+            self.write("{")
+            self.repositories_count += 1
+
+    def write_file(self, file: FileData) -> None:
+        self.file_bags = {}
+        super().write_file(file)
+        for name, bag in self.file_bags.items():
+            self.write_item(name, bag, 2, self.bags_count)
+            self.bags_count += 1
+        self.file_bags = {}
+
+    def finish_repository(self) -> None:
+        if self.gran == "projects":
+            if len(self.repository_tokens) != 0:  # Skipping empty repositories.
+                self.write_item(self.repository_name, self.repository_tokens, 1,
+                                self.repositories_count)
+                self.repositories_count += 1
+        else:
+            self.write("\n" + " " * self.INDENT + "}" if self.bags_count else "}")
+        super().finish_repository()
+
+    def write_bag(self, name: str, identifiers: Union[List[str], List[IdentifierData], Counter],
+                  identifiers_type: IdentifiersTypes) -> None:
+        if len(identifiers) != 0:  # Skipping empty files and objects.
+            if self.mode == "counters":
+                self.file_bags[name] = get_counter(identifiers, identifiers_type)
+            elif identifiers_type == IdentifiersTypes.STRING:
+                self.file_bags[name] = identifiers
+            elif identifiers_type == IdentifiersTypes.VERBOSE:
+                self.file_bags[name] = [dataclasses.astuple(identifier)
+                                        for identifier in identifiers]
+
+
+class JsonLinesWriter(OutputWriter):
+    """
+    Save the bags of tokens in the JSON Lines format: one compact JSON record per line, written
+    as soon as the bag is produced, so the output can be read and split line by line.
+    Every record has the name of the repository and the name of the bag, the language and
+    the coordinates for files and objects, and either "counts" with token counters
+    or "tokens" with sequences of tokens and their parameters.
+    """
+
+    def write_record(self, record: Dict[str, Any],
+                     identifiers: Union[List[str], List[IdentifierData], Counter],
+                     identifiers_type: IdentifiersTypes) -> None:
+        """
+        Write a record with the bag of tokens, skipping the empty bags.
+        :param record: the fields of the record that describe the bag.
+        :param identifiers: a list of tokens as either strings or IdentifierData objects,
+                            or a Counter object of tokens.
+        :param identifiers_type: type of the tokens.
+        :return: None.
+        """
+        if len(identifiers) == 0:  # Skipping empty repositories, files, and objects.
+            return
+        if self.mode == "counters" or identifiers_type == IdentifiersTypes.COUNTER:
+            record["counts"] = get_counter(identifiers, identifiers_type)
+        elif identifiers_type == IdentifiersTypes.STRING:
+            record["tokens"] = identifiers
+        elif identifiers_type == IdentifiersTypes.VERBOSE:
+            record["tokens"] = [dataclasses.astuple(identifier) for identifier in identifiers]
+        self.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.records += 1
+
+    def finish_repository(self) -> None:
+        if self.gran == "projects":
+            self.write_record({"repository": self.repository_name, "name": self.repository_name},
+                              self.repository_tokens, IdentifiersTypes.COUNTER)
+        super().finish_repository()
+
+    def write_file_bag(self, file: FileData) -> None:
+        self.write_record({"repository": self.repository_name, "name": file.path,
+                           "lang": file.lang}, file.identifiers, file.identifiers_type)
+
+    def write_object_bag(self, file: FileData, obj: ObjectData) -> None:
+        self.write_record({"repository": self.repository_name,
+                           "name": get_object_name(file, obj), "lang": obj.lang,
+                           "type": obj.object_type.value,
+                           "start": [obj.start_byte, obj.start_line, obj.start_column],
+                           "end": [obj.end_byte, obj.end_line, obj.end_column]},
+                          obj.identifiers, obj.identifiers_type)
+
+
+class TokenIdsWriter(JsonLinesWriter):
+    """
+    Save the bags of tokens as flat arrays of token IDs that can be opened with `np.memmap`.
+    The tokens are numbered in the vocabulary that is shared by all the output files in the
+    directory: "vocabulary.txt" with one token per line, the ID of a token is its line number
+    counting from 0. For every output file "name.txt", the arrays in native byte order are:
+    - "name.ids": int32 token IDs of all the bags, concatenated;
+    - "name.offsets": int64 offsets of the bags in "name.ids", with the final offset;
+    - "name.counts": int32 counts of the tokens for "counters" and "projects";
+    - "name.coordinates": int64 starting byte, line, and column of every token, for the
+      verbose sequences.
+    The output file itself is the index of the bags: one JSON record per line, the same as in
+    the JSON Lines format but without the tokens. See load_token_ids.
+    The arrays are memory-mapped by the readers, so this format isn't compressed.
+    """
+    VOCABULARY = "vocabulary.txt"
+
+    def __init__(self, mode: str, gran: str, output_dir: str, filename: str,
+                 compress: Optional[str] = None, vocabulary: Optional["Vocabulary"] = None):
+        """
+        :param vocabulary: if not None, the vocabulary that is shared with other writers that
+                           are open at the same time, they close it. Otherwise, the writer opens
+                           the vocabulary of the output directory by itself.
+        """
+        if compress is not None:
+            raise ValueError("The arrays of token IDs can't be compressed.")
+        super().__init__(mode, gran, output_dir, filename)
+        self.prefix = os.path.splitext(self.path)[0]
+        self.own_vocabulary = vocabulary is None
+        if vocabulary is None:
+            vocabulary = Vocabulary(os.path.join(os.path.dirname(self.path), self.VOCABULARY))
+        self.vocabulary = vocabulary
+        self.arrays = {}  # type: Dict[str, BinaryIO]
+        self.offset = 0
+
+    def get_array(self, name: str) -> BinaryIO:
+        """
+        Get the file of an array, creating it if necessary.
+        :param name: the name of the array: "ids", "offsets", "counts", or "coordinates".
+        :return: the binary file opened for writing.
+        """
+        if name not in self.arrays:
+            self.arrays[name] = open(f"{self.prefix}.{name}", "wb")
+        return self.arrays[name]
+
+    def get_paths(self) -> List[str]:
+        return super().get_paths() + [f"{self.prefix}.{name}" for name in
+                                      ["ids", "offsets", "counts", "coordinates"]
+                                      if os.path.exists(f"{self.prefix}.{name}")]
+
+    def write_array(self, name: str, values: array) -> None:
+        """
+        Append the values to an array, counting their bytes in the size of the output.
+        :param name: the name of the array: "ids", "offsets", "counts", or "coordinates".
+        :param values: the values of the array.
+        :return: None.
+        """
+        values.tofile(self.get_array(name))
+        self.size += len(values) * values.itemsize
+
+    def open_output(self) -> None:
+        self.write_array("offsets", array("q", [0]))
+        self.get_array("ids")
+
+    def close_output(self) -> None:
+        for fout in self.arrays.values():
+            fout.close()
+        self.arrays = {}
+        if self.own_vocabulary:
+            self.vocabulary.close()
+
+    def write_record(self, record: Dict[str, Any],
+                     identifiers: Union[List[str], List[IdentifierData], Counter],
+                     identifiers_type: IdentifiersTypes) -> None:
+        if len(identifiers) == 0:  # Skipping empty repositories, files, and objects.
+            return
+        if self.mode == "counters" or self.gran == "projects":
+            counter = get_counter(identifiers, identifiers_type)
+            tokens = list(counter.keys())
+            self.write_array("counts", array("i", counter.values()))
+        elif identifiers_type == IdentifiersTypes.VERBOSE:
+            tokens = [identifier.identifier for identifier in identifiers]
+            self.write_array("coordinates", array(
+                "q", [coordinate for identifier in identifiers for coordinate in
+                      (identifier.start_byte, identifier.start_line, identifier.start_column)]))
+        else:
+            tokens = identifiers
+        self.write_array("ids", array("i", [self.vocabulary.get_id(token) for token in tokens]))
+        self.offset += len(tokens)
+        self.write_array("offsets", array("q", [self.offset]))
+        self.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.records += 1
+
+
+class Vocabulary:
+    """
+    The vocabulary of token IDs in a file, one token per line. The new tokens are appended to
+    the file as they appear.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: the path to the vocabulary file, it is created with the first token.
+        """
+        self.path = path
+        self.ids = load_vocabulary(path)
+        self.fout = None  # type: Optional[TextIO]
+        self.lock = threading.Lock()
+
+    def get_id(self, token: str) -> int:
+        """
+        Get the ID of a token, adding the new tokens to the vocabulary.
+        :param token: the token.
+        :return: the ID of the token.
+        """
+        token_id = self.ids.get(token)
+        if token_id is None:
+            # The vocabulary can be shared by the threads of the shards.
+            with self.lock:
+                token_id = self.ids.get(token)
+                if token_id is None:
+                    if self.fout is None:
+                        self.fout = open(self.path, "a", newline="\n")
+                    token_id = self.ids[token] = len(self.ids)
+                    self.fout.write(token + "\n")
+        return token_id
+
+    def close(self) -> None:
+        """
+        Close the vocabulary file, if it was opened.
+        :return: None.
+        """
+        if self.fout is not None:
+            self.fout.close()
+            self.fout = None
+
+
+def load_vocabulary(path: str) -> Dict[str, int]:
+    """
+    Read the vocabulary of token IDs.
+    :param path: the path to the vocabulary file, one token per line.
+    :return: a dictionary with tokens as keys and their IDs as values, empty if there's no file.
+    """
+    if not os.path.exists(path):
+        return {}
+    # Only "\n" separates the tokens, other line breaks can be parts of them.
+    with open(path, newline="\n") as fin:
+        return {token[:-1]: token_id for token_id, token in enumerate(fin)}
+
+
+def load_token_ids(path: str) -> Dict[str, Any]:
+    """
+    Open an output file of the "ids" format without reading the arrays into memory.
+    Requires NumPy.
+    :param path: the path to the output file, the index of the bags.
+    :return: a dictionary with the memory-mapped arrays "ids", "offsets", and, if present,
+             "counts" and "coordinates" of the shape (number of tokens, 3), the list of the
+             records of the bags "index", and the list of tokens "vocabulary".
+    """
+    import numpy as np
+
+    prefix = os.path.splitext(path)[0]
+    data = {}
+    for name, dtype in [("ids", np.int32), ("offsets", np.int64), ("counts", np.int32),
+                        ("coordinates", np.int64)]:
+        if os.path.exists(f"{prefix}.{name}"):
+            if os.path.getsize(f"{prefix}.{name}") == 0:  # Memory maps can't be empty.
+                data[name] = np.zeros(0, dtype=dtype)
+            else:
+                data[name] = np.memmap(f"{prefix}.{name}", dtype=dtype, mode="r")
+    if "coordinates" in data:
+        data["coordinates"] = data["coordinates"].reshape(-1, 3)
+    with open(path) as fin:
+        data["index"] = [json.loads(line) for line in fin]
+    data["vocabulary"] = list(load_vocabulary(os.path.join(os.path.dirname(path),
+                                                           TokenIdsWriter.VOCABULARY)))
+    return data
+
+
+# The writers corresponding to the output formats.
+OUTPUT_WRITERS = {"wabbit": WabbitWriter,
+                  "json": JsonWriter,
+                  "jsonl": JsonLinesWriter,
+                  "ids": TokenIdsWriter}
+
+
+def write_json_atomically(path: str, data: Any) -> None:
+    """
+    Write a JSON file so that it is replaced atomically: the readers and the interrupted runs
+    see either the old file or the new one.
+    :param path: the path to the file.
+    :param data: the data, serializable to JSON.
+    :return: None.
+    """
+    with NamedTemporaryFile("w", dir=os.path.dirname(path), delete=False) as fout:
+        json.dump(data, fout, ensure_ascii=False, indent=4)
+    os.replace(fout.name, path)
+
+
+def get_checksum(path: str, block_size: int = 2 ** 20) -> str:
+    """
+    Calculate the SHA-256 checksum of a file without reading it into memory.
+    :param path: the path to the file.
+    :param block_size: the size of the blocks that are read in bytes.
+    :return: the hexadecimal digest.
+    """
+    checksum = hashlib.sha256()
+    with open(path, "rb") as fin:
+        for block in iter(lambda: fin.read(block_size), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+class RunManifest:
+    """
+    The manifest of a tokenization run in the output directory that records the completed
+    batches: their repositories with the commits and their output files with the checksums.
+    It is rewritten atomically after every batch, so an interrupted run can be resumed,
+    skipping the batches whose output files are intact.
+    """
+
+    def __init__(self, output_dir: str, parameters: Dict[str, Any], resume: bool = False,
+                 vocabulary: Optional[str] = None):
+        """
+        :param output_dir: full path to the output directory.
+        :param parameters: the parameters of the run that change the output, the resumed run
+                           must have the same parameters.
+        :param resume: if True, the completed batches are read from the existing manifest,
+                       otherwise the manifest and the vocabulary are started anew.
+        :param vocabulary: if not None, the path to the vocabulary file that is shared by the
+                           batches. When resuming, the tokens added after the last completed
+                           batch are removed from it, all of them if there is no manifest.
+        """
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, RUN_MANIFEST)
+        self.parameters = parameters
+        self.vocabulary = vocabulary
+        self.vocabulary_size = 0
+        self.batches = {}  # type: Dict[str, Dict[str, Any]]
+        if resume and os.path.exists(self.path):
+            with open(self.path) as fin:
+                manifest = json.load(fin)
+            if manifest["parameters"] != parameters:
+                raise ValueError("The parameters of the run don't match the manifest.")
+            self.batches = manifest["batches"]
+            self.vocabulary_size = manifest["vocabulary_size"]
+        # Only the tokens of the completed batches are kept: none for a new run or for a run
+        # that was interrupted before its first batch was completed, without a manifest.
+        if vocabulary is not None and os.path.exists(vocabulary) and \
+                os.path.getsize(vocabulary) > self.vocabulary_size:
+            os.truncate(vocabulary, self.vocabulary_size)
+
+    def is_completed(self, count_batch: int, repositories: List[str]) -> bool:
+        """
+        Check that a batch was completed and its output files weren't changed since then.
+        :param count_batch: the index of the batch.
+        :param repositories: the list of repositories in the batch.
+        :return: True if the batch can be skipped.
+        """
+        batch = self.batches.get(str(count_batch))
+        if batch is None or batch["repositories"] != repositories:
+            return False
+        for file in batch["files"]:
+            path = os.path.join(self.output_dir, file["path"])
+            if not os.path.exists(path) or os.path.getsize(path) != file["bytes"] or \
+                    get_checksum(path) != file["sha256"]:
+                return False
+        return True
+
+    def add_batch(self, count_batch: int, repositories: List[str],
+                  tokenized: List[Dict[str, Optional[str]]], paths: List[str]) -> None:
+        """
+        Record a completed batch and rewrite the manifest.
+        :param count_batch: the index of the batch.
+        :param repositories: the list of repositories in the batch.
+        :param tokenized: the tokenized repositories as dictionaries with the names of the
+                          repositories and their commits.
+        :param paths: the paths to the output files of the batch.
+        :return: None.
+        """
+        self.batches[str(count_batch)] = {
+            "repositories": repositories, "tokenized": tokenized,
+            "files": [{"path": os.path.relpath(path, self.output_dir),
+                       "bytes": os.path.getsize(path), "sha256": get_checksum(path)}
+                      for path in paths]}
+        if self.vocabulary is not None and os.path.exists(self.vocabulary):
+            self.vocabulary_size = os.path.getsize(self.vocabulary)
+        write_json_atomically(self.path, {"parameters": self.parameters,
+                                          "vocabulary_size": self.vocabulary_size,
+                                          "batches": self.batches})
+
+
+class ShardOutput:
+    """
+    A shard of ShardedWriter that is written in its own thread. The repositories of the shard
+    are passed to the thread file by file through a bounded queue, so the shards are written
+    in parallel with each other and with parsing, and the calling thread only waits if the
+    shard falls behind. When a file of the shard reaches the target size or number of records,
+    it is closed and the shard continues in a new file.
+    """
+    QUEUE_SIZE = 256  # The number of files that wait for writing.
+
+    def __init__(self, sharded_writer: "ShardedWriter", shard: int):
+        """
+        :param sharded_writer: the ShardedWriter with the parameters of the files.
+        :param shard: the index of the shard.
+        """
+        self.sharded_writer = sharded_writer
+        self.shard = shard
+        self.writer = None  # type: Optional[OutputWriter]
+        self.part = 0
+        # The closed files of the shard, see ShardedWriter.close.
+        self.files = []  # type: List[Dict[str, Any]]
+        self.queue = Queue(self.QUEUE_SIZE)
+        self.error = None  # type: Optional[Exception]
+        self.thread = threading.Thread(target=self.write, daemon=True)
+        self.thread.start()
+
+    def write(self) -> None:
+        """
+        Run the tasks from the queue until the shard is closed, in the thread.
+        :return: None.
+        """
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+            if self.error is None:
+                function, arguments = task
+                try:
+                    function(*arguments)
+                except Exception as error:  # Raised in the calling thread.
+                    self.error = error
+
+    def put(self, function: Callable, *arguments: Any) -> None:
+        """
+        Pass a task to the thread of the shard.
+        :param function: the function that is called in the thread.
+        :param arguments: the arguments of the function.
+        :return: None.
+        """
+        if self.error is not None:
+            raise self.error
+        self.queue.put((function, arguments))
+
+    def start_repository(self, repository_name: str) -> None:
+        """
+        Start saving a new repository, opening a new file if necessary, in the thread.
+        :param repository_name: the name of the repository.
+        :return: None.
+        """
+        if self.writer is None:
+            sharded_writer = self.sharded_writer
+            filename = f"{sharded_writer.prefix}_shard{self.shard}_{self.part}.txt"
+            kwargs = {} if sharded_writer.vocabulary is None else \
+                {"vocabulary": sharded_writer.vocabulary}
+            self.writer = sharded_writer.writer_class(sharded_writer.mode, sharded_writer.gran,
+                                                      sharded_writer.output_dir, filename,
+                                                      sharded_writer.compress, **kwargs)
+        self.writer.start_repository(repository_name)
+
+    def write_file(self, file: FileData) -> None:
+        """
+        Save the bags of a file of the current repository, in the thread.
+        :param file: the FileData object.
+        :return: None.
+        """
+        self.writer.write_file(file)
+
+    def finish_repository(self) -> None:
+        """
+        Finish saving the current repository, and close the file if it reached the target size,
+        in the thread.
+        :return: None.
+        """
+        self.writer.finish_repository()
+        shard_size = self.sharded_writer.shard_size
+        shard_records = self.sharded_writer.shard_records
+        if (shard_size is not None and self.writer.size >= shard_size) or \
+                (shard_records is not None and self.writer.records >= shard_records):
+            self.close_file()
+
+    def close_file(self) -> None:
+        """
+        Close the current file of the shard and add it to the files of the shard.
+        :return: None.
+        """
+        writer = self.writer
+        self.writer = None
+        writer.close()
+        paths = writer.get_paths()
+        if paths:
+            self.files.append({"path": os.path.basename(writer.path), "shard": self.shard,
+                               "part": self.part, "repositories": writer.repositories,
+                               "records": writer.records,
+                               "bytes": sum(os.path.getsize(path) for path in paths)})
+        self.part += 1
+
+    def close(self) -> None:
+        """
+        Write the rest of the tasks, stop the thread, and close the current file.
+        :return: None.
+        """
+        if self.thread is None:
+            return
+        try:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        finally:
+            if self.writer is not None:
+                self.close_file()
+        if self.error is not None:
+            raise self.error
+
+
+class ShardedWriter:
+    """
+    Save the bags of tokens into several shard files that are written concurrently, with the
+    same interface as OutputWriter. Every repository goes to a single shard: in turn or by the
+    hash of its name. Each shard is written by its own thread (see ShardOutput) that takes the
+    files of its repositories from a bounded queue, so the calling thread only hands the files
+    over. When a shard file reaches the target size or number of records, it is closed and the
+    shard continues in a new file, so the files are evenly sized. For the token IDs, the
+    shards share the vocabulary, and the tokens are numbered in the order the threads meet them.
+    After closing, the manifest in the output directory lists all the files with their numbers
+    of repositories and records and their sizes in bytes.
+    """
+
+    def __init__(self, writer_class: Type[OutputWriter], mode: str, gran: str, output_dir: str,
+                 prefix: str, shards: int, shard_by: str = "round_robin",
+                 shard_size: Optional[int] = None, shard_records: Optional[int] = None,
+                 compress: Optional[str] = None):
+        """
+        :param writer_class: the class of the writers of the output format.
+        :param mode: the mode of parsing. Either "counters" or "sequences".
+        :param gran: granularity of parsing. Values are ["projects", "files", "classes",
+                     "functions"].
+        :param output_dir: full path to the output directory.
+        :param prefix: the beginning of the names of the files: "prefix_shard{shard}_{part}.txt".
+        :param shards: the number of shard files that are written at the same time.
+        :param shard_by: the assignment of the repositories to the shards: "round_robin" or
+                         "repository" for the hash of the name of the repository.
+        :param shard_size: if not None, the target size of the files in bytes before
+                           compression, for the token IDs including their arrays.
+        :param shard_records: if not None, the target number of records (bags) in the files.
+        :param compress: if not None, the compression of the files: "gzip", "bz2", or "xz".
+        """
+        self.writer_class = writer_class
+        self.mode = mode
+        self.gran = gran
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.shards = shards
+        self.shard_by = shard_by
+        self.shard_size = shard_size
+        self.shard_records = shard_records
+        self.compress = compress
+        self.repositories = 0
+        self.shard = None  # type: Optional[int]
+        self.vocabulary = None  # type: Optional[Vocabulary]
+        if issubclass(writer_class, TokenIdsWriter):
+            # The shards share the numbering of the tokens.
+            self.vocabulary = Vocabulary(os.path.join(output_dir, TokenIdsWriter.VOCABULARY))
+        self.outputs = [ShardOutput(self, shard) for shard in range(shards)]
+
+    def __enter__(self) -> "ShardedWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def get_shard(self, repository_name: str) -> int:
+        """
+        Choose the shard of a repository.
+        :param repository_name: the name of the repository.
+        :return: the index of the shard.
+        """
+        if self.shard_by == "repository":
+            return zlib.crc32(repository_name.encode("utf-8")) % self.shards
+        return self.repositories % self.shards
+
+    def start_repository(self, repository_name: str) -> None:
+        """
+        Start saving a new repository into its shard.
+        :param repository_name: the name of the repository.
+        :return: None.
+        """
+        self.shard = self.get_shard(repository_name)
+        self.repositories += 1
+        output = self.outputs[self.shard]
+        output.put(output.start_repository, repository_name)
+
+    def write_file(self, file: FileData) -> None:
+        """
+        Pass the bags of a file of the current repository to its shard.
+        :param file: the FileData object, it must not be changed afterwards.
+        :return: None.
+        """
+        output = self.outputs[self.shard]
+        output.put(output.write_file, file)
+
+    def finish_repository(self) -> None:
+        """
+        Finish saving the current repository. Its shard starts a new file if the file reached
+        the target size.
+        :return: None.
+        """
+        output = self.outputs[self.shard]
+        output.put(output.finish_repository)
+        self.shard = None
+
+    def write_repository(self, repository_name: str, files: Iterable[FileData]) -> None:
+        """
+        Save a whole repository.
+        :param repository_name: the name of the repository.
+        :param files: the FileData objects of the repository.
+        :return: None.
+        """
+        self.start_repository(repository_name)
+        for file in files:
+            self.write_file(file)
+        self.finish_repository()
+
+    def close(self) -> None:
+        """
+        Wait for the shards, close all the shard files and write the manifest.
+        :return: None.
+        """
+        try:
+            for output in self.outputs:
+                output.close()
+        finally:
+            if self.vocabulary is not None:
+                self.vocabulary.close()
+        files = [file for output in self.outputs for file in output.files]
+        write_json_atomically(os.path.join(self.output_dir, MANIFEST),
+                              {"mode": self.mode, "gran": self.gran, "compress": self.compress,
+                               "files": files})
+
+
 class OutputFormats:
     def __init__(self, output_format: str,
                  reps2files: Dict[str, List[FileData]],
@@ -31,6 +1072,10 @@ class OutputFormats:
             self.save_wabbit(reps2files, mode, gran, output_dir, filename)
         elif output_format == "json":
             self.save_json(reps2files, mode, gran, output_dir, filename)
+        elif output_format == "jsonl":
+            self.save_jsonl(reps2files, mode, gran, output_dir, filename)
+        elif output_format == "ids":
+            self.save_ids(reps2files, mode, gran, output_dir, filename)
 
     @classmethod
     def save_wabbit(cls, reps2files: Dict[str, List[FileData]], mode: str, gran: str,
@@ -47,81 +1092,9 @@ class OutputFormats:
         :param filename: the name of the output file.
         :return: none.
         """
-
-        def counter_to_wabbit(tokens_counter: Counter) -> str:
-            """
-            Transforms a Counter object into a saving format of Wabbit:
-            "token1:count1, token2:count2..."
-            :param tokens_counter: a Counter object of tokens and their count.
-            :return: string "token1:count1, token2:count2..." sorted by descending count.
-            """
-            sorted_tokens = sorted(tokens_counter.items(), key=itemgetter(1), reverse=True)
-            formatted_tokens = []
-            for token in sorted_tokens:
-                formatted_tokens.append("{token}:{count}"
-                                        .format(token=token[0], count=str(token[1])))
-            return " ".join(formatted_tokens)
-
-        def sequence_to_wabbit(sequence: Union[List[str], List[IdentifierData]],
-                               identifiers_type: IdentifiersTypes) -> str:
-            """
-            Transforms a sequence of tokens and their parameters into a saving format of Wabbit:
-            "token1:parameters token2:parameters...".
-            :param sequence: a list of tokens as either strings or IdentifierData objects.
-            :param identifiers_type: type of the sequence.
-            :return: string "token1:parameters token2:parameters..." sorted as in original code.
-            """
-            if identifiers_type == IdentifiersTypes.STRING:
-                return " ".join(sequence)
-            elif identifiers_type == IdentifiersTypes.VERBOSE:
-                formatted_tokens = []
-                for token in sequence:
-                    parameters = ",".join([str(parameter) for parameter in
-                                           [token.start_byte, token.start_line,
-                                            token.start_column]])
-                    formatted_tokens.append("{token}:{parameters}".format(token=token.identifier,
-                                                                          parameters=parameters))
-                return " ".join(formatted_tokens)
-
-        with open(os.path.abspath(os.path.join(output_dir, filename)), "w+") as fout:
-            if gran == "projects":
-                # If the granularity is "projects", all identifiers for each project are merged.
-                for repository_name in reps2files.keys():
-                    repository_tokens = counter_to_wabbit(merge_bags(reps2files[repository_name]))
-                    if len(repository_tokens) != 0:  # Skipping empty repositories.
-                        fout.write("{name} {tokens}\n"
-                                   .format(name=repository_name,
-                                           tokens=repository_tokens))
-            elif gran == "files":
-                for repository_name in reps2files.values():
-                    for file in repository_name:
-                        if mode == "counters":
-                            file_tokens = counter_to_wabbit(Counter(file.identifiers))
-                        else:
-                            file_tokens = sequence_to_wabbit(file.identifiers,
-                                                             file.identifiers_type)
-                        if len(file_tokens) != 0:  # Skipping empty files.
-                            fout.write("{name} {tokens}\n"
-                                       .format(name=file.path,
-                                               tokens=file_tokens))
-            else:
-                for repository_name in reps2files.values():
-                    for file in repository_name:
-                        for obj in file.objects:
-                            if (gran == "functions" and
-                                obj.object_type == ObjectTypes.FUNCTION) or \
-                                    (gran == "classes" and obj.object_type == ObjectTypes.CLASS):
-                                if mode == "counters":
-                                    object_tokens = counter_to_wabbit(Counter(obj.identifiers))
-                                else:
-                                    object_tokens = sequence_to_wabbit(obj.identifiers,
-                                                                       obj.identifiers_type)
-                                if len(object_tokens) != 0:  # Skipping empty objects.
-                                    fout.write("{name} {tokens}\n"
-                                               .format(name=f"{file.path}"
-                                                            f"#L{obj.start_line + 1}-"
-                                                            f"L{obj.end_line + 1}",
-                                                       tokens=object_tokens))
+        with WabbitWriter(mode, gran, output_dir, filename) as writer:
+            for repository_name, files in reps2files.items():
+                writer.write_repository(repository_name, files)
 
     @classmethod
     def save_json(cls, reps2files: Dict[str, List[FileData]], mode: str, gran: str,
@@ -138,51 +1111,42 @@ class OutputFormats:
         :param filename: the name of the output file.
         :return: none.
         """
-        res = {}
-        with open(os.path.abspath(os.path.join(output_dir, filename)), "w+") as fout:
-            if gran == "projects":
-                for repository_name in reps2files.keys():
-                    repository_tokens = merge_bags(reps2files[repository_name])
-                    if len(repository_tokens) != 0:  # Skipping empty repositories.
-                        res[repository_name] = repository_tokens
-            elif gran == "files":
-                for repository_name in reps2files.keys():
-                    res[repository_name] = {}
-                    for file in reps2files[repository_name]:
-                        if len(file.identifiers) != 0:  # Skipping empty files.
-                            if mode == "counters":
-                                res[repository_name][file.path] = Counter(file.identifiers)
-                            else:
-                                if file.identifiers_type == IdentifiersTypes.STRING:
-                                    res[repository_name][file.path] = file.identifiers
-                                elif file.identifiers_type == IdentifiersTypes.VERBOSE:
-                                    tokens = []
-                                    for identifier in file.identifiers:
-                                        tokens.append(dataclasses.astuple(identifier))
-                                    res[repository_name][file.path] = tokens
-            else:
-                for repository_name in reps2files.keys():
-                    res[repository_name] = {}
-                    for file in reps2files[repository_name]:
-                        for obj in file.objects:
-                            if len(obj.identifiers) != 0:  # Skipping empty objects.
-                                if (gran == "functions" and obj.object_type == ObjectTypes
-                                        .FUNCTION) or (gran == "classes" and
-                                                       obj.object_type == ObjectTypes.CLASS):
-                                    if mode == "counters":
-                                        res[repository_name][
-                                            f"{file.path}#L{obj.start_line + 1}-"
-                                            f"L{obj.end_line + 1}"] = Counter(obj.identifiers)
-                                    else:
-                                        if obj.identifiers_type == IdentifiersTypes.STRING:
-                                            res[repository_name][
-                                                f"{file.path}#L{obj.start_line + 1}-"
-                                                f"L{obj.end_line + 1}"] = obj.identifiers
-                                        elif obj.identifiers_type == IdentifiersTypes.VERBOSE:
-                                            tokens = []
-                                            for identifier in obj.identifiers:
-                                                tokens.append(dataclasses.astuple(identifier))
-                                            res[repository_name][
-                                                f"{file.path}#L{obj.start_line + 1}-"
-                                                f"L{obj.end_line + 1}"] = tokens
-            json.dump(res, fout, ensure_ascii=False, indent=4)
+        with JsonWriter(mode, gran, output_dir, filename) as writer:
+            for repository_name, files in reps2files.items():
+                writer.write_repository(repository_name, files)
+
+    @classmethod
+    def save_jsonl(cls, reps2files: Dict[str, List[FileData]], mode: str, gran: str,
+                   output_dir: str, filename: str) -> None:
+        """
+        Save the bags of tokens in the JSON Lines format: one record per line.
+        :param reps2files: a dictionary with repositories names as keys and the lists of
+                           FileData objects as values.
+        :param mode: the mode of parsing. Either "counters" or "sequences".
+        :param gran: granularity of parsing. Values are ["projects", "files", "classes",
+                     "functions"].
+        :param output_dir: full path to the output directory.
+        :param filename: the name of the output file.
+        :return: none.
+        """
+        with JsonLinesWriter(mode, gran, output_dir, filename) as writer:
+            for repository_name, files in reps2files.items():
+                writer.write_repository(repository_name, files)
+
+    @classmethod
+    def save_ids(cls, reps2files: Dict[str, List[FileData]], mode: str, gran: str,
+                 output_dir: str, filename: str) -> None:
+        """
+        Save the bags of tokens as flat arrays of token IDs with a shared vocabulary.
+        :param reps2files: a dictionary with repositories names as keys and the lists of
+                           FileData objects as values.
+        :param mode: the mode of parsing. Either "counters" or "sequences".
+        :param gran: granularity of parsing. Values are ["projects", "files", "classes",
+                     "functions"].
+        :param output_dir: full path to the output directory.
+        :param filename: the name of the output file, the index of the bags.
+        :return: none.
+        """
+        with TokenIdsWriter(mode, gran, output_dir, filename) as writer:
+            for repository_name, files in reps2files.items():
+                writer.write_repository(repository_name, files)
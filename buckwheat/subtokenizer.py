@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License
 
+from collections import namedtuple, OrderedDict
 from enum import Enum
 import functools
 import re
@@ -27,6 +28,9 @@ class TokenStyle(Enum):
     TOKEN_CAPITALIZED = 4
 
 
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
 class TokenParser:
     """
     Common utilities for splitting and stemming tokens.
@@ -39,6 +43,14 @@ class TokenParser:
     # NAME_BREAKUP_KEEP_DELIMITERS_RE.split(token) -> ['Var', '_', 'WithStrangeNAMING', '__',
     #                                                  'very', '_', 'strange']
     # NAME_BREAKUP_RE.split(token) -> ['Var', 'WithStrangeNAMING', 'very', 'strange']
+    # Regexps to find the parts of identifiers split by delimiters and by case in one pass,
+    # with and without attaching the last of several uppercase letters to the next part.
+    NAME_PARTS_ATTACH_UPPER_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+")
+    NAME_PARTS_RE = re.compile(r"[A-Z][a-z]+|[A-Z]+|[a-z]+")
+    # Example:
+    # token = "Var_WithStrangeNAMING__very_strange"
+    # NAME_PARTS_ATTACH_UPPER_RE.findall(token) -> ['Var', 'With', 'Strange', 'NAMING', 'very',
+    #                                               'strange']
     STEM_THRESHOLD = 6  # We do not stem split parts shorter than or equal to this size.
     MAX_TOKEN_LENGTH = 256  # We cut identifiers longer than this value.
     MIN_SPLIT_LENGTH = 3  # We do not split source code identifiers shorter than this value.
@@ -52,10 +64,13 @@ class TokenParser:
 
     # the next token. Example: 'HTMLResponse' -> ["html", "response"] if True,
     # 'HTMLResponse' -> ["htmlr", "esponse"] if False.
+    CACHE_SIZE = 2 ** 16  # The number of the most recent tokens whose subtokens are memoized.
+    # Identifiers in code follow Zipf's law, so most of them are processed from the cache.
 
     def __init__(self, stem_threshold=STEM_THRESHOLD, max_token_length=MAX_TOKEN_LENGTH,
                  min_split_length=MIN_SPLIT_LENGTH, single_shot=DEFAULT_SINGLE_SHOT,
-                 save_token_style=SAVE_TOKEN_STYLE, attach_upper=ATTACH_UPPER):
+                 save_token_style=SAVE_TOKEN_STYLE, attach_upper=ATTACH_UPPER,
+                 cache_size=CACHE_SIZE):
         self._stemmer = Stemmer.Stemmer("english")
         self._stemmer.maxCacheSize = 0
         self._stem_threshold = stem_threshold
@@ -66,6 +81,10 @@ class TokenParser:
         self._attach_upper = attach_upper
         if self._save_token_style and not self._single_shot:
             raise ValueError("Only one of `single_shot`/`save_token_style` should be True")
+        self._cache = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self.cache_size = cache_size
 
     @property
     def stem_threshold(self):
@@ -78,6 +97,7 @@ class TokenParser:
         if value < 1:
             raise ValueError("stem_threshold must be greater than 0 - got %d" % value)
         self._stem_threshold = value
+        self.clear_cache()
 
     @property
     def max_token_length(self):
@@ -90,6 +110,7 @@ class TokenParser:
         if value < 1:
             raise ValueError("max_token_length must be greater than 0 - got %d" % value)
         self._max_token_length = value
+        self.clear_cache()
 
     @property
     def min_split_length(self):
@@ -102,13 +123,108 @@ class TokenParser:
         if value < 1:
             raise ValueError("min_split_length must be greater than 0 - got %d" % value)
         self._min_split_length = value
+        self.clear_cache()
+
+    @property
+    def cache_size(self):
+        return self._cache_size
+
+    @cache_size.setter
+    def cache_size(self, value):
+        if not isinstance(value, int):
+            raise TypeError("cache_size must be an integer - got %s" % type(value))
+        if value < 0:
+            raise ValueError("cache_size must be non-negative - got %d" % value)
+        self._cache_size = value
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def cache_info(self):
+        return CacheInfo(self._cache_hits, self._cache_misses, self._cache_size, len(self._cache))
+
+    def clear_cache(self):
+        self._cache.clear()
+        self._cache_hits = 0
+        self._cache_misses = 0
 
     def __call__(self, token):
         return self.process_token(token)
 
     def process_token(self, token):
-        for word in self.split(token):
-            yield self.stem(word)
+        return iter(self.subtokenize(token))
+
+    def subtokenize(self, token):
+        """
+        Split and stem the token. The results for the most recent `cache_size` tokens are kept,
+        so the repeated tokens are not processed again.
+        :param token: the token to process.
+        :return: a tuple of subtokens.
+        """
+        return self.subtokenize_with_offsets(token)[0]
+
+    def subtokenize_with_offsets(self, token):
+        """
+        Split and stem the token, keeping the offsets of the subtokens, see split_with_offsets.
+        :param token: the token to process.
+        :return: a tuple of subtokens and a tuple of their offsets in the token.
+        """
+        result = self._get_cached(token)
+        if result is None:
+            words = list(self._split_with_offsets(token))
+            result = (tuple(self.stem(word) for word, _ in words),
+                      tuple(offset for _, offset in words))
+            self._set_cached(token, result)
+        return result
+
+    def process_tokens(self, tokens, offsets=False):
+        """
+        Split and stem a batch of tokens. Every unique token is split once, and all the words
+        that need stemming are stemmed with a single call to the stemmer.
+        :param tokens: an iterable of tokens.
+        :param offsets: if True, will also return the offsets of the subtokens in the tokens.
+        :return: a list with a tuple of subtokens for every token, or with a pair of tuples
+                 of subtokens and their offsets if offsets is True.
+        """
+        tokens = list(tokens)
+        results = {}
+        splits = {}
+        for token in dict.fromkeys(tokens):
+            result = self._get_cached(token)
+            if result is None:
+                splits[token] = list(self._split_with_offsets(token))
+            else:
+                results[token] = result
+        words = list(dict.fromkeys(word for words in splits.values() for word, _ in words
+                                   if len(word) > self.stem_threshold))
+        stems = dict(zip(words, self._stemmer.stemWords(words)))
+        for token, words in splits.items():
+            results[token] = (tuple(stems.get(word, word) for word, _ in words),
+                              tuple(offset for _, offset in words))
+            self._set_cached(token, results[token])
+        if offsets:
+            return [results[token] for token in tokens]
+        return [results[token][0] for token in tokens]
+
+    def _get_cached(self, token):
+        result = self._cache.get(token)
+        if result is None:
+            self._cache_misses += 1
+        else:
+            self._cache_hits += 1
+            self._cache.move_to_end(token)
+        return result
+
+    def _set_cached(self, token, result):
+        if self._cache_size:
+            self._cache[token] = result
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _split_with_offsets(self, token):
+        # The metadata of the token style is only produced by splitting character by character.
+        if self._save_token_style:
+            return ((word, 0) for word in self.split_by_characters(token))
+        return self.split_with_offsets(token)
 
     def stem(self, word):
         if len(word) <= self.stem_threshold:
@@ -116,6 +232,40 @@ class TokenParser:
         return self._stemmer.stemWord(word)
 
     def split(self, token):
+        if self._save_token_style:
+            yield from self.split_by_characters(token)
+        else:
+            for word, _ in self.split_with_offsets(token):
+                yield word
+
+    def split_with_offsets(self, token):
+        """
+        Split the token into parts by delimiters and by case with a single regexp, and join
+        the short parts with the next ones in the same way as split_by_characters.
+        The style of the token is not saved.
+        :param token: the token to split.
+        :return: a generator of pairs (part, offset), where offset is the index of the
+                 character in the token where the part starts.
+        """
+        offset = len(token) - len(token.lstrip())
+        token = token.strip()[:self.max_token_length]
+        if self._attach_upper:
+            regexp = self.NAME_PARTS_ATTACH_UPPER_RE
+        else:
+            regexp = self.NAME_PARTS_RE
+        prev_p, prev_start = "", 0
+        for match in regexp.finditer(token):
+            name = match.group().lower()
+            start = offset + match.start()
+            if len(name) >= self.min_split_length:
+                yield name, start
+                if prev_p and not self._single_shot:
+                    yield prev_p + name, prev_start
+                    prev_p = ""
+            elif not self._single_shot:
+                prev_p, prev_start = name, start
+
+    def split_by_characters(self, token):
         token = token.strip()[:self.max_token_length]
 
         def meta_decorator(func):
@@ -196,6 +346,7 @@ class TokenParser:
     def __getstate__(self):
         state = self.__dict__.copy()
         del state["_stemmer"]
+        state["_cache"] = OrderedDict()
         return state
 
     def __setstate__(self, state):
@@ -0,0 +1,59 @@
+"""
+Caching-related tests.
+"""
+import os
+import shutil
+from tempfile import TemporaryDirectory
+import unittest
+
+from ..cache import get_blob_sha, TokenizationCache
+from ..tokenizer import get_data_from_file
+
+tests_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+class TestCache(unittest.TestCase):
+    def test_blob_sha(self):
+        with TemporaryDirectory() as td:
+            file = os.path.join(td, "test.txt")
+            with open(file, "w") as fout:
+                fout.write("test\n")
+            # The same as "git hash-object".
+            self.assertEqual(get_blob_sha(file), "9daeafb9864cf43055ae93beb0afd6c7d144bfa4")
+
+    def test_files(self):
+        with TemporaryDirectory() as td:
+            file = os.path.join(td, "repository", "test.py")
+            os.makedirs(os.path.dirname(file))
+            shutil.copy(os.path.join(tests_dir, "test_files", "test.py"), file)
+            cache = TokenizationCache(os.path.join(td, "cache"), (False, True, False))
+            key = cache.get_file_key(file, "Python")
+            self.assertNotEqual(key, cache.get_file_key(file, "Ruby"))
+            other_cache = TokenizationCache(os.path.join(td, "cache"), (True, False, False))
+            self.assertNotEqual(key, other_cache.get_file_key(file, "Python"))
+            self.assertFalse(cache.contains_file(key))
+            file_data = get_data_from_file(file, "Python", False, True)
+            cache.set_file(key, file_data)
+            self.assertTrue(cache.contains_file(key))
+            self.assertEqual(cache.get_file(key, "moved.py").identifiers, file_data.identifiers)
+            self.assertEqual(cache.get_file(key, "moved.py").path, "moved.py")
+            self.assertEqual(cache.cache_info()[:3], (1, 1, 0))
+            # The repositories are read from the cache while all their files are there.
+            directory = os.path.dirname(file)
+            self.assertIsNone(cache.get_repository("repository", directory))
+            cache.set_repository("repository", directory, [(key, file, "Python")])
+            self.assertEqual(cache.get_repository("repository", directory),
+                             [(key, file, "Python")])
+            self.assertEqual(cache.cache_info()[:3], (2, 1, 1))
+            # The size of the cache is kept when it is opened again.
+            cache_info = TokenizationCache(cache.directory, (False, True, False)).cache_info()
+            self.assertEqual(cache_info.currsize, cache.cache_info().currsize)
+            cache.max_size = 1
+            cache.evict()
+            self.assertEqual(cache.cache_info().currsize, 0)
+            self.assertFalse(cache.contains_file(key))
+            self.assertIsNone(cache.get_repository("repository", directory))
+
+
+if __name__ == "__main__":
+    unittest.main()
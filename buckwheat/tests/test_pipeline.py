@@ -1,15 +1,37 @@
 """
 Pipeline-related tests.
 """
+import json
 import os
+import shutil
+import subprocess
 from tempfile import TemporaryDirectory
 import unittest
 
-from ..tokenizer import recognize_languages_dir, tokenize_list_of_repositories, transform_files_list
+from joblib import Parallel
+
+from ..language_recognition.classifier import classify_languages_dir, classify_path, \
+    recognize_languages_paths
+from ..language_recognition.utils import recognize_languages_dir, recognize_languages_files
+from ..saver import RUN_MANIFEST, TokenIdsWriter
+from ..tokenizer import get_data_from_file, get_repository_blobs, get_repository_files, \
+    tokenize_list_of_repositories, tokenize_repositories, transform_files_list
+from ..utils import BlobReader, clone_repository, get_latest_commit, list_blobs, \
+    RepositoryError, schedule_files
 
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 
 
+def make_repository(directory):
+    """
+    Make a Git repository with a single commit of all the files in the directory.
+    """
+    git = ["git", "-c", "user.name=test", "-c", "user.email=test@test"]
+    subprocess.check_call(git + ["init", "--quiet"], cwd=directory)
+    subprocess.check_call(git + ["add", "."], cwd=directory)
+    subprocess.check_call(git + ["commit", "--quiet", "-m", "test"], cwd=directory)
+
+
 class TestPipeline(unittest.TestCase):
 
     def test_languages(self):
@@ -24,6 +46,48 @@ class TestPipeline(unittest.TestCase):
         files = transform_files_list(lang2files, "projects", None)
         self.assertEqual(len(files), 16)
 
+    def test_files_languages(self):
+        directory = os.path.abspath(os.path.join(tests_dir, "test_files"))
+        lang2files = recognize_languages_dir(directory)
+        expected = {os.path.join(directory, file): lang
+                    for lang, files in lang2files.items() for file in files}
+        paths = sorted(expected)
+        file2lang = recognize_languages_files(paths)
+        self.assertEqual(list(file2lang), paths)
+        self.assertEqual(file2lang, expected)
+        self.assertEqual(recognize_languages_files(paths[:2]),
+                         {path: file2lang[path] for path in paths[:2]})
+
+    def test_paths_classification(self):
+        lang2files = recognize_languages_paths(
+            ["src/main.py", "src/lib.h", "Rakefile", "build.sh.in", "node_modules/lib/index.js",
+             "docs/conf.py", ".github/run.sh", "src/.hidden.py", "README.md", "src/app.min.js",
+             "src/app.tsx", "src/lib.pyi", "src/data.json", "src/run"])
+        self.assertEqual(lang2files, {"Python": ["src/lib.pyi", "src/main.py"], "C": ["src/lib.h"],
+                                      "Ruby": ["Rakefile"], "Shell": ["build.sh.in"],
+                                      "TSX": ["src/app.tsx"]})
+        self.assertEqual([classify_path(path) for path in ["app.tsx", "lib.pyi", "data.json",
+                                                            "run", "test.foo"]],
+                         [("TSX", True), ("Python", False), (None, False), (None, True),
+                          (None, True)])
+
+    def test_classifier(self):
+        with TemporaryDirectory() as td:
+            shutil.copytree(os.path.join(tests_dir, "test_files"), os.path.join(td, "src"))
+            for directory in ["node_modules", "docs", ".github"]:
+                shutil.copytree(os.path.join(tests_dir, "test_files"), os.path.join(td, directory))
+            shutil.copy(os.path.join(td, "src", "test.rb"), os.path.join(td, "Rakefile"))
+            with open(os.path.join(td, "src", "test.sh")) as fin, \
+                    open(os.path.join(td, "run"), "w") as fout:
+                fout.write("#!/bin/bash\n" + fin.read())
+            # The extensions that are shared with other languages and the rare extensions.
+            shutil.copy(os.path.join(td, "src", "test.ts"), os.path.join(td, "src", "app.tsx"))
+            shutil.copy(os.path.join(td, "src", "test.py"), os.path.join(td, "src", "lib.pyi"))
+            shutil.copy(os.path.join(td, "src", "test.py"), os.path.join(td, "src", "setup.gyp"))
+            shutil.copy(os.path.join(td, "src", "test.c"), os.path.join(td, "src", "test.inc"))
+            shutil.copy(os.path.join(td, "src", "test.py"), os.path.join(td, "src", "test.foo"))
+            self.assertEqual(classify_languages_dir(td), recognize_languages_dir(td))
+
     def test_tokenization(self):
         with TemporaryDirectory() as td:
             tokenize_list_of_repositories(os.path.abspath(os.path.join(
@@ -33,6 +97,230 @@ class TestPipeline(unittest.TestCase):
                 wabbit_lines = sum(1 for _ in fin)
         self.assertEqual(wabbit_lines, 16)
 
+    def test_resuming(self):
+        with TemporaryDirectory() as td:
+            directory = os.path.join(td, "repository")
+            os.makedirs(directory)
+            for file in ["test.py", "test.java"]:
+                shutil.copy(os.path.join(tests_dir, "test_files", file), directory)
+            make_repository(directory)
+            repositories_file = os.path.join(td, "repositories.txt")
+            with open(repositories_file, "w") as fout:
+                fout.write("\n".join([directory, os.path.join(td, "missing"), directory]))
+            output_dir = os.path.join(td, "output")
+            tokenize_list_of_repositories(repositories_file, output_dir, 1, "counters", "files",
+                                          None, True, "jsonl")
+            with open(os.path.join(output_dir, RUN_MANIFEST)) as fin:
+                batches = json.load(fin)["batches"]
+            self.assertEqual(batches.keys(), {"0", "1", "2"})
+            self.assertEqual(batches["0"]["tokenized"],
+                             [{"name": directory + "/", "commit": get_latest_commit(directory)}])
+            self.assertEqual(batches["1"]["files"], [])
+            outputs = {}
+            for count_batch in ["0", "2"]:
+                path = os.path.join(output_dir, batches[count_batch]["files"][0]["path"])
+                with open(path) as fin:
+                    outputs[path] = fin.read()
+            # The first batch is intact, the last one is partial.
+            first, last = outputs
+            modified = os.path.getmtime(first)
+            with open(last, "w") as fout:
+                fout.write(outputs[last][:10])
+            tokenize_list_of_repositories(repositories_file, output_dir, 1, "counters", "files",
+                                          None, True, "jsonl", resume=True)
+            self.assertEqual(os.path.getmtime(first), modified)
+            for path, output in outputs.items():
+                with open(path) as fin:
+                    self.assertEqual(fin.read(), output)
+            with self.assertRaises(ValueError):
+                tokenize_list_of_repositories(repositories_file, output_dir, 1, "sequences",
+                                              "files", None, True, "jsonl", resume=True)
+
+    def test_resuming_vocabulary(self):
+        with TemporaryDirectory() as td:
+            directories = []
+            for file in ["test.py", "test.java"]:
+                directory = os.path.join(td, file.replace(".", "_"))
+                os.makedirs(directory)
+                shutil.copy(os.path.join(tests_dir, "test_files", file), directory)
+                directories.append(directory)
+            repositories_file = os.path.join(td, "repositories.txt")
+            with open(repositories_file, "w") as fout:
+                fout.write("\n".join(directories))
+
+            def tokenize(output_dir, resume):
+                tokenize_list_of_repositories(repositories_file, output_dir, 1, "sequences",
+                                              "files", None, True, "ids", resume=resume)
+                outputs = {}
+                for file in os.listdir(output_dir):
+                    if file != RUN_MANIFEST:
+                        with open(os.path.join(output_dir, file), "rb") as fin:
+                            outputs[file] = fin.read()
+                return outputs
+
+            expected = tokenize(os.path.join(td, "expected"), False)
+            vocabulary = expected[TokenIdsWriter.VOCABULARY]
+            # Interrupted after writing a part of the vocabulary in the first batch.
+            output_dir = os.path.join(td, "output")
+            os.makedirs(output_dir)
+            with open(os.path.join(output_dir, TokenIdsWriter.VOCABULARY), "wb") as fout:
+                fout.write(b"partial\n" + vocabulary[:10])
+            self.assertEqual(tokenize(output_dir, True), expected)
+            # Interrupted after writing a part of the vocabulary in the last batch.
+            with open(os.path.join(output_dir, RUN_MANIFEST)) as fin:
+                manifest = json.load(fin)
+            del manifest["batches"]["1"]
+            with open(os.path.join(output_dir, RUN_MANIFEST), "w") as fout:
+                json.dump(manifest, fout)
+            with open(os.path.join(output_dir, TokenIdsWriter.VOCABULARY), "ab") as fout:
+                fout.write(b"partial\n")
+            self.assertEqual(tokenize(output_dir, True), expected)
+            # A new run starts a new vocabulary.
+            with open(os.path.join(output_dir, TokenIdsWriter.VOCABULARY), "ab") as fout:
+                fout.write(b"previous\n")
+            self.assertEqual(tokenize(output_dir, False), expected)
+            # The token IDs are rejected before the run is started.
+            with self.assertRaises(ValueError):
+                tokenize_list_of_repositories(repositories_file, os.path.join(td, "compressed"),
+                                              1, "sequences", "files", None, True, "ids",
+                                              compress="gzip", resume=True)
+            self.assertFalse(os.path.exists(os.path.join(td, "compressed")))
+
+    def test_shared_queue(self):
+        directory = os.path.abspath(os.path.join(tests_dir, "test_files"))
+        with TemporaryDirectory() as td, Parallel(2, return_as="generator") as pool:
+            repositories = [(repository_name, list(files)) for repository_name, files in
+                            tokenize_repositories([td, directory, os.path.join(td, "missing"),
+                                                   directory], True, "counters", "files", None,
+                                                  pool)]
+        self.assertEqual([repository_name for repository_name, _ in repositories],
+                         [td + "/", directory + "/"])
+        self.assertEqual(len(repositories[0][1]), 0)
+        self.assertEqual(len(repositories[1][1]), 16)
+
+    def test_prefetching(self):
+        with TemporaryDirectory() as td:
+            directories = []
+            for index in range(4):
+                directory = os.path.join(td, f"repository{index}")
+                os.makedirs(directory)
+                for file in ["test.py", "test.java"][:index % 2 + 1]:
+                    shutil.copy(os.path.join(tests_dir, "test_files", file), directory)
+                directories.append(directory)
+            for prefetch in [0, 1, 2, 10]:
+                with self.subTest(prefetch=prefetch), \
+                        Parallel(2, return_as="generator") as pool:
+                    repositories = [(repository_name, len(list(files))) for repository_name, files
+                                    in tokenize_repositories(directories, True, "counters",
+                                                             "files", None, pool,
+                                                             prefetch=prefetch)]
+                    self.assertEqual(repositories, [(directory + "/", index % 2 + 1) for
+                                                    index, directory in enumerate(directories)])
+
+    def test_bare_languages(self):
+        with TemporaryDirectory() as td:
+            source = os.path.join(td, "source")
+            shutil.copytree(os.path.join(tests_dir, "test_files"), os.path.join(source, "src"))
+            shutil.copy(os.path.join(source, "src", "test.ts"), os.path.join(source, "app.tsx"))
+            shutil.copy(os.path.join(source, "src", "test.py"), os.path.join(source, "lib.pyi"))
+            shutil.copy(os.path.join(source, "src", "test.c"), os.path.join(source, "lib.h"))
+            shutil.copy(os.path.join(source, "src", "test.py"), os.path.join(source, "test.foo"))
+            with open(os.path.join(source, "src", "test.sh")) as fin, \
+                    open(os.path.join(source, "run"), "w") as fout:
+                fout.write("#!/bin/bash\n" + fin.read())
+            make_repository(source)
+            clone, bare = os.path.join(td, "clone"), os.path.join(td, "bare")
+            clone_repository("file://" + source, clone)
+            clone_repository("file://" + source, bare, bare=True)
+            files = get_repository_files("repository", clone, "files", None)
+            with BlobReader(bare) as reader:
+                bare_files, _ = get_repository_blobs("repository", bare, "files", None, reader)
+            self.assertEqual(sorted((os.path.relpath(file, bare), lang)
+                                    for file, lang in bare_files),
+                             sorted((os.path.relpath(file, clone), lang) for file, lang in files))
+            self.assertIn(("app.tsx", "TSX"), [(os.path.relpath(file, bare), lang)
+                                               for file, lang in bare_files])
+
+    def test_bare_content(self):
+        with TemporaryDirectory() as td:
+            source = os.path.join(td, "source")
+            os.makedirs(source)
+            shutil.copy(os.path.join(tests_dir, "test_files", "test.java"), source)
+            with open(os.path.join(source, "cafe.py"), "wb") as fout:
+                fout.write(b"def cafe():\n    return 'caf\xe9'\n")
+            make_repository(source)
+            repository = "file://" + source
+            with Parallel(2, return_as="generator") as pool:
+                files = [file for _, repository_files in
+                         tokenize_repositories([repository], False, "sequences", "functions",
+                                               None, pool, bare=True)
+                         for file in repository_files]
+            self.assertEqual(len(files), 2)
+            # The clone is deleted, and the content is read from any other bare clone.
+            bare = os.path.join(td, "bare")
+            clone_repository(repository, bare, bare=True)
+            with BlobReader(bare) as reader:
+                for file in files:
+                    name = file.path.split("/")[-1]
+                    objects = get_data_from_file(os.path.join(source, name), file.lang, True,
+                                                 False, gather_content=True).objects
+                    self.assertEqual(len(file.objects), len(objects))
+                    for lazy_obj, obj in zip(file.objects, objects):
+                        with self.subTest(name=name, start_line=obj.start_line):
+                            self.assertTrue(lazy_obj.path.startswith(repository))
+                            self.assertIsNone(lazy_obj.content)
+                            self.assertEqual(lazy_obj.get_content(reader), obj.content)
+                with self.assertRaises(UnicodeDecodeError):
+                    [file for file in files if file.lang == "Python"][0].objects[0] \
+                        .get_content(reader, decoding_errors="strict")
+
+    def test_scheduling(self):
+        directory = os.path.abspath(os.path.join(tests_dir, "test_files"))
+        files = [(os.path.join(directory, file), lang) for file, lang in
+                 [["test.js", "JavaScript"], ["test.scala", "Scala"], ["test.py", "Python"],
+                  ["test.java", "Java"], ["test.rb", "Ruby"]]]
+        # The largest file goes first, the rest are grouped by the size of 1000 bytes.
+        self.assertEqual(schedule_files(files, 1000),
+                         [[files[1]], [files[3], files[2]], [files[4], files[0]]])
+        self.assertEqual(schedule_files(files, 0),
+                         [[files[1]], [files[3]], [files[2]], [files[4]], [files[0]]])
+        self.assertEqual(schedule_files(files, 10 ** 6), [[files[1], files[3], files[2],
+                                                           files[4], files[0]]])
+
+    def test_cloning(self):
+        with TemporaryDirectory() as td:
+            source = os.path.join(td, "source")
+            shutil.copytree(os.path.join(tests_dir, "test_files"), source)
+            make_repository(source)
+            repository = "file://" + source
+            clone_repository(repository, os.path.join(td, "clone"))
+            self.assertEqual(get_latest_commit(os.path.join(td, "clone")),
+                             get_latest_commit(source))
+            with self.assertRaises(RepositoryError):
+                clone_repository(repository, os.path.join(td, "too_large"), max_size=1)
+            with self.assertRaises(RepositoryError):
+                clone_repository(repository, os.path.join(td, "too_slow"), timeout=0)
+            with self.assertRaises(RepositoryError):
+                clone_repository("file://" + os.path.join(td, "missing"),
+                                 os.path.join(td, "missing_clone"))
+            # The files of a bare clone are read from Git.
+            bare = os.path.join(td, "bare")
+            clone_repository(repository, bare, bare=True)
+            self.assertFalse(os.path.exists(os.path.join(bare, "test.py")))
+            blobs = list_blobs(bare)
+            self.assertEqual(sorted(path for path, _, _ in blobs), sorted(os.listdir(source))[1:])
+            lang2files = recognize_languages_paths([path for path, _, _ in blobs])
+            self.assertEqual(len(transform_files_list(lang2files, "files", None)), 16)
+            with BlobReader(bare) as reader:
+                for path, sha, size in blobs:
+                    with open(os.path.join(source, path), "rb") as fin:
+                        code = fin.read()
+                    self.assertEqual(reader.read(sha), code)
+                    self.assertEqual(reader.read(f"HEAD:{path}"), code)
+                    self.assertEqual(size, len(code))
+                with self.assertRaises(FileNotFoundError):
+                    reader.read("HEAD:missing.py")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,224 @@
+"""
+Saving-related tests.
+"""
+from array import array
+from collections import Counter
+import importlib.util
+import json
+import os
+from tempfile import TemporaryDirectory
+import unittest
+import zlib
+
+from ..saver import JsonLinesWriter, JsonWriter, load_token_ids, load_vocabulary, MANIFEST, \
+    open_output_file, ShardedWriter, TokenIdsWriter, WabbitWriter
+from ..tokenizer import get_data_from_file
+
+tests_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+class TestSaver(unittest.TestCase):
+    files = [get_data_from_file(os.path.abspath(os.path.join(tests_dir, "test_files", file)),
+                                lang, gather_objects=True, gather_identifiers=True)
+             for file, lang in [["test.py", "Python"], ["test.java", "Java"],
+                                ["test.js", "JavaScript"]]]
+
+    def test_json_writer(self):
+        for gran in ["projects", "files", "functions"]:
+            with self.subTest(gran=gran), TemporaryDirectory() as td:
+                with JsonWriter("counters", gran, td, "test.json") as writer:
+                    writer.write_repository("first", TestSaver.files[:2])
+                    writer.write_repository("empty", [])
+                    writer.write_repository("second", TestSaver.files[2:])
+                with open(os.path.join(td, "test.json")) as fin:
+                    output = fin.read()
+                bags = json.loads(output)
+                if gran == "projects":
+                    self.assertEqual(list(bags.keys()), ["first", "second"])
+                    self.assertEqual(bags["second"], Counter(TestSaver.files[2].identifiers))
+                else:
+                    self.assertEqual(list(bags.keys()), ["first", "empty", "second"])
+                    self.assertEqual(bags["empty"], {})
+                self.assertEqual(output, json.dumps(bags, ensure_ascii=False, indent=4))
+
+    def test_json_lines_writer(self):
+        for mode, gran in [("counters", "projects"), ("counters", "files"),
+                           ("sequences", "functions")]:
+            with self.subTest(gran=gran), TemporaryDirectory() as td:
+                with JsonLinesWriter(mode, gran, td, "test.jsonl") as writer:
+                    writer.write_repository("first", TestSaver.files[:2])
+                    writer.write_repository("empty", [])
+                    writer.write_repository("second", TestSaver.files[2:])
+                with open(os.path.join(td, "test.jsonl")) as fin:
+                    records = [json.loads(line) for line in fin]
+                if gran == "projects":
+                    self.assertEqual([record["name"] for record in records], ["first", "second"])
+                    self.assertEqual(records[1]["counts"],
+                                     Counter(TestSaver.files[2].identifiers))
+                elif gran == "files":
+                    self.assertEqual([(record["repository"], record["name"], record["lang"])
+                                      for record in records],
+                                     [("first", TestSaver.files[0].path, "Python"),
+                                      ("first", TestSaver.files[1].path, "Java"),
+                                      ("second", TestSaver.files[2].path, "JavaScript")])
+                else:
+                    functions = [obj for file in TestSaver.files for obj in file.objects
+                                 if obj.object_type.value == "function" and obj.identifiers]
+                    self.assertEqual(len(records), len(functions))
+                    for record, obj in zip(records, functions):
+                        self.assertEqual(record["type"], "function")
+                        self.assertEqual(record["start"][1], obj.start_line)
+                        self.assertEqual(record["tokens"], obj.identifiers)
+
+    def test_token_ids_writer(self):
+        with TemporaryDirectory() as td:
+            with TokenIdsWriter("sequences", "files", td, "first.txt") as writer:
+                writer.write_repository("first", TestSaver.files[:2])
+            with TokenIdsWriter("counters", "files", td, "second.txt") as writer:
+                writer.write_repository("second", TestSaver.files[2:])
+            vocabulary = list(load_vocabulary(os.path.join(td, "vocabulary.txt")))
+            ids, offsets, counts = array("i"), array("q"), array("i")
+            with open(os.path.join(td, "first.ids"), "rb") as fin:
+                ids.frombytes(fin.read())
+            with open(os.path.join(td, "first.offsets"), "rb") as fin:
+                offsets.frombytes(fin.read())
+            self.assertEqual(len(offsets), 3)
+            for index, file in enumerate(TestSaver.files[:2]):
+                self.assertEqual([vocabulary[token_id] for token_id in
+                                  ids[offsets[index]:offsets[index + 1]]], file.identifiers)
+            # The vocabulary is shared by the output files.
+            ids = array("i")
+            with open(os.path.join(td, "second.ids"), "rb") as fin:
+                ids.frombytes(fin.read())
+            with open(os.path.join(td, "second.counts"), "rb") as fin:
+                counts.frombytes(fin.read())
+            self.assertEqual(dict(zip([vocabulary[token_id] for token_id in ids], counts)),
+                             Counter(TestSaver.files[2].identifiers))
+            with open(os.path.join(td, "second.txt")) as fin:
+                self.assertEqual(json.loads(fin.read()), {"repository": "second", "lang":
+                                                          "JavaScript",
+                                                          "name": TestSaver.files[2].path})
+
+    @unittest.skipIf(importlib.util.find_spec("numpy") is None, "NumPy is not installed.")
+    def test_loading_token_ids(self):
+        files = [get_data_from_file(file.path, file.lang, gather_objects=False,
+                                    gather_identifiers=True, identifiers_verbose=True)
+                 for file in TestSaver.files]
+        with TemporaryDirectory() as td:
+            with TokenIdsWriter("sequences", "files", td, "test.txt") as writer:
+                writer.write_repository("repository", files)
+            data = load_token_ids(os.path.join(td, "test.txt"))
+            self.assertEqual(len(data["index"]), len(files))
+            self.assertEqual(data["coordinates"].shape, (data["offsets"][-1], 3))
+            for index, file in enumerate(files):
+                start, end = data["offsets"][index], data["offsets"][index + 1]
+                self.assertEqual([data["vocabulary"][token_id] for token_id in
+                                  data["ids"][start:end]],
+                                 [identifier.identifier for identifier in file.identifiers])
+                self.assertEqual(data["coordinates"][start:end].tolist(),
+                                 [[identifier.start_byte, identifier.start_line,
+                                   identifier.start_column] for identifier in file.identifiers])
+
+    def test_compression(self):
+        for compress, extension in [("gzip", ".gz"), ("bz2", ".bz2"), ("xz", ".xz")]:
+            with self.subTest(compress=compress), TemporaryDirectory() as td:
+                for writer_class in [WabbitWriter, JsonWriter]:
+                    with writer_class("sequences", "files", td, "test.txt") as writer:
+                        writer.write_repository("repository", TestSaver.files)
+                    with writer_class("sequences", "files", td, "test.txt", compress) as writer:
+                        writer.write_repository("repository", TestSaver.files)
+                    with open_output_file(os.path.join(td, "test.txt")) as fin:
+                        output = fin.read()
+                    with open_output_file(os.path.join(td, "test.txt" + extension)) as fin:
+                        self.assertEqual(fin.read(), output)
+                    self.assertLess(os.path.getsize(os.path.join(td, "test.txt" + extension)),
+                                    len(output))
+        with self.assertRaises(ValueError):
+            TokenIdsWriter("sequences", "files", td, "test.txt", "gzip")
+
+    def test_sharding(self):
+        repositories = [f"repository{index}" for index in range(8)]
+        with TemporaryDirectory() as td:
+            with ShardedWriter(JsonLinesWriter, "counters", "files", td, "test", 2,
+                               shard_records=2 * len(TestSaver.files)) as writer:
+                for repository in repositories:
+                    writer.write_repository(repository, TestSaver.files)
+            with open(os.path.join(td, MANIFEST)) as fin:
+                files = json.load(fin)["files"]
+            # Every shard gets every other repository, two repositories per file.
+            self.assertEqual([(file["path"], file["repositories"], file["records"])
+                              for file in files],
+                             [(f"test_shard{shard}_{part}.txt", 2, 2 * len(TestSaver.files))
+                              for shard in range(2) for part in range(2)])
+            for file in files:
+                with open(os.path.join(td, file["path"])) as fin:
+                    records = [json.loads(line) for line in fin]
+                self.assertEqual(len(records), file["records"])
+                self.assertEqual(os.path.getsize(os.path.join(td, file["path"])), file["bytes"])
+                self.assertEqual({record["repository"] for record in records},
+                                 set(repositories[file["shard"] + 4 * file["part"]::2][:2]))
+        with TemporaryDirectory() as td:
+            with ShardedWriter(WabbitWriter, "counters", "projects", td, "test", 3,
+                               shard_by="repository") as writer:
+                for repository in repositories:
+                    writer.write_repository(repository, TestSaver.files)
+            with open(os.path.join(td, MANIFEST)) as fin:
+                files = json.load(fin)["files"]
+            self.assertEqual(sum(file["records"] for file in files), len(repositories))
+            for file in files:
+                with open(os.path.join(td, file["path"])) as fin:
+                    for line in fin:
+                        repository = line.split(" ", 1)[0]
+                        self.assertEqual(zlib.crc32(repository.encode("utf-8")) % 3,
+                                         file["shard"])
+        # The shards are written by their threads and share the vocabulary.
+        with TemporaryDirectory() as td:
+            with ShardedWriter(TokenIdsWriter, "sequences", "files", td, "test", 4) as writer:
+                for repository in repositories:
+                    writer.write_repository(repository, TestSaver.files)
+            vocabulary = list(load_vocabulary(os.path.join(td, "vocabulary.txt")))
+            self.assertEqual(len(vocabulary), len(set(vocabulary)))
+            for shard in range(4):
+                ids, offsets = array("i"), array("q")
+                with open(os.path.join(td, f"test_shard{shard}_0.ids"), "rb") as fin:
+                    ids.frombytes(fin.read())
+                with open(os.path.join(td, f"test_shard{shard}_0.offsets"), "rb") as fin:
+                    offsets.frombytes(fin.read())
+                self.assertEqual([[vocabulary[token_id] for token_id in
+                                   ids[offsets[index]:offsets[index + 1]]]
+                                  for index in range(len(offsets) - 1)],
+                                 [file.identifiers for file in TestSaver.files] * 2)
+        # The errors of the threads are raised in the calling thread.
+        with TemporaryDirectory() as td:
+            with self.assertRaises(AttributeError):
+                with ShardedWriter(JsonLinesWriter, "counters", "files", td, "test", 2) as writer:
+                    writer.write_repository("repository", [None])
+        # The size of the files is counted in bytes, with non-ASCII names of the repositories.
+        repositories = [f"репозиторий{index}" for index in range(9)]
+        with TemporaryDirectory() as td:
+            with JsonLinesWriter("counters", "files", td, "test.txt") as writer:
+                writer.write_repository(repositories[0], TestSaver.files)
+            size = os.path.getsize(os.path.join(td, "test.txt"))
+            self.assertEqual(writer.size, size)
+            with ShardedWriter(JsonLinesWriter, "counters", "files", td, "test", 1,
+                               shard_size=2 * size + 1) as writer:
+                for repository in repositories:
+                    writer.write_repository(repository, TestSaver.files)
+            with open(os.path.join(td, MANIFEST)) as fin:
+                files = json.load(fin)["files"]
+            self.assertEqual([(file["repositories"], file["bytes"]) for file in files],
+                             [(3, 3 * size)] * 3)
+
+    def test_empty_output(self):
+        with TemporaryDirectory() as td:
+            with WabbitWriter("counters", "files", td, "test.txt"):
+                pass
+            self.assertFalse(os.path.exists(os.path.join(td, "test.txt")))
+            with WabbitWriter("counters", "files", td, "test.txt") as writer:
+                writer.write_repository("repository", TestSaver.files)
+            with open(os.path.join(td, "test.txt")) as fin:
+                self.assertEqual(sum(1 for _ in fin), len(TestSaver.files))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,8 @@
 Subtokenizing-related tests.
 """
 import os
+import random
+import re
 import unittest
 
 from ..subtokenizer import TokenParser
@@ -30,6 +32,44 @@ class TestSubtokenizing(unittest.TestCase):
                 subtokens = list(TestSubtokenizing.Subtokenizer.process_token(data[0]))
                 self.assertEqual(subtokens, data[1])
 
+    def test_split_with_offsets(self):
+        rng = random.Random(42)
+        alphabet = "aAbBzZ_.1 \u00e9"
+        for _ in range(1000):
+            token = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 16)))
+            parameters = {"attach_upper": rng.random() < 0.5, "single_shot": rng.random() < 0.3,
+                          "min_split_length": rng.randint(1, 4),
+                          "max_token_length": rng.randint(1, 20)}
+            subtokenizer = TokenParser(**parameters)
+            with self.subTest(token=token, **parameters):
+                parts = list(subtokenizer.split_with_offsets(token))
+                self.assertEqual([part for part, _ in parts],
+                                 list(subtokenizer.split_by_characters(token)))
+                for part, offset in parts:
+                    letters = re.sub("[^a-zA-Z]", "", token[offset:]).lower()
+                    self.assertTrue(letters.startswith(part))
+
+    def test_process_tokens(self):
+        tokens = [data[0] for data in TestSubtokenizing.test_subtokenizing_data] * 2
+        subtokenizer = TokenParser(cache_size=0)
+        self.assertEqual([list(subtokens) for subtokens in subtokenizer.process_tokens(tokens)],
+                         [data[1] for data in TestSubtokenizing.test_subtokenizing_data] * 2)
+        self.assertEqual(subtokenizer.cache_info().misses,
+                         len(TestSubtokenizing.test_subtokenizing_data))
+
+    def test_cache(self):
+        subtokenizer = TokenParser(cache_size=2)
+        uncached_subtokenizer = TokenParser(cache_size=0)
+        tokens = [data[0] for data in TestSubtokenizing.test_subtokenizing_data] * 2 + \
+            ["camelCase"] * 3
+        for token in tokens:
+            self.assertEqual(subtokenizer.subtokenize(token),
+                             uncached_subtokenizer.subtokenize(token))
+        self.assertEqual(subtokenizer.cache_info(), (2, len(tokens) - 2, 2, 2))
+        self.assertEqual(uncached_subtokenizer.cache_info(), (0, len(tokens), 0, 0))
+        subtokenizer.stem_threshold = 3
+        self.assertEqual(subtokenizer.cache_info(), (0, 0, 2, 0))
+
 
 if __name__ == "__main__":
     unittest.main()
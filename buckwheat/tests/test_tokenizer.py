@@ -3,9 +3,15 @@ Parsing-related tests.
 """
 from collections import Counter
 import os
+import pickle
+from tempfile import TemporaryDirectory
 import unittest
+from unittest import mock
 
-from ..tokenizer import get_identifiers_sequence_from_file
+from ..parsing.utils import get_parser
+from ..tokenizer import TreeSitterParser, get_classes_from_file, get_data_from_file, \
+    get_functions_from_file, get_identifiers_sequence_from_file
+from ..utils import IdentifierColumns, IdentifiersTypes
 
 tests_dir = os.path.abspath(os.path.dirname(__file__))
 
@@ -95,6 +101,148 @@ class TestParser(unittest.TestCase):
                     file, data[0], identifiers_verbose=False, subtokenize=True))
                 self.assertEqual(tokens, Counter(data[2]))
 
+    def test_cursor_traversal(self):
+        for data in TestParser.test_parser_data:
+            if data[0] not in TreeSitterParser.PARSERS:
+                continue
+            with self.subTest(lang=data[0]):
+                with open(os.path.join(tests_dir, "test_files", data[1]), "rb") as fin:
+                    code = fin.read()
+                root = get_parser(TreeSitterParser.PARSERS[data[0]]).parse(code).root_node
+                deque_nodes = [(node.type, node.start_byte, node.end_byte) for node in
+                               TreeSitterParser.traverse_tree(
+                                   root, TreeSitterParser.merge_nodes_for_lang(data[0]))]
+                cursor_nodes = [(node.type, node.start_byte, node.end_byte) for node in
+                                TreeSitterParser.traverse_tree_cursor(
+                                    root, TreeSitterParser.get_node_kinds(data[0])[-1])]
+                self.assertEqual(cursor_nodes, deque_nodes)
+
+    def test_query_backend(self):
+        for data in TestParser.test_parser_data:
+            if data[0] not in TreeSitterParser.PARSERS:
+                continue
+            for identifiers_verbose in [False, True]:
+                with self.subTest(lang=data[0], identifiers_verbose=identifiers_verbose):
+                    file = os.path.abspath(os.path.join(tests_dir, "test_files", data[1]))
+                    walker_data, query_data = [TreeSitterParser.get_data_from_file(
+                        file, data[0], gather_objects=True, gather_identifiers=True,
+                        identifiers_verbose=identifiers_verbose, subtokenize=True,
+                        backend=backend) for backend in ["walker", "query"]]
+                    self.assertEqual(query_data, walker_data)
+
+    def test_nested_objects(self):
+        depth = 50
+        code = "".join(f"{'    ' * i}def f{i}(a{i}):\n{'    ' * (i + 1)}b{i} = a{i}\n"
+                       for i in range(depth))
+        with TemporaryDirectory() as td:
+            file = os.path.join(td, "nested.py")
+            with open(file, "w") as fout:
+                fout.write(code)
+            file_data = TreeSitterParser.get_data_from_file(file, "Python", gather_objects=True,
+                                                            gather_identifiers=True)
+        self.assertEqual(len(file_data.objects), depth)
+        root = get_parser("python").parse(bytes(code, "utf-8")).root_node
+        for i, obj in enumerate(file_data.objects):
+            with self.subTest(depth=i):
+                node = root.descendant_for_byte_range(obj.start_byte, obj.end_byte)
+                self.assertEqual(obj.identifiers,
+                                 TreeSitterParser.get_identifiers_sequence_from_node(
+                                     bytes(code, "utf-8"), node, "Python"))
+                self.assertEqual(len(obj.identifiers), 4 * (depth - i))
+
+    def test_lazy_content(self):
+        file = os.path.abspath(os.path.join(tests_dir, "test_files", "test.java"))
+        lazy_objects = list(get_functions_from_file(file, "Java")) + \
+            list(get_classes_from_file(file, "Java"))
+        objects = list(get_functions_from_file(file, "Java", gather_content=True)) + \
+            list(get_classes_from_file(file, "Java", gather_content=True))
+        self.assertEqual(len(lazy_objects), len(objects))
+        for lazy_obj, obj in zip(lazy_objects, objects):
+            with self.subTest(start_line=obj.start_line):
+                self.assertIsNone(lazy_obj.content)
+                self.assertIsNotNone(obj.content)
+                self.assertEqual(lazy_obj.get_content(), obj.content)
+
+    def test_decoding_errors(self):
+        with TemporaryDirectory() as td:
+            file = os.path.join(td, "test.scala")
+            with open(file, "wb") as fout:
+                fout.write(b"object Caf\xe9 { val abc = 1 }\n")
+            self.assertEqual(get_data_from_file(file, "Scala", False, True,
+                                                decoding_errors="strict").identifiers, [])
+            self.assertEqual(get_data_from_file(file, "Scala", False, True,
+                                                decoding_errors="replace").identifiers,
+                             ["Caf", "\ufffd", "abc"])
+            self.assertEqual(get_data_from_file(file, "Scala", False, True,
+                                                decoding_errors="skip").identifiers,
+                             ["Caf", "abc"])
+
+    def test_pygments_coordinates(self):
+        for lang, file in [["Scala", "test.scala"], ["Kotlin", "test.kt"]]:
+            with self.subTest(lang=lang):
+                file = os.path.abspath(os.path.join(tests_dir, "test_files", file))
+                with open(file, "rb") as fin:
+                    code = fin.read()
+                lines = code.split(b"\n")
+                identifiers = get_identifiers_sequence_from_file(file, lang,
+                                                                 identifiers_verbose=True)
+                self.assertGreater(len(identifiers), 0)
+                for identifier in identifiers:
+                    token = identifier.identifier.encode("utf-8")
+                    self.assertEqual(code[identifier.start_byte:].find(token), 0)
+                    self.assertEqual(lines[identifier.start_line][identifier.start_column:]
+                                     .find(token), 0)
+
+    def test_subtokens_coordinates(self):
+        file = os.path.abspath(os.path.join(tests_dir, "test_files", "test.java"))
+        with open(file, "rb") as fin:
+            code = fin.read()
+        lines = code.split(b"\n")
+        subtokens = get_identifiers_sequence_from_file(file, "Java", identifiers_verbose=True,
+                                                       subtokenize=True)
+        self.assertGreater(len(subtokens), 0)
+        for subtoken in subtokens:
+            # Stemming only changes the ends of the subtokens.
+            first_character = subtoken.identifier[0].encode("utf-8")
+            self.assertEqual(code[subtoken.start_byte:subtoken.start_byte + 1].lower(),
+                             first_character)
+            self.assertEqual(lines[subtoken.start_line][subtoken.start_column:
+                                                        subtoken.start_column + 1].lower(),
+                             first_character)
+
+    def test_mmap(self):
+        file = os.path.abspath(os.path.join(tests_dir, "test_files", "test.java"))
+        file_data = get_data_from_file(file, "Java", True, True)
+        with mock.patch("buckwheat.utils.MMAP_THRESHOLD", 0):
+            mmap_file_data = get_data_from_file(file, "Java", True, True)
+        self.assertEqual(file_data, mmap_file_data)
+
+    def test_counting_identifiers(self):
+        for lang, file in [["Java", "test.java"], ["Scala", "test.scala"]]:
+            with self.subTest(lang=lang):
+                file = os.path.abspath(os.path.join(tests_dir, "test_files", file))
+                file_data = get_data_from_file(file, lang, True, True, subtokenize=True)
+                counted_file_data = get_data_from_file(file, lang, True, True, subtokenize=True,
+                                                       count_identifiers=True)
+                self.assertEqual(counted_file_data.identifiers_type, IdentifiersTypes.COUNTER)
+                self.assertEqual(counted_file_data.identifiers, Counter(file_data.identifiers))
+                self.assertEqual([obj.identifiers for obj in counted_file_data.objects],
+                                 [Counter(obj.identifiers) for obj in file_data.objects])
+
+    def test_compact_identifiers(self):
+        file = os.path.abspath(os.path.join(tests_dir, "test_files", "test.java"))
+        file_data = get_data_from_file(file, "Java", True, True, identifiers_verbose=True,
+                                       subtokenize=True)
+        compact_file_data = get_data_from_file(file, "Java", True, True, identifiers_verbose=True,
+                                               subtokenize=True, compact_identifiers=True)
+        self.assertIsInstance(compact_file_data.identifiers, IdentifierColumns)
+        self.assertLess(len(compact_file_data.identifiers.tokens), len(file_data.identifiers))
+        self.assertEqual(compact_file_data, file_data)
+        self.assertEqual(compact_file_data.identifiers[5:10], file_data.identifiers[5:10])
+        self.assertEqual(pickle.loads(pickle.dumps(compact_file_data)), file_data)
+        self.assertFalse(hasattr(file_data, "__dict__"))
+        self.assertFalse(hasattr(file_data.identifiers[0], "__dict__"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,27 +1,35 @@
 """
 Tokenization-related functionality.
 """
-from collections import deque
+from bisect import bisect_left
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack, nullcontext
+from itertools import chain, islice
 import logging
 import os
+import subprocess
 from tempfile import TemporaryDirectory
-from typing import Iterator, List, Optional, Set, Tuple, Union
+from typing import AbstractSet, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple, Union
 
 from joblib import cpu_count, delayed, Parallel
 import pygments
+from pygments.token import _TokenType
 from pygments.lexers.haskell import HaskellLexer
 from pygments.lexers.jvm import KotlinLexer, ScalaLexer
 from pygments.lexers.objective import SwiftLexer
 import tree_sitter
 
-from .language_recognition.utils import recognize_languages_dir
-from .parsing.utils import get_parser
-from .saver import OutputFormats
+from .cache import MAX_CACHE_SIZE, TokenizationCache
+from .language_recognition.classifier import classify_languages_dir, recognize_languages_paths
+from .parsing.utils import get_language, get_parser, get_query
+from .saver import OUTPUT_WRITERS, RunManifest, ShardedWriter, TokenIdsWriter
 from .subtokenizer import TokenParser
 from .utils import SUPPORTED_LANGUAGES, PARSING_MODES, GRANULARITIES, OUTPUT_FORMATS, \
-    IdentifiersTypes, ObjectTypes, FileData, IdentifierData, ObjectData, RepositoryError, \
-    assert_trailing_slash, clone_repository, get_full_path, get_latest_commit, read_file, \
-    to_batches, transform_files_list
+    COMPRESSIONS, SHARDINGS, TREE_SITTER_BACKENDS, DECODING_ERRORS, IdentifiersTypes, \
+    ObjectTypes, FileData, IdentifierColumns, IdentifierData, ObjectData, RepositoryError, \
+    BlobReader, assert_trailing_slash, clone_repository, decode_identifier, get_full_path, \
+    get_latest_commit, list_blobs, read_code, schedule_files, to_batches, transform_files_list
 
 # TODO: better naming
 # TODO: add AST functionality
@@ -30,9 +38,33 @@ from .utils import SUPPORTED_LANGUAGES, PARSING_MODES, GRANULARITIES, OUTPUT_FOR
 # One instance for further subtokenizing
 subtokenizer = TokenParser()
 
-# TODO: give the user the possibility the specify the number of processors
-# Number of threads for multi-processing
+# The default number of processes for multi-processing
 PROCESSES = cpu_count()
+# The default number of repositories that are cloned in advance
+PREFETCH = 2
+# The default target size in bytes of the chunks of small files that are parsed as one task
+CHUNK_SIZE = 64 * 1024
+
+
+def get_subtokens_data(token: IdentifierData, subtokens: Tuple[str, ...],
+                       offsets: Tuple[int, ...]) -> List[IdentifierData]:
+    """
+    Compile IdentifierData objects for the subtokens of the identifier.
+    :param token: the IdentifierData object of the identifier.
+    :param subtokens: the subtokens of the identifier.
+    :param offsets: the indices of the characters in the identifier where the subtokens start.
+    :return: a list of IdentifierData objects with the coordinates of the subtokens.
+    """
+    is_ascii = token.identifier.isascii()
+    subtokens_data = []
+    for subtoken, offset in zip(subtokens, offsets):
+        if not is_ascii:
+            offset = len(token.identifier[:offset].encode("utf-8"))
+        subtokens_data.append(IdentifierData(identifier=subtoken,
+                                             start_byte=token.start_byte + offset,
+                                             start_line=token.start_line,
+                                             start_column=token.start_column + offset))
+    return subtokens_data
 
 
 def subtokenize_identifier(token: Union[str, IdentifierData]) -> \
@@ -43,19 +75,44 @@ def subtokenize_identifier(token: Union[str, IdentifierData]) -> \
     :return: a list of the corresponding objects for each subtoken.
     """
     if isinstance(token, str):
-        subtokens = [subtoken for subtoken in list(subtokenizer.process_token(token))]
+        subtokens = list(subtokenizer.subtokenize(token))
     elif isinstance(token, IdentifierData):
-        # Currently, each subtoken returns the coordinates of the original token.
-        # TODO: fix the subtokenization to account for the change of coordinates.
-        subtokens = [IdentifierData(identifier=subtoken, start_byte=token.start_byte,
-                                    start_line=token.start_line,
-                                    start_column=token.start_column)
-                     for subtoken in list(subtokenizer.process_token(token.identifier))]
+        subtokens = get_subtokens_data(token,
+                                       *subtokenizer.subtokenize_with_offsets(token.identifier))
     else:
         raise TypeError("Unknown format of token!")
     return subtokens
 
 
+def subtokenize_identifiers(sequences: List[Union[List[str], List[IdentifierData]]]) -> \
+        List[Union[List[str], List[IdentifierData]]]:
+    """
+    Splits the identifiers of several sequences into subtokens at once. Every unique identifier
+    is split once, and all of them are stemmed together.
+    :param sequences: a list of sequences of either strings of identifiers or IdentifierData.
+    :return: a list with the sequence of the corresponding subtokens for every sequence.
+    """
+    def get_name(token: Union[str, IdentifierData]) -> str:
+        if isinstance(token, str):
+            return token
+        elif isinstance(token, IdentifierData):
+            return token.identifier
+        raise TypeError("Unknown format of token!")
+
+    names = list(dict.fromkeys(get_name(token) for tokens in sequences for token in tokens))
+    name2subtokens = dict(zip(names, subtokenizer.process_tokens(names, offsets=True)))
+    subtokens_sequences = []
+    for tokens in sequences:
+        subtokens = []
+        for token in tokens:
+            if isinstance(token, str):
+                subtokens.extend(name2subtokens[token][0])
+            else:
+                subtokens.extend(get_subtokens_data(token, *name2subtokens[token.identifier]))
+        subtokens_sequences.append(subtokens)
+    return subtokens_sequences
+
+
 # TODO: language names' normalization
 # TODO: do we really need a class with only static methods?
 class TreeSitterParser:
@@ -121,6 +178,82 @@ class TreeSitterParser:
                  "Shell": {"function_definition"},
                  "Rust": {"function_item"}}
 
+    # Tree-sitter kind ids of identifiers, functions, and classes, cached for every language.
+    NODE_KINDS = {}
+
+    # Sources of tree-sitter queries capturing identifiers, functions, and classes,
+    # cached for every language.
+    QUERY_SOURCES = {}
+
+    @staticmethod
+    def get_node_kinds(lang: str) -> Tuple[FrozenSet[int], FrozenSet[int], FrozenSet[int],
+                                           FrozenSet[int]]:
+        """
+        Given a language, get the sets of tree-sitter kind ids that correspond to identifiers,
+        functions, and classes. Several kind ids can share one node type (e.g. aliases or
+        anonymous nodes), so all of them are collected. Computed once per language.
+        :param lang: the language of code.
+        :return: (identifier kind ids, function kind ids, class kind ids, all these kind ids).
+        """
+        if lang not in TreeSitterParser.NODE_KINDS:
+            language = get_language(TreeSitterParser.PARSERS[lang])
+            tables = [TreeSitterParser.IDENTIFIERS, TreeSitterParser.FUNCTIONS,
+                      TreeSitterParser.CLASSES]
+            kinds = [set() for _ in tables]
+            for kind_id in range(language.node_kind_count):
+                node_type = language.node_kind_for_id(kind_id)
+                for table, kind_ids in zip(tables, kinds):
+                    if node_type in table.get(lang, ()):
+                        kind_ids.add(kind_id)
+            kinds.append(set().union(*kinds))
+            TreeSitterParser.NODE_KINDS[lang] = tuple(frozenset(kind_ids) for kind_ids in kinds)
+        return TreeSitterParser.NODE_KINDS[lang]
+
+    @staticmethod
+    def get_query_source(lang: str) -> str:
+        """
+        Given a language, compose a tree-sitter query that captures all the identifiers,
+        functions, and classes of this language with "identifier", "function", and "class"
+        captures respectively. Computed once per language.
+        :param lang: the language of code.
+        :return: the source of the query.
+        """
+        if lang not in TreeSitterParser.QUERY_SOURCES:
+            language = get_language(TreeSitterParser.PARSERS[lang])
+            patterns = []
+            for capture, table in [("identifier", TreeSitterParser.IDENTIFIERS),
+                                   ("function", TreeSitterParser.FUNCTIONS),
+                                   ("class", TreeSitterParser.CLASSES)]:
+                nodes = set()
+                for kind_id in range(language.node_kind_count):
+                    node_type = language.node_kind_for_id(kind_id)
+                    if language.node_kind_is_visible(kind_id) and node_type in table.get(lang, ()):
+                        # Named nodes are matched with parentheses, anonymous ones with quotes.
+                        if language.node_kind_is_named(kind_id):
+                            nodes.add(f"({node_type})")
+                        else:
+                            nodes.add(f'"{node_type}"')
+                if nodes:
+                    patterns.append(f"[{' '.join(sorted(nodes))}] @{capture}")
+            TreeSitterParser.QUERY_SOURCES[lang] = "\n".join(patterns)
+        return TreeSitterParser.QUERY_SOURCES[lang]
+
+    @staticmethod
+    def get_captures(node: tree_sitter.Node, lang: str) -> List[Tuple[tree_sitter.Node, str]]:
+        """
+        Run the query of a given language from a given node and get the captured nodes in the
+        same order as traverse_tree yields them. The matching itself happens in tree-sitter.
+        :param node: starting Tree-sitter node.
+        :param lang: the language of code.
+        :return: a list of tuples (node, capture), where capture is "identifier", "function",
+                 or "class".
+        """
+        query = get_query(TreeSitterParser.PARSERS[lang], TreeSitterParser.get_query_source(lang))
+        captures = query.captures(node)
+        # Outer nodes go before the inner ones that start at the same byte, as in DFS.
+        captures.sort(key=lambda capture: (capture[0].start_byte, -capture[0].end_byte))
+        return captures
+
     @staticmethod
     def get_positional_bytes(node: tree_sitter.Node) -> Tuple[int, int]:
         """
@@ -148,9 +281,34 @@ class TreeSitterParser:
             if node.type in types:
                 yield node
 
+    @staticmethod
+    def traverse_tree_cursor(node: tree_sitter.Node,
+                             kinds: AbstractSet[int]) -> Iterator[tree_sitter.Node]:
+        """
+        Run down the AST (DFS) from a given node with a tree cursor and yield its children of
+        necessary kinds. Yields the same nodes in the same order as traverse_tree, but doesn't
+        build the lists of children and compares integer kind ids instead of type strings.
+        :param node: starting Tree-sitter node.
+        :param kinds: the set of kind ids of interest, see get_node_kinds.
+        :return: the iterator of Tree-sitter nodes of necessary kinds.
+        """
+        cursor = node.walk()
+        while True:
+            node = cursor.node
+            if node.kind_id in kinds:
+                yield node
+            if cursor.goto_first_child():
+                continue
+            # The cursor is rooted at the starting node, so it can't leave its subtree.
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return
+
     @staticmethod
     def get_identifier_from_node(code: bytes, node: tree_sitter.Node,
-                                 identifiers_verbose: bool = False) -> Union[str, IdentifierData]:
+                                 identifiers_verbose: bool = False,
+                                 decoding_errors: str = "strict") -> \
+            Optional[Union[str, IdentifierData]]:
         """
         Given an identifier node of the AST and the code from which this AST was built,
         return the identifier.
@@ -158,10 +316,14 @@ class TreeSitterParser:
         :param node: the node of the tree-sitter AST.
         :param identifiers_verbose: if True, will return not only the identifier itself,
                                     but also its parameters as IdentifierData.
-        :return: str with just identifier or an IdentifierData object.
+        :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                                "strict", "replace", or "skip", see decode_identifier.
+        :return: str with just identifier or an IdentifierData object, None if it's skipped.
         """
         start_byte, end_byte = TreeSitterParser.get_positional_bytes(node)
-        identifier = code[start_byte:end_byte].decode("utf-8")
+        identifier = decode_identifier(code[start_byte:end_byte], decoding_errors)
+        if identifier is None:
+            return None
         if not identifiers_verbose:
             return identifier
         else:
@@ -171,7 +333,8 @@ class TreeSitterParser:
     @staticmethod
     def get_identifiers_sequence_from_node(code: bytes, node: tree_sitter.Node, lang: str,
                                            identifiers_verbose: bool = False,
-                                           subtokenize: bool = False) -> \
+                                           subtokenize: bool = False,
+                                           decoding_errors: str = "strict") -> \
             Union[List[str], List[IdentifierData]]:
         """
         Given a node of the AST and the code from which this AST was built, gather a list of
@@ -182,19 +345,22 @@ class TreeSitterParser:
         :param identifiers_verbose: if True, will save not only identifiers themselves,
                                     but also their parameters as IdentifierData.
         :param subtokenize: if True, will split the tokens into subtokens.
+        :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                                "strict", "replace", or "skip", see decode_identifier.
         :return: list of identifiers as either strings or IdentifierData objects.
         """
-        token_nodes = TreeSitterParser.traverse_tree(node, TreeSitterParser.IDENTIFIERS[lang])
+        identifier_kinds, _, _, _ = TreeSitterParser.get_node_kinds(lang)
+        token_nodes = TreeSitterParser.traverse_tree_cursor(node, identifier_kinds)
         tokens_sequence = []
 
         for token_node in token_nodes:
-            token = TreeSitterParser.get_identifier_from_node(code, token_node, identifiers_verbose)
-            if not subtokenize:
+            token = TreeSitterParser.get_identifier_from_node(code, token_node, identifiers_verbose,
+                                                              decoding_errors)
+            if token is not None:
                 tokens_sequence.append(token)
-            else:
-                subtokens = subtokenize_identifier(token)
-                tokens_sequence.extend(subtokens)
 
+        if subtokenize:
+            tokens_sequence, = subtokenize_identifiers([tokens_sequence])
         return tokens_sequence
 
     @staticmethod
@@ -220,7 +386,10 @@ class TreeSitterParser:
     @staticmethod
     def get_object_from_node(object_type: ObjectTypes, code: bytes, node: tree_sitter.Node,
                              lang: str, identifiers_verbose: bool = False,
-                             subtokenize: bool = False) -> ObjectData:
+                             subtokenize: bool = False,
+                             identifiers: Optional[Union[List[str], List[IdentifierData]]] = None,
+                             gather_content: bool = True,
+                             decoding_errors: str = "strict") -> ObjectData:
         """
         Given a node of the AST, its type, and the code from which this AST was built,
         compile an ObjectData object.
@@ -231,15 +400,24 @@ class TreeSitterParser:
         :param identifiers_verbose: if True, will save not only identifiers themselves,
                                     but also their parameters as IdentifierData.
         :param subtokenize: if True, will split the tokens into subtokens.
+        :param identifiers: the identifiers of the object, if they are already gathered.
+                            If None, they are gathered from the subtree of the node.
+        :param gather_content: if True, will save the source code of the object as its content.
+        :param decoding_errors: the handling of code that is not valid UTF-8: "strict", "replace",
+                                or "skip", see decode_identifier. The content is never skipped,
+                                invalid bytes are replaced instead.
         :return: ObjectData object.
         """
         start_byte, end_byte = TreeSitterParser.get_positional_bytes(node)
-        content = code[start_byte:end_byte].decode("utf-8")
+        content = None
+        if gather_content:
+            content = code[start_byte:end_byte].decode(
+                "utf-8", errors="strict" if decoding_errors == "strict" else "replace")
         start_line, start_column = node.start_point
         end_line, end_column = node.end_point
-        identifiers = TreeSitterParser.get_identifiers_sequence_from_node(code, node, lang,
-                                                                          identifiers_verbose,
-                                                                          subtokenize)
+        if identifiers is None:
+            identifiers = TreeSitterParser.get_identifiers_sequence_from_node(
+                code, node, lang, identifiers_verbose, subtokenize, decoding_errors)
         if identifiers_verbose:
             identifiers_type = IdentifiersTypes.VERBOSE
         else:
@@ -266,11 +444,150 @@ class TreeSitterParser:
             class_types = TreeSitterParser.CLASSES[lang]
         return identifier_types | function_types | class_types
 
+    @staticmethod
+    def get_data_from_captures(code: bytes, root: tree_sitter.Node, lang: str,
+                               gather_objects: bool, gather_identifiers: bool,
+                               identifiers_verbose: bool = False, subtokenize: bool = False,
+                               gather_content: bool = False,
+                               decoding_errors: str = "strict") -> \
+            Tuple[Union[List[str], List[IdentifierData]], List[ObjectData]]:
+        """
+        Given the root of the AST and the code from which this AST was built, gather the
+        identifiers and the objects with a single query. Every identifier is processed once,
+        and the identifiers of the objects are found by their byte ranges.
+        :param code: the original code in bytes.
+        :param root: the root node of the tree-sitter AST.
+        :param lang: the language of code.
+        :param gather_objects: if True, will gather ObjectData objects for classes and functions.
+        :param gather_identifiers: if True, will gather a list of identifiers for the file.
+        :param identifiers_verbose: if True, will save not only identifiers themselves,
+                                    but also their parameters as IdentifierData.
+        :param subtokenize: if True, will split the tokens into subtokens.
+        :param gather_content: if True, will save the source code of the objects as their content.
+        :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                                "strict", "replace", or "skip", see decode_identifier.
+        :return: a list of identifiers and a list of ObjectData objects.
+        """
+        tokens = []  # The list of (sub)tokens for every identifier node.
+        token_starts = []  # The starting byte of every identifier node.
+        object_nodes = []
+        for node, capture in TreeSitterParser.get_captures(root, lang):
+            if capture == "identifier":
+                token = TreeSitterParser.get_identifier_from_node(code, node, identifiers_verbose,
+                                                                  decoding_errors)
+                tokens.append([] if token is None else [token])
+                token_starts.append(node.start_byte)
+            elif capture == "function":
+                object_nodes.append((ObjectTypes.FUNCTION, node))
+            elif capture == "class":
+                object_nodes.append((ObjectTypes.CLASS, node))
+        if subtokenize:
+            tokens = subtokenize_identifiers(tokens)
+
+        identifiers = []
+        if gather_identifiers:
+            identifiers = list(chain.from_iterable(tokens))
+        objects = []
+        if gather_objects:
+            for object_type, node in object_nodes:
+                first = bisect_left(token_starts, node.start_byte)
+                last = bisect_left(token_starts, node.end_byte)
+                objects.append(TreeSitterParser.get_object_from_node(
+                    object_type, code, node, lang, identifiers_verbose, subtokenize,
+                    identifiers=list(chain.from_iterable(tokens[first:last])),
+                    gather_content=gather_content, decoding_errors=decoding_errors))
+        return identifiers, objects
+
+    @staticmethod
+    def get_data_from_traversal(code: bytes, root: tree_sitter.Node, lang: str,
+                                gather_objects: bool, gather_identifiers: bool,
+                                identifiers_verbose: bool = False, subtokenize: bool = False,
+                                gather_content: bool = False,
+                                decoding_errors: str = "strict") -> \
+            Tuple[Union[List[str], List[IdentifierData]], List[ObjectData]]:
+        """
+        Given the root of the AST and the code from which this AST was built, gather the
+        identifiers and the objects in a single traversal of the tree. The objects that contain
+        the current node are kept in a stack, and every identifier is processed once and added
+        to all of them, so nested objects aren't traversed again. The identifiers are split into
+        subtokens all at once after the traversal.
+        :param code: the original code in bytes.
+        :param root: the root node of the tree-sitter AST.
+        :param lang: the language of code.
+        :param gather_objects: if True, will gather ObjectData objects for classes and functions.
+        :param gather_identifiers: if True, will gather a list of identifiers for the file.
+        :param identifiers_verbose: if True, will save not only identifiers themselves,
+                                    but also their parameters as IdentifierData.
+        :param subtokenize: if True, will split the tokens into subtokens.
+        :param gather_content: if True, will save the source code of the objects as their content.
+        :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                                "strict", "replace", or "skip", see decode_identifier.
+        :return: a list of identifiers and a list of ObjectData objects.
+        """
+        identifiers = []
+        objects = []
+        open_objects = []  # The stack of (depth, identifiers) for objects around the node.
+        identifier_kinds, function_kinds, class_kinds, all_kinds = \
+            TreeSitterParser.get_node_kinds(lang)
+
+        # The tree is traversed once per file, in the same way as in traverse_tree_cursor,
+        # but the depth of the cursor is tracked to know when the objects end.
+        cursor = root.walk()
+        depth = 0
+        finished = False
+        while not finished:
+            node = cursor.node
+            kind_id = node.kind_id
+            # Gathering identifiers for the file and for the objects around them
+            if kind_id in identifier_kinds:
+                if gather_identifiers or open_objects:
+                    token = TreeSitterParser.get_identifier_from_node(code, node,
+                                                                      identifiers_verbose,
+                                                                      decoding_errors)
+                    if token is not None:
+                        if gather_identifiers:
+                            identifiers.append(token)
+                        for _, object_identifiers in open_objects:
+                            object_identifiers.append(token)
+            # Gathering ObjectData for functions and classes
+            elif gather_objects and kind_id in all_kinds:
+                if kind_id in function_kinds:
+                    object_type = ObjectTypes.FUNCTION
+                else:
+                    object_type = ObjectTypes.CLASS
+                obj = TreeSitterParser.get_object_from_node(object_type, code, node, lang,
+                                                            identifiers_verbose, subtokenize,
+                                                            identifiers=[],
+                                                            gather_content=gather_content,
+                                                            decoding_errors=decoding_errors)
+                objects.append(obj)
+                open_objects.append((depth, obj.identifiers))
+            if cursor.goto_first_child():
+                depth += 1
+                continue
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    finished = True
+                    break
+                depth -= 1
+            # The cursor has moved past all the objects that are not above the new node.
+            while open_objects and open_objects[-1][0] >= depth:
+                open_objects.pop()
+
+        if subtokenize:
+            identifiers, *objects_identifiers = subtokenize_identifiers(
+                [identifiers] + [obj.identifiers for obj in objects])
+            for obj, object_identifiers in zip(objects, objects_identifiers):
+                obj.identifiers = object_identifiers
+        return identifiers, objects
+
     # TODO: check pipeline patterns, refactor
     @staticmethod
     def get_data_from_file(file: str, lang: str, gather_objects: bool, gather_identifiers: bool,
-                           identifiers_verbose: bool = False,
-                           subtokenize: bool = False) -> FileData:
+                           identifiers_verbose: bool = False, subtokenize: bool = False,
+                           backend: str = "walker", gather_content: bool = False,
+                           decoding_errors: str = "replace",
+                           code: Optional[bytes] = None) -> FileData:
         """
         Given a file and its language, return a FileData object.
         :param file: the path to file.
@@ -280,49 +597,35 @@ class TreeSitterParser:
         :param identifiers_verbose: if True, will save not only identifiers themselves,
                                     but also their parameters as IdentifierData.
         :param subtokenize: if True, will split the tokens into subtokens.
+        :param backend: the way of extracting the nodes. "walker" traverses the tree in Python,
+                        "query" gathers all the nodes with a single tree-sitter query.
+                        Both give the same results.
+        :param gather_content: if True, will save the source code of the objects as their
+                               content. Otherwise, it can be read with ObjectData.get_content.
+        :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                                "strict", "replace", or "skip", see decode_identifier.
+                                The code itself is parsed as raw bytes and never decoded.
+        :param code: if not None, the contents of the file, then the file isn't read.
         :return: FileData object.
         """
-        code = read_file(file)
-        code = bytes(code, "utf-8")
-        tree = get_parser(TreeSitterParser.PARSERS[lang]).parse(code)
-        root = tree.root_node
         if identifiers_verbose:
             identifiers_type = IdentifiersTypes.VERBOSE
         else:
             identifiers_type = IdentifiersTypes.STRING
 
-        identifiers = []
-        objects = []
-
-        # The tree is traversed once per file
-        for node in TreeSitterParser.traverse_tree(
-                root, TreeSitterParser.merge_nodes_for_lang(lang)):
-            # Gathering identifiers for the file
-            if node.type in TreeSitterParser.IDENTIFIERS[lang]:
-                if gather_identifiers:
-                    if not subtokenize:
-                        identifiers.append(TreeSitterParser
-                                           .get_identifier_from_node(code, node,
-                                                                     identifiers_verbose))
-                    else:
-                        identifiers.extend(subtokenize_identifier(
-                            TreeSitterParser.get_identifier_from_node(code, node,
-                                                                      identifiers_verbose)))
-            # Gathering ObjectData for functions
-            elif node.type in TreeSitterParser.FUNCTIONS[lang]:
-                if gather_objects:
-                    objects.append(TreeSitterParser.get_object_from_node(ObjectTypes.FUNCTION,
-                                                                         code, node, lang,
-                                                                         identifiers_verbose,
-                                                                         subtokenize))
-            # Gathering ObjectData for classes
-            elif node.type in TreeSitterParser.CLASSES[lang]:
-                if gather_objects:
-                    objects.append(TreeSitterParser.get_object_from_node(ObjectTypes.CLASS, code,
-                                                                         node, lang,
-                                                                         identifiers_verbose,
-                                                                         subtokenize))
-
+        with read_code(file) if code is None else nullcontext(code) as code:
+            tree = get_parser(TreeSitterParser.PARSERS[lang]).parse(code)
+            root = tree.root_node
+            if backend == "query":
+                identifiers, objects = TreeSitterParser.get_data_from_captures(
+                    code, root, lang, gather_objects, gather_identifiers, identifiers_verbose,
+                    subtokenize, gather_content, decoding_errors)
+            else:
+                identifiers, objects = TreeSitterParser.get_data_from_traversal(
+                    code, root, lang, gather_objects, gather_identifiers, identifiers_verbose,
+                    subtokenize, gather_content, decoding_errors)
+        for obj in objects:
+            obj.path = obj.source = file
         return FileData(path=file, lang=lang, objects=objects, identifiers=identifiers,
                         identifiers_type=identifiers_type)
 
@@ -340,9 +643,28 @@ class PygmentsParser:
                    "Kotlin": {pygments.token.Name},
                    "Haskell": {pygments.token.Name, pygments.token.Keyword.Type}}
 
+    # Whether Pygments token types correspond to identifiers, memoized for every language.
+    IDENTIFIER_TYPES = {}
+
+    @staticmethod
+    def is_identifier_type(token_type: _TokenType, lang: str) -> bool:
+        """
+        Check whether a given Pygments token type corresponds to identifiers in a given language.
+        Token types are checked by walking up their hierarchy, so the result is memoized.
+        :param token_type: the Pygments token type.
+        :param lang: the language of code.
+        :return: True if the tokens of this type are identifiers.
+        """
+        identifier_types = PygmentsParser.IDENTIFIER_TYPES.setdefault(lang, {})
+        if token_type not in identifier_types:
+            identifier_types[token_type] = any(token_type in identifier_type for identifier_type
+                                               in PygmentsParser.IDENTIFIERS[lang])
+        return identifier_types[token_type]
+
     @staticmethod
     def get_identifiers_sequence_from_code(code: str, lang: str, identifiers_verbose: bool = False,
-                                           subtokenize: bool = False) -> \
+                                           subtokenize: bool = False,
+                                           decoding_errors: str = "strict") -> \
             Union[List[str], List[IdentifierData]]:
         """
         Given the code and its language, gather its identifiers.
@@ -351,25 +673,54 @@ class PygmentsParser:
         :param identifiers_verbose: if True, will save not only identifiers themselves,
                                     but also their parameters as IdentifierData.
         :param subtokenize: if True, will split the tokens into subtokens.
+        :param decoding_errors: the handling of identifiers that were not valid UTF-8. If "skip",
+                                the identifiers with U+FFFD replacement characters are skipped.
         :return: list of identifiers as either strings or IdentifierData objects.
         """
+        # Pygments lexers expect the code to end with a newline. It is the only preprocessing
+        # that is kept, so that the indices of the tokens point into the code itself.
+        if not code.endswith("\n"):
+            code += "\n"
+        identifier_types = PygmentsParser.IDENTIFIER_TYPES.get(lang, {})
+        is_ascii = code.isascii()
+        # The coordinates are counted incrementally from the previous identifier.
+        position, start_byte, start_line, line_start_byte = 0, 0, 0, 0
         tokens = []
-        for pair in pygments.lex(code, PygmentsParser.LEXERS[lang]):
-            if any(pair[0] in sublist for sublist in PygmentsParser.IDENTIFIERS[lang]):
-                # TODO: implement indexes for tokens, it's possible in pygments. (0, 0, 0) for now.
-                if not identifiers_verbose:
-                    token = pair[1]
-                else:
-                    token = IdentifierData(pair[1], 0, 0, 0)
-                if not subtokenize:
-                    tokens.append(token)
+        for index, token_type, value in PygmentsParser.LEXERS[lang].get_tokens_unprocessed(code):
+            is_identifier = identifier_types.get(token_type)
+            if is_identifier is None:
+                is_identifier = PygmentsParser.is_identifier_type(token_type, lang)
+                identifier_types = PygmentsParser.IDENTIFIER_TYPES[lang]
+            if not is_identifier:
+                continue
+            if decoding_errors == "skip" and "\ufffd" in value:
+                continue
+            if not identifiers_verbose:
+                token = value
+            else:
+                if is_ascii:
+                    start_byte = index
                 else:
-                    tokens.extend(subtokenize_identifier(token))
+                    start_byte += len(code[position:index].encode("utf-8"))
+                newlines = code.count("\n", position, index)
+                if newlines:
+                    start_line += newlines
+                    line_start = code.rfind("\n", position, index) + 1
+                    if is_ascii:
+                        line_start_byte = line_start
+                    else:
+                        line_start_byte = start_byte - len(code[line_start:index].encode("utf-8"))
+                position = index
+                token = IdentifierData(value, start_byte, start_line, start_byte - line_start_byte)
+            tokens.append(token)
+        if subtokenize:
+            tokens, = subtokenize_identifiers([tokens])
         return tokens
 
     @staticmethod
     def get_data_from_file(file: str, lang: str, identifiers_verbose: bool = False,
-                           subtokenize: bool = False) -> FileData:
+                           subtokenize: bool = False, decoding_errors: str = "replace",
+                           code: Optional[bytes] = None) -> FileData:
         """
         Given a file and its language, return a FileData object.
         :param file: path to file.
@@ -377,12 +728,18 @@ class PygmentsParser:
         :param identifiers_verbose: if True, will save not only identifiers themselves,
                                     but also their parameters as IdentifierData.
         :param subtokenize: if True, will split the tokens into subtokens.
+        :param decoding_errors: the handling of code that is not valid UTF-8: "strict" raises
+                                UnicodeDecodeError, "replace" puts U+FFFD in place of invalid
+                                bytes, "skip" also skips the identifiers with them.
+        :param code: if not None, the contents of the file, then the file isn't read.
         :return: FileData object.
         """
-        code = read_file(file)
+        with read_code(file) if code is None else nullcontext(code) as code:
+            code = str(code, "utf-8", "strict" if decoding_errors == "strict" else "replace")
         identifiers = PygmentsParser.get_identifiers_sequence_from_code(code, lang,
                                                                         identifiers_verbose,
-                                                                        subtokenize)
+                                                                        subtokenize,
+                                                                        decoding_errors)
         if identifiers_verbose:
             identifiers_type = IdentifiersTypes.VERBOSE
         else:
@@ -415,7 +772,8 @@ def get_identifiers_sequence_from_code(code: str, lang: str, identifiers_verbose
 
 
 def get_identifiers_sequence_from_file(file: str, lang: str, identifiers_verbose: bool = False,
-                                       subtokenize: bool = False) -> \
+                                       subtokenize: bool = False,
+                                       decoding_errors: str = "replace") -> \
         Union[List[str], List[IdentifierData]]:
     """
     Given the file and its language, gather subtokens of identifiers as IdentifierData objects.
@@ -424,15 +782,32 @@ def get_identifiers_sequence_from_file(file: str, lang: str, identifiers_verbose
     :param identifiers_verbose: if True, will save not only identifiers themselves,
                                 but also their parameters as IdentifierData.
     :param subtokenize: if True, will split the tokens into subtokens.
+    :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                            "strict", "replace", or "skip", see decode_identifier.
     :return: list of identifiers as either strings or IdentifierData objects.
     """
-    code = read_file(file)
-    return get_identifiers_sequence_from_code(code, lang, identifiers_verbose, subtokenize)
+    if lang in SUPPORTED_LANGUAGES["tree-sitter"]:
+        file_data = TreeSitterParser.get_data_from_file(file, lang, gather_objects=False,
+                                                        gather_identifiers=True,
+                                                        identifiers_verbose=identifiers_verbose,
+                                                        subtokenize=subtokenize,
+                                                        decoding_errors=decoding_errors)
+    elif lang in SUPPORTED_LANGUAGES["pygments"]:
+        file_data = PygmentsParser.get_data_from_file(file, lang, identifiers_verbose,
+                                                      subtokenize, decoding_errors)
+    else:
+        raise ValueError("Unsupported language!")
+    return file_data.identifiers
 
 
 def get_data_from_file(file: str, lang: str, gather_objects: bool, gather_identifiers: bool,
-                       identifiers_verbose: bool = False,
-                       subtokenize: bool = False) -> FileData:
+                       identifiers_verbose: bool = False, subtokenize: bool = False,
+                       backend: str = "walker", gather_content: bool = False,
+                       decoding_errors: str = "replace",
+                       subtokenizer_cache_size: Optional[int] = None,
+                       code: Optional[bytes] = None,
+                       count_identifiers: bool = False,
+                       compact_identifiers: bool = False) -> FileData:
     """
     Given a file and its language, return a FileData object.
     :param file: path to file.
@@ -442,27 +817,111 @@ def get_data_from_file(file: str, lang: str, gather_objects: bool, gather_identi
     :param identifiers_verbose: if True, will save not only identifiers themselves,
                                 but also their parameters as IdentifierData.
     :param subtokenize: if True, will split the tokens into subtokens.
+    :param backend: the backend of extracting nodes from tree-sitter trees: "walker" or "query".
+                    Doesn't affect the languages parsed with Pygments.
+    :param gather_content: if True, will save the source code of the objects as their content.
+                           Otherwise, it can be read with ObjectData.get_content.
+    :param decoding_errors: the handling of identifiers that are not valid UTF-8: "strict" skips
+                            the whole file, "replace" puts U+FFFD in place of invalid bytes,
+                            "skip" skips only the invalid identifiers.
+    :param subtokenizer_cache_size: if not None, the number of tokens whose subtokens are cached
+                                    by the subtokenizer of the current process.
+    :param code: if not None, the contents of the file, then the file isn't read, e.g. for the
+                 files read from Git with BlobReader.
+    :param count_identifiers: if True, the identifiers of the file and its objects are counted
+                              into Counter objects, see count_file_identifiers.
+    :param compact_identifiers: if True, the identifiers of the file and its objects with their
+                                parameters are stored as IdentifierColumns instead of lists.
     :return: FileData object.
     """
     logging.debug(f"Getting FileData from {file}.")
+    if subtokenizer_cache_size is not None:
+        # The subtokenizer of the process outlives the file, so its cache is reused by the
+        # following files parsed in the same process.
+        subtokenizer.cache_size = subtokenizer_cache_size
     try:
         if lang in SUPPORTED_LANGUAGES["tree-sitter"]:
-            return TreeSitterParser.get_data_from_file(file, lang, gather_objects,
-                                                       gather_identifiers, identifiers_verbose,
-                                                       subtokenize)
+            file_data = TreeSitterParser.get_data_from_file(file, lang, gather_objects,
+                                                            gather_identifiers,
+                                                            identifiers_verbose, subtokenize,
+                                                            backend, gather_content,
+                                                            decoding_errors, code)
         elif lang in SUPPORTED_LANGUAGES["pygments"]:
-            return PygmentsParser.get_data_from_file(file, lang, identifiers_verbose, subtokenize)
+            file_data = PygmentsParser.get_data_from_file(file, lang, identifiers_verbose,
+                                                          subtokenize, decoding_errors, code)
         else:
             raise ValueError("Unsupported language!")
     except UnicodeDecodeError:
         logging.warning(f"UnicodeDecodeError in {file}, skipping...")
         # Returning empty file for multiprocessing and further skipping during saving.
-        return FileData(path=file, lang=lang, objects=[], identifiers=[],
-                        identifiers_type=IdentifiersTypes.STRING)
+        file_data = FileData(path=file, lang=lang, objects=[], identifiers=[],
+                             identifiers_type=IdentifiersTypes.STRING)
+    if count_identifiers:
+        file_data = count_file_identifiers(file_data)
+    if compact_identifiers:
+        file_data = compact_file_identifiers(file_data)
+    return file_data
+
+
+def count_file_identifiers(file_data: FileData) -> FileData:
+    """
+    Replace the sequences of identifiers of a file and its objects with Counter objects, when
+    the counts are the only output that is needed. In the workers, this makes the results much
+    smaller to send to the main process, and the bags are merged there without recounting.
+    :param file_data: the FileData object with the identifiers as strings.
+    :return: the same FileData object.
+    """
+    file_data.identifiers = Counter(file_data.identifiers)
+    file_data.identifiers_type = IdentifiersTypes.COUNTER
+    for obj in file_data.objects:
+        obj.identifiers = Counter(obj.identifiers)
+        obj.identifiers_type = IdentifiersTypes.COUNTER
+    return file_data
+
+
+def compact_file_identifiers(file_data: FileData) -> FileData:
+    """
+    Replace the lists of IdentifierData objects of a file and its objects with IdentifierColumns,
+    which take less memory and are pickled as a few buffers when sent to the main process.
+    :param file_data: the FileData object.
+    :return: the same FileData object.
+    """
+    for data in [file_data] + file_data.objects:
+        if data.identifiers_type == IdentifiersTypes.VERBOSE and \
+                not isinstance(data.identifiers, IdentifierColumns):
+            data.identifiers = IdentifierColumns(data.identifiers)
+    return file_data
+
+
+def get_data_from_files(files: List[Tuple[str, str]], gather_objects: bool,
+                        gather_identifiers: bool, identifiers_verbose: bool = False,
+                        subtokenize: bool = False, backend: str = "walker",
+                        decoding_errors: str = "replace",
+                        subtokenizer_cache_size: Optional[int] = None,
+                        codes: Optional[List[bytes]] = None,
+                        count_identifiers: bool = False,
+                        compact_identifiers: bool = False) -> List[FileData]:
+    """
+    Given a chunk of files and their languages, return a list of FileData objects, one task
+    for the pool. See get_data_from_file for the parameters.
+    :param files: a list of tuples (full_path_to_file, lang).
+    :param codes: if not None, the contents of the files in the same order.
+    :return: a list of FileData objects in the same order.
+    """
+    if codes is None:
+        codes = [None] * len(files)
+    return [get_data_from_file(file, lang, gather_objects, gather_identifiers,
+                               identifiers_verbose, subtokenize, backend,
+                               decoding_errors=decoding_errors,
+                               subtokenizer_cache_size=subtokenizer_cache_size, code=code,
+                               count_identifiers=count_identifiers,
+                               compact_identifiers=compact_identifiers)
+            for (file, lang), code in zip(files, codes)]
 
 
 def get_functions_from_file(file: str, lang: str, identifiers_verbose: bool = False,
-                            subtokenize: bool = False) -> List[ObjectData]:
+                            subtokenize: bool = False,
+                            gather_content: bool = False) -> List[ObjectData]:
     """
     Yield ObjectData objects for functions in a given file.
     :param file: the path to file.
@@ -470,6 +929,8 @@ def get_functions_from_file(file: str, lang: str, identifiers_verbose: bool = Fa
     :param identifiers_verbose: if True, will save not only identifiers themselves,
                                 but also their parameters as IdentifierData.
     :param subtokenize: if True, will split the tokens into subtokens.
+    :param gather_content: if True, will save the source code of the objects as their content.
+                           Otherwise, it can be read with ObjectData.get_content.
     :return: an iterator of ObjectData objects for functions.
     """
     if lang not in SUPPORTED_LANGUAGES["functions"]:
@@ -477,14 +938,16 @@ def get_functions_from_file(file: str, lang: str, identifiers_verbose: bool = Fa
     file_data = TreeSitterParser.get_data_from_file(file, lang, gather_objects=True,
                                                     gather_identifiers=False,
                                                     identifiers_verbose=identifiers_verbose,
-                                                    subtokenize=subtokenize)
+                                                    subtokenize=subtokenize,
+                                                    gather_content=gather_content)
     for obj in file_data.objects:
         if obj.object_type == ObjectTypes.FUNCTION:
             yield obj
 
 
 def get_classes_from_file(file: str, lang: str, identifiers_verbose: bool = False,
-                          subtokenize: bool = False) -> List[ObjectData]:
+                          subtokenize: bool = False,
+                          gather_content: bool = False) -> List[ObjectData]:
     """
     Yield ObjectData objects for classes in a given file.
     :param file: the path to file.
@@ -492,6 +955,8 @@ def get_classes_from_file(file: str, lang: str, identifiers_verbose: bool = Fals
     :param identifiers_verbose: if True, will save not only identifiers themselves,
                                 but also their parameters as IdentifierData.
     :param subtokenize: if True, will split the tokens into subtokens.
+    :param gather_content: if True, will save the source code of the objects as their content.
+                           Otherwise, it can be read with ObjectData.get_content.
     :return: an iterator of ObjectData objects for classes.
     """
     if lang not in SUPPORTED_LANGUAGES["classes"]:
@@ -499,32 +964,28 @@ def get_classes_from_file(file: str, lang: str, identifiers_verbose: bool = Fals
     file_data = TreeSitterParser.get_data_from_file(file, lang, gather_objects=True,
                                                     gather_identifiers=False,
                                                     identifiers_verbose=identifiers_verbose,
-                                                    subtokenize=subtokenize)
+                                                    subtokenize=subtokenize,
+                                                    gather_content=gather_content)
     for obj in file_data.objects:
         if obj.object_type == ObjectTypes.CLASS:
             yield obj
 
 
-# TODO: functionality for GitHub link creation
-def tokenize_repository(repository: str, local: bool, mode: str, gran: str,
-                        languages: Optional[List[str]], pool: Parallel,
-                        identifiers_verbose: bool = False,
-                        subtokenize: bool = False) -> Tuple[str, List[FileData]]:
+@contextmanager
+def open_repository(repository: str, local: bool, clone_timeout: Optional[float] = None,
+                    max_clone_size: Optional[int] = None,
+                    bare: bool = False) -> Iterator[Tuple[str, str]]:
     """
-    Tokenize a given repository. Return its correct full name and a list of FileData objects.
+    Get a given repository into a local directory for the time of the context.
     :param repository: a link to the repository. If "local" is False, a link to GitHub,
                        otherwise - a path to a directory.
     :param local: True if tokenizing in local mode (repository is a path to a directory),
                   False if tokenizing in default mode (repository is a GitHub link).
-    :param mode: the mode of parsing. Either "counters" or "sequences".
-    :param gran: granularity of parsing. Values are ["projects", "files", "classes", "functions"].
-    :param languages: the languages of parsing. None for all the languages available for a
-                      given parsing granularity, specific languages for themselves.
-    :param pool: the Parallel class instance for multiprocessing.
-    :param identifiers_verbose: if True, will save not only identifiers themselves,
-                                but also their parameters as IdentifierData.
-    :param subtokenize: if True, will split the tokens into subtokens.
-    :return: the correct name of the repository for links and a list of FileData objects.
+    :param clone_timeout: if not None, the maximum duration of cloning in seconds.
+    :param max_clone_size: if not None, the maximum size of the cloned repository in bytes.
+    :param bare: if True, the repository is cloned as a bare repository, without the files.
+                 Doesn't affect the local mode.
+    :return: the correct name of the repository for links and the path to its directory.
     """
     repository = assert_trailing_slash(repository)
     with TemporaryDirectory() as td:
@@ -537,38 +998,491 @@ def tokenize_repository(repository: str, local: bool, mode: str, gran: str,
         else:
             logging.debug(f"Cloning {repository}.")
             directory = td  # Working with a temporary directory in the remote mode
-            clone_repository(repository, directory)  # Cloning the repository
+            # Cloning the repository
+            clone_repository(repository, directory, clone_timeout, max_clone_size, bare)
             # The name of the repository includes the commit for working links.
-            commit = get_latest_commit(directory)
+            try:
+                commit = get_latest_commit(directory)
+            except subprocess.CalledProcessError:
+                raise RepositoryError(f"{repository} has no commits!")
             repository_name = f"{repository}tree/{commit}/"
-        logging.debug(f"Recognizing languages is {repository}.")
-        lang2files = recognize_languages_dir(directory)  # Recognize the languages in the directory
-        files = transform_files_list(lang2files, gran, languages)
-        logging.debug(f"Parsing files in {repository}.")
-        # Parsing for files and projects does not require gathering ObjectData objects.
-        # TODO: avoid hardcoded names
-        if gran in ["projects", "files"]:
-            gather_objects = False
-            gather_identifiers = True
-        # Parsing for classes and functions does not require gathering identifiers for files.
-        else:
-            gather_objects = True
-            gather_identifiers = False
-        # Full parameters of identifiers can't be saved for counters.
-        if (mode == "counters") and (identifiers_verbose is True):
-            logging.warning("Full parameters of identifiers can't be saved in 'counters' mode!")
-            identifiers_verbose = False
-        chunk_results = pool([delayed(get_data_from_file)
-                              (get_full_path(file[0], directory), file[1], gather_objects,
-                               gather_identifiers, identifiers_verbose, subtokenize)
-                              for file in files])
-        logging.debug(f"Gathering results for {repository}.")
-        files = []
-        for file in chunk_results:
-            # In the remote mode, the temporary directory is changed for the GitHub link.
+        yield repository_name, directory
+
+
+def get_parsing_parameters(mode: str, gran: str,
+                           identifiers_verbose: bool = False) -> Tuple[bool, bool, bool, bool]:
+    """
+    Get the parameters of parsing files for a given mode and granularity.
+    :param mode: the mode of parsing. Either "counters" or "sequences".
+    :param gran: granularity of parsing. Values are ["projects", "files", "classes", "functions"].
+    :param identifiers_verbose: if True, will save not only identifiers themselves,
+                                but also their parameters as IdentifierData.
+    :return: a tuple (gather_objects, gather_identifiers, identifiers_verbose,
+             count_identifiers), see get_data_from_file.
+    """
+    # Parsing for files and projects does not require gathering ObjectData objects.
+    # TODO: avoid hardcoded names
+    if gran in ["projects", "files"]:
+        gather_objects = False
+        gather_identifiers = True
+    # Parsing for classes and functions does not require gathering identifiers for files.
+    else:
+        gather_objects = True
+        gather_identifiers = False
+    # Full parameters of identifiers can't be saved for counters, and the identifiers are
+    # counted in the workers. For projects, the identifiers are counted in any mode.
+    count_identifiers = mode == "counters" or gran == "projects"
+    if count_identifiers:
+        identifiers_verbose = False
+    return gather_objects, gather_identifiers, identifiers_verbose, count_identifiers
+
+
+def get_repository_files(repository_name: str, directory: str, gran: str,
+                         languages: Optional[List[str]]) -> List[Tuple[str, str]]:
+    """
+    Recognize the languages of the files of a repository in a given directory.
+    :param repository_name: the correct name of the repository for links.
+    :param directory: the path to the directory of the repository.
+    :param gran: granularity of parsing. Values are ["projects", "files", "classes", "functions"].
+    :param languages: the languages of parsing. None for all the languages available for a
+                      given parsing granularity, specific languages for themselves.
+    :return: a list of tuples (full_path_to_file, lang) for the necessary languages.
+    """
+    logging.debug(f"Recognizing languages is {repository_name}.")
+    lang2files = classify_languages_dir(directory)  # Recognize the languages in the directory
+    files = transform_files_list(lang2files, gran, languages)
+    return [(get_full_path(file, directory), lang) for file, lang in files]
+
+
+def get_repository_blobs(repository_name: str, directory: str, gran: str,
+                         languages: Optional[List[str]],
+                         reader: Optional[BlobReader] = None) -> \
+        Tuple[List[Tuple[str, str]], Dict[str, Tuple[str, int]]]:
+    """
+    Recognize the languages of the files of a bare repository in a given directory by their
+    names. With a reader, the files with ambiguous and unknown names are read from Git and
+    classified by Enry, so the same files are recognized as in the checked out repository.
+    Otherwise, the files aren't read, and the ambiguous extensions are resolved to the most
+    probable languages.
+    :param repository_name: the correct name of the repository for links.
+    :param directory: the path to the directory of the bare repository.
+    :param gran: granularity of parsing. Values are ["projects", "files", "classes", "functions"].
+    :param languages: the languages of parsing. None for all the languages available for a
+                      given parsing granularity, specific languages for themselves.
+    :param reader: if not None, the reader of the files of the bare repository.
+    :return: a list of tuples (full_path_to_file, lang) for the necessary languages and
+             a dictionary {full_path_to_file: (blob hash, size in bytes)} for all the files.
+    """
+    logging.debug(f"Listing files in {repository_name}.")
+    blobs = {get_full_path(path, directory): (sha, size)
+             for path, sha, size in list_blobs(directory)}
+    read = None if reader is None else \
+        (lambda path: reader.read(blobs[get_full_path(path, directory)][0]))
+    lang2files = recognize_languages_paths([os.path.relpath(file, directory) for file in blobs],
+                                           read)
+    files = transform_files_list(lang2files, gran, languages)
+    return [(get_full_path(file, directory), lang) for file, lang in files], blobs
+
+
+def get_files_tasks(chunks: List[List[Tuple[str, str]]], mode: str, gran: str,
+                    identifiers_verbose: bool = False, subtokenize: bool = False,
+                    backend: str = "walker", decoding_errors: str = "replace",
+                    subtokenizer_cache_size: int = TokenParser.CACHE_SIZE,
+                    reader: Optional[BlobReader] = None,
+                    blobs: Optional[Dict[str, Tuple[str, int]]] = None) -> Iterator:
+    """
+    Compose the tasks of parsing given chunks of files for the pool, see schedule_files.
+    With a reader of a bare repository, the files of a chunk are read right before its task
+    is dispatched, so only the contents of the dispatched chunks are kept in memory.
+    :param chunks: a list of chunks, every chunk is a list of tuples (full_path_to_file, lang).
+    :param mode: the mode of parsing. Either "counters" or "sequences".
+    :param gran: granularity of parsing. Values are ["projects", "files", "classes", "functions"].
+    :param identifiers_verbose: if True, will save not only identifiers themselves,
+                                but also their parameters as IdentifierData.
+    :param subtokenize: if True, will split the tokens into subtokens.
+    :param backend: the backend of extracting nodes from tree-sitter trees: "walker" or "query".
+    :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                            "strict", "replace", or "skip".
+    :param subtokenizer_cache_size: the number of tokens whose subtokens are cached in every
+                                    process, 0 to disable the cache.
+    :param reader: if not None, the reader of the files of a bare repository.
+    :param blobs: with a reader, the dictionary {full_path_to_file: (blob hash, size in bytes)},
+                  see get_repository_blobs.
+    :return: a generator of delayed calls of get_data_from_files, one for every chunk of files.
+    """
+    if (mode == "counters") and (identifiers_verbose is True):
+        logging.warning("Full parameters of identifiers can't be saved in 'counters' mode!")
+    gather_objects, gather_identifiers, identifiers_verbose, count_identifiers = \
+        get_parsing_parameters(mode, gran, identifiers_verbose)
+    for chunk in chunks:
+        codes = None
+        if reader is not None:
+            codes = [reader.read(blobs[file][0]) for file, _ in chunk]
+        yield delayed(get_data_from_files)(chunk, gather_objects, gather_identifiers,
+                                           identifiers_verbose, subtokenize, backend,
+                                           decoding_errors, subtokenizer_cache_size, codes,
+                                           count_identifiers, compact_identifiers=True)
+
+
+def get_repository_tasks(repository_name: str, directory: str, mode: str, gran: str,
+                         languages: Optional[List[str]], identifiers_verbose: bool = False,
+                         subtokenize: bool = False, backend: str = "walker",
+                         decoding_errors: str = "replace",
+                         subtokenizer_cache_size: int = TokenParser.CACHE_SIZE,
+                         chunk_size: int = CHUNK_SIZE) -> list:
+    """
+    Recognize the languages of the files of a repository in a given directory and compose the
+    tasks of parsing them for the pool: the largest files go first, and the small files are
+    parsed in chunks, see schedule_files.
+    :param repository_name: the correct name of the repository for links.
+    :param directory: the path to the directory of the repository.
+    :param mode: the mode of parsing. Either "counters" or "sequences".
+    :param gran: granularity of parsing. Values are ["projects", "files", "classes", "functions"].
+    :param languages: the languages of parsing. None for all the languages available for a
+                      given parsing granularity, specific languages for themselves.
+    :param identifiers_verbose: if True, will save not only identifiers themselves,
+                                but also their parameters as IdentifierData.
+    :param subtokenize: if True, will split the tokens into subtokens.
+    :param backend: the backend of extracting nodes from tree-sitter trees: "walker" or "query".
+    :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                            "strict", "replace", or "skip".
+    :param subtokenizer_cache_size: the number of tokens whose subtokens are cached in every
+                                    process, 0 to disable the cache.
+    :param chunk_size: the target total size in bytes of the small files parsed as one task,
+                       0 to parse every file as a separate task.
+    :return: a list of delayed calls of get_data_from_files, one for every chunk of files.
+    """
+    files = get_repository_files(repository_name, directory, gran, languages)
+    logging.debug(f"Parsing files in {repository_name}.")
+    return list(get_files_tasks(schedule_files(files, chunk_size), mode, gran,
+                                identifiers_verbose, subtokenize, backend, decoding_errors,
+                                subtokenizer_cache_size))
+
+
+def set_repository_path(file: FileData, repository_name: str, directory: str) -> FileData:
+    """
+    In the remote mode, change the path to the file in the temporary directory of the
+    repository for the GitHub link.
+    :param file: the FileData object.
+    :param repository_name: the correct name of the repository for links.
+    :param directory: the path to the directory of the repository.
+    :return: the same FileData object.
+    """
+    file.path = repository_name + os.path.relpath(file.path, directory)
+    for obj in file.objects:
+        obj.path = file.path
+    return file
+
+
+def set_blob_sources(file: FileData, blobs: Dict[str, Tuple[str, int]]) -> FileData:
+    """
+    In the bare mode, point the objects of the file to the blob of the file, so that their
+    content can be read with ObjectData.get_content after the clone is deleted.
+    :param file: the FileData object with the full path to the file.
+    :param blobs: the dictionary {full_path_to_file: (blob hash, size in bytes)}.
+    :return: the same FileData object.
+    """
+    for obj in file.objects:
+        obj.source = blobs[file.path][0]
+    return file
+
+
+def tokenize_repository_files(repository_name: str, directory: str, local: bool, mode: str,
+                              gran: str, languages: Optional[List[str]], pool: Parallel,
+                              identifiers_verbose: bool = False, subtokenize: bool = False,
+                              backend: str = "walker", decoding_errors: str = "replace",
+                              subtokenizer_cache_size: int = TokenParser.CACHE_SIZE,
+                              chunk_size: int = CHUNK_SIZE) -> Iterator[FileData]:
+    """
+    Tokenize the files of a repository in a given directory, yielding FileData objects in the
+    same order as the pool returns them: from the largest files to the smallest ones. With a pool
+    that returns a generator, only the files that are being parsed are kept in memory.
+    :param repository_name: the correct name of the repository for links.
+    :param directory: the path to the directory of the repository.
+    :param local: True if tokenizing in local mode (repository is a path to a directory),
+                  False if tokenizing in default mode (repository is a GitHub link).
+    :param mode: the mode of parsing. Either "counters" or "sequences".
+    :param gran: granularity of parsing. Values are ["projects", "files", "classes", "functions"].
+    :param languages: the languages of parsing. None for all the languages available for a
+                      given parsing granularity, specific languages for themselves.
+    :param pool: the Parallel class instance for multiprocessing.
+    :param identifiers_verbose: if True, will save not only identifiers themselves,
+                                but also their parameters as IdentifierData.
+    :param subtokenize: if True, will split the tokens into subtokens.
+    :param backend: the backend of extracting nodes from tree-sitter trees: "walker" or "query".
+    :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                            "strict", "replace", or "skip".
+    :param subtokenizer_cache_size: the number of tokens whose subtokens are cached in every
+                                    process, 0 to disable the cache.
+    :return: a generator of FileData objects.
+    """
+    tasks = get_repository_tasks(repository_name, directory, mode, gran, languages,
+                                 identifiers_verbose, subtokenize, backend, decoding_errors,
+                                 subtokenizer_cache_size, chunk_size)
+    for files in pool(tasks):
+        for file in files:
             if not local:
-                file.path = repository_name + os.path.relpath(file.path, directory)
-            files.append(file)
+                file = set_repository_path(file, repository_name, directory)
+            yield file
+
+
+def tokenize_repositories(repositories: List[str], local: bool, mode: str, gran: str,
+                          languages: Optional[List[str]], pool: Parallel,
+                          identifiers_verbose: bool = False, subtokenize: bool = False,
+                          backend: str = "walker", decoding_errors: str = "replace",
+                          subtokenizer_cache_size: int = TokenParser.CACHE_SIZE,
+                          prefetch: int = PREFETCH, clone_timeout: Optional[float] = None,
+                          max_clone_size: Optional[int] = None, chunk_size: int = CHUNK_SIZE,
+                          cache: Optional[TokenizationCache] = None, bare: bool = False) -> \
+        Iterator[Tuple[str, Iterator[FileData]]]:
+    """
+    Tokenize a list of repositories with a single queue of files shared by all of them.
+    The languages of the repositories are recognized while the pool asks for new tasks,
+    so the workers parse the files of the previous repositories in the meantime. The following
+    repositories are cloned in advance by a pool of threads.
+    With a cache, only the files that aren't in the cache are parsed, and in the default mode,
+    the repositories that were tokenized with the same commit are read from the cache entirely.
+    In the bare mode, the files are read from Git objects and never written to disk.
+    The results are regrouped by repository: like in itertools.groupby, the files of every
+    repository must be consumed before moving to the next one. The incorrect repositories
+    are skipped, and every repository is tokenized once.
+    :param repositories: a list of links to the repositories. If "local" is False,
+                         links to GitHub, otherwise - paths to directories.
+    :param local: True if tokenizing in local mode (repositories are paths to directories),
+                  False if tokenizing in default mode (repositories are GitHub links).
+    :param mode: the mode of parsing. Either "counters" or "sequences".
+    :param gran: granularity of parsing. Values are ["projects", "files", "classes", "functions"].
+    :param languages: the languages of parsing. None for all the languages available for a
+                      given parsing granularity, specific languages for themselves.
+    :param pool: the Parallel class instance for multiprocessing, returning a generator.
+    :param identifiers_verbose: if True, will save not only identifiers themselves,
+                                but also their parameters as IdentifierData.
+    :param subtokenize: if True, will split the tokens into subtokens.
+    :param backend: the backend of extracting nodes from tree-sitter trees: "walker" or "query".
+    :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                            "strict", "replace", or "skip".
+    :param subtokenizer_cache_size: the number of tokens whose subtokens are cached in every
+                                    process, 0 to disable the cache.
+    :param prefetch: the number of repositories that are cloned in advance.
+    :param clone_timeout: if not None, the maximum duration of cloning in seconds.
+    :param max_clone_size: if not None, the maximum size of the cloned repositories in bytes.
+    :param chunk_size: the target total size in bytes of the small files parsed as one task,
+                       0 to parse every file as a separate task.
+    :param cache: if not None, the cache of the parsed files.
+    :param bare: if True, the repositories are cloned as bare repositories, and the necessary
+                 files are read from Git by a single process per repository, see
+                 get_repository_blobs. Doesn't affect the local mode.
+    :return: a generator of pairs (the correct name of the repository for links,
+             a generator of its FileData objects).
+    """
+    # The opened repositories in the order of their tasks: (name, directory, the number of
+    # tasks, the stack that closes the repository, the cached files as tuples (key, path, lang),
+    # the keys of the parsed files by their paths, the reader and the blobs of the bare
+    # repository). The pool may ask for the tasks from another thread, but the repositories
+    # are always added before their tasks.
+    opened_repositories = deque()
+    stacks = []
+    futures = []
+    executor = ThreadPoolExecutor(max(prefetch, 1))
+
+    def get_repository_tasks_when_opened(count_repository: int, repository: str,
+                                         stack: ExitStack, future: Future,
+                                         repository_names: Set[str]) -> Iterator:
+        logging.info(f"Tokenizing repository: {repository} ({count_repository + 1} "
+                     f"out of {len(repositories)}).")
+        try:
+            repository_name, directory = future.result()
+        except RepositoryError as error:
+            logging.warning(f"{error} Skipping {repository}...")
+            stack.close()
+            return
+        if repository_name in repository_names:
+            logging.warning(f"{repository} is already tokenized, skipping...")
+            stack.close()
+            return
+        repository_names.add(repository_name)
+        cached_files = None
+        file_keys = {}
+        chunks = []
+        blobs = None
+        reader = None
+        if bare and not local:
+            reader = stack.enter_context(BlobReader(directory))
+        if cache is not None and not local:
+            # The names of the repositories include their commits in the default mode.
+            cached_files = cache.get_repository(repository_name, directory, bare)
+        if cached_files is None:
+            if reader is None:
+                files = get_repository_files(repository_name, directory, gran, languages)
+            else:
+                files, blobs = get_repository_blobs(repository_name, directory, gran, languages,
+                                                    reader)
+            cached_files = []
+            if cache is not None:
+                parsed_files = []
+                for file, lang in files:
+                    key = cache.get_file_key(file, lang, None if blobs is None else blobs[file][0])
+                    if cache.contains_file(key):
+                        cached_files.append((key, file, lang))
+                    else:
+                        file_keys[file] = key
+                        parsed_files.append((file, lang))
+                files = parsed_files
+            logging.debug(f"Parsing files in {repository_name}.")
+            sizes = None if blobs is None else [blobs[file][1] for file, _ in files]
+            chunks = schedule_files(files, chunk_size, sizes)
+        elif reader is not None:
+            # The objects of the cached files are read from their blobs too.
+            blobs = {get_full_path(path, directory): (sha, size)
+                     for path, sha, size in list_blobs(directory)}
+        if not chunks and not cached_files:
+            # The repositories without files aren't needed any more.
+            stack.close()
+        opened_repositories.append((repository_name, directory, len(chunks), stack, cached_files,
+                                    file_keys, reader, blobs))
+        yield from get_files_tasks(chunks, mode, gran, identifiers_verbose, subtokenize, backend,
+                                   decoding_errors, subtokenizer_cache_size, reader, blobs)
+
+    def get_tasks() -> Iterator:
+        repository_names = set()
+        opening_repositories = deque()
+        for count_repository, repository in enumerate(repositories):
+            # The repositories are opened in the threads, and closed after all their files.
+            stack = ExitStack()
+            stacks.append(stack)
+            future = executor.submit(stack.enter_context,
+                                     open_repository(repository, local, clone_timeout,
+                                                     max_clone_size, bare))
+            futures.append(future)
+            opening_repositories.append((count_repository, repository, stack, future))
+            if len(opening_repositories) > prefetch:
+                yield from get_repository_tasks_when_opened(*opening_repositories.popleft(),
+                                                            repository_names)
+        while opening_repositories:
+            yield from get_repository_tasks_when_opened(*opening_repositories.popleft(),
+                                                        repository_names)
+
+    def get_files(results: Iterator[List[FileData]], next_files: List[List[FileData]],
+                  repository_name: str, directory: str, count: int,
+                  cached_files: List[Tuple[str, str, str]], file_keys: Dict[str, str],
+                  reader: Optional[BlobReader],
+                  blobs: Optional[Dict[str, Tuple[str, int]]]) -> Iterator[FileData]:
+        for key, path, lang in cached_files:
+            file = cache.get_file(key, path)
+            if file is None:
+                # The file was evicted after it was found in the cache.
+                code = None
+                if reader is not None:
+                    code = reader.read(f"HEAD:{os.path.relpath(path, directory)}")
+                gather_objects, gather_identifiers, verbose, count_identifiers = \
+                    get_parsing_parameters(mode, gran, identifiers_verbose)
+                file = get_data_from_file(path, lang, gather_objects, gather_identifiers, verbose,
+                                          subtokenize, backend, decoding_errors=decoding_errors,
+                                          code=code, count_identifiers=count_identifiers,
+                                          compact_identifiers=True)
+                cache.set_file(key, file)
+            if reader is not None:
+                file = set_blob_sources(file, blobs)
+            if not local:
+                file = set_repository_path(file, repository_name, directory)
+            yield file
+        for _ in range(count):
+            files = next_files.pop() if next_files else next(results)
+            for file in files:
+                if cache is not None:
+                    cache.set_file(file_keys[file.path], file)
+                    cached_files.append((file_keys[file.path], file.path, file.lang))
+                if reader is not None:
+                    file = set_blob_sources(file, blobs)
+                if not local:
+                    file = set_repository_path(file, repository_name, directory)
+                yield file
+        if cache is not None:
+            if not local:
+                cache.set_repository(repository_name, directory, cached_files, bare)
+            cache.evict()
+
+    try:
+        results = iter(pool(get_tasks()))
+        next_files = []  # The result that was received before its repository.
+        while True:
+            if not opened_repositories:
+                # Getting the next result makes the pool ask for more tasks, and the repository
+                # of the result is opened by then. If there are no results, all the remaining
+                # repositories have no files.
+                next_files.extend(islice(results, 1))
+                if not opened_repositories:
+                    break
+            repository_name, directory, count, stack, cached_files, file_keys, reader, blobs = \
+                opened_repositories.popleft()
+            files = get_files(results, next_files, repository_name, directory, count,
+                              cached_files, file_keys, reader, blobs)
+            yield repository_name, files
+            # Consuming the rest of the files if they weren't consumed.
+            for _ in files:
+                pass
+            stack.close()
+    finally:
+        # The repositories that aren't being opened yet are not needed any more.
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
+        for stack in stacks:
+            stack.close()
+
+
+def get_repository_commit(repository_name: str, local: bool) -> Optional[str]:
+    """
+    Get the commit of a tokenized repository.
+    :param repository_name: the correct name of the repository for links.
+    :param local: True if tokenizing in local mode (repository is a path to a directory),
+                  False if tokenizing in default mode (repository is a GitHub link).
+    :return: the commit hash, None if the local directory isn't in a Git repository.
+    """
+    if not local:
+        # The names of the repositories include their commits in the default mode.
+        return repository_name.rstrip("/").rsplit("/", 1)[-1]
+    try:
+        return get_latest_commit(repository_name)
+    except subprocess.CalledProcessError:
+        return None
+
+
+# TODO: functionality for GitHub link creation
+def tokenize_repository(repository: str, local: bool, mode: str, gran: str,
+                        languages: Optional[List[str]], pool: Parallel,
+                        identifiers_verbose: bool = False, subtokenize: bool = False,
+                        backend: str = "walker", decoding_errors: str = "replace",
+                        subtokenizer_cache_size: int = TokenParser.CACHE_SIZE,
+                        chunk_size: int = CHUNK_SIZE) -> Tuple[str, List[FileData]]:
+    """
+    Tokenize a given repository. Return its correct full name and a list of FileData objects.
+    :param repository: a link to the repository. If "local" is False, a link to GitHub,
+                       otherwise - a path to a directory.
+    :param local: True if tokenizing in local mode (repository is a path to a directory),
+                  False if tokenizing in default mode (repository is a GitHub link).
+    :param mode: the mode of parsing. Either "counters" or "sequences".
+    :param gran: granularity of parsing. Values are ["projects", "files", "classes", "functions"].
+    :param languages: the languages of parsing. None for all the languages available for a
+                      given parsing granularity, specific languages for themselves.
+    :param pool: the Parallel class instance for multiprocessing.
+    :param identifiers_verbose: if True, will save not only identifiers themselves,
+                                but also their parameters as IdentifierData.
+    :param subtokenize: if True, will split the tokens into subtokens.
+    :param backend: the backend of extracting nodes from tree-sitter trees: "walker" or "query".
+    :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                            "strict", "replace", or "skip".
+    :param subtokenizer_cache_size: the number of tokens whose subtokens are cached in every
+                                    process, 0 to disable the cache.
+    :param chunk_size: the target total size in bytes of the small files parsed as one task,
+                       0 to parse every file as a separate task.
+    :return: the correct name of the repository for links and a list of FileData objects.
+    """
+    with open_repository(repository, local) as (repository_name, directory):
+        files = list(tokenize_repository_files(repository_name, directory, local, mode, gran,
+                                               languages, pool, identifiers_verbose,
+                                               subtokenize, backend, decoding_errors,
+                                               subtokenizer_cache_size, chunk_size))
     return repository_name, files
 
 
@@ -576,7 +1490,18 @@ def tokenize_list_of_repositories(repositories_file: str, output_dir: str, batch
                                   mode: str, gran: str, languages: Optional[List[str]],
                                   local: bool, output_format: str,
                                   identifiers_verbose: bool = False,
-                                  subtokenize: bool = False) -> None:
+                                  subtokenize: bool = False, backend: str = "walker",
+                                  decoding_errors: str = "replace",
+                                  subtokenizer_cache_size: int = TokenParser.CACHE_SIZE,
+                                  workers: int = PROCESSES, prefetch: int = PREFETCH,
+                                  clone_timeout: Optional[float] = None,
+                                  max_clone_size: Optional[int] = None,
+                                  chunk_size: int = CHUNK_SIZE, cache_dir: Optional[str] = None,
+                                  max_cache_size: int = MAX_CACHE_SIZE, bare: bool = False,
+                                  compress: Optional[str] = None, shards: int = 0,
+                                  shard_by: str = "round_robin", shard_size: Optional[int] = None,
+                                  shard_records: Optional[int] = None,
+                                  resume: bool = False) -> None:
     """
     Given the list of links to repositories, tokenize all the repositories in the list,
     writing them in batches to files in a specified output format.
@@ -589,10 +1514,41 @@ def tokenize_list_of_repositories(repositories_file: str, output_dir: str, batch
                       given parsing granularity, specific languages for themselves.
     :param local: True if tokenizing in local mode (the input file contains paths to directories),
                   False if tokenizing in default mode (the input file contains GitHub links).
-    :param output_format: the output format. Possible values: ["wabbit", "json"].
+    :param output_format: the output format. Possible values: ["wabbit", "json", "jsonl", "ids"].
     :param identifiers_verbose: if True, will save not only identifiers themselves,
                                 but also their parameters as IdentifierData.
     :param subtokenize: if True, will split the tokens into subtokens.
+    :param backend: the backend of extracting nodes from tree-sitter trees: "walker" or "query".
+    :param decoding_errors: the handling of identifiers that are not valid UTF-8:
+                            "strict", "replace", or "skip".
+    :param subtokenizer_cache_size: the number of tokens whose subtokens are cached in every
+                                    process, 0 to disable the cache.
+    :param workers: the number of processes that parse the files.
+    :param prefetch: the number of repositories that are cloned in advance.
+    :param clone_timeout: if not None, the maximum duration of cloning in seconds.
+    :param max_clone_size: if not None, the maximum size of the cloned repositories in bytes.
+    :param chunk_size: the target total size in bytes of the small files parsed as one task,
+                       0 to parse every file as a separate task.
+    :param cache_dir: if not None, the path to the directory of the cache of the parsed files
+                      that is reused by the following runs.
+    :param max_cache_size: the maximum size of the cache on disk in bytes.
+    :param bare: if True, the repositories are cloned as bare repositories, and the necessary
+                 files are read from Git without checking them out. Doesn't affect the local
+                 mode.
+    :param compress: if not None, the output files are compressed in background threads while
+                     they are written: "gzip", "bz2", or "xz". Not available for "ids".
+    :param shards: if positive, the output is written into this number of shard files that are
+                   written concurrently instead of a file per batch, and the files are listed
+                   in the manifest in the output directory.
+    :param shard_by: the assignment of the repositories to the shards: "round_robin" or
+                     "repository" for the hash of the name of the repository.
+    :param shard_size: if not None, a shard continues in a new file after its file reaches
+                       this size in bytes before compression.
+    :param shard_records: if not None, a shard continues in a new file after its file reaches
+                          this number of records (bags).
+    :param resume: if True, the batches that are completed in the run manifest of the output
+                   directory are skipped, and the rest are tokenized again. The manifest is
+                   written after every batch, not available with shards.
     :return: None.
     """
     if gran not in GRANULARITIES:
@@ -601,41 +1557,109 @@ def tokenize_list_of_repositories(repositories_file: str, output_dir: str, batch
         raise ValueError("Incorrect parsing mode.")
     if output_format not in OUTPUT_FORMATS:
         raise ValueError("Incorrect output format.")
+    if compress is not None and compress not in COMPRESSIONS:
+        raise ValueError("Incorrect compression.")
+    if compress is not None and output_format == "ids":
+        raise ValueError("The arrays of token IDs can't be compressed.")
+    if shards < 0 or shard_by not in SHARDINGS:
+        raise ValueError("Incorrect sharding.")
+    if (shard_size is not None and shard_size < 1) or \
+            (shard_records is not None and shard_records < 1):
+        raise ValueError("Incorrect size of the shards.")
+    if resume and (shards > 0 or shard_size is not None or shard_records is not None):
+        raise ValueError("Resuming isn't available with shards.")
+    if backend not in TREE_SITTER_BACKENDS:
+        raise ValueError("Incorrect tree-sitter backend.")
+    if decoding_errors not in DECODING_ERRORS:
+        raise ValueError("Incorrect handling of decoding errors.")
+    if subtokenizer_cache_size < 0:
+        raise ValueError("Incorrect size of the subtokenizer cache.")
+    if workers < 1:
+        raise ValueError("Incorrect number of workers.")
+    if prefetch < 0:
+        raise ValueError("Incorrect number of repositories to clone in advance.")
+    if chunk_size < 0:
+        raise ValueError("Incorrect size of the chunks of files.")
+    if max_cache_size < 0:
+        raise ValueError("Incorrect size of the cache.")
     logging.info(f"Tokenizing the repositories in {mode} mode, with {gran} granularity, "
                  f"saving into {output_format} format. Specific languages: {languages}, "
-                 f"subtokenizing: {subtokenize}, "
-                 f"parameters of identifiers: {identifiers_verbose}.")
+                 f"subtokenizing: {subtokenize} (cache size: {subtokenizer_cache_size}), "
+                 f"parameters of identifiers: {identifiers_verbose}, "
+                 f"tree-sitter backend: {backend}, decoding errors: {decoding_errors}, "
+                 f"workers: {workers}, prefetched repositories: {prefetch}, "
+                 f"chunks of files: {chunk_size} bytes, cache: {cache_dir}, "
+                 f"bare repositories: {bare}, shards: {shards}, resuming: {resume}.")
     # Reading the input file and splitting repositories into batches.
     with open(repositories_file) as fin:
         repositories_list = fin.read().splitlines()
         repositories_batches = to_batches(repositories_list, batch_size)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    # TODO: user should configure the number of processes
-    with Parallel(PROCESSES) as pool:
+    cache = None
+    if cache_dir is not None:
+        # Only the parameters that change the FileData objects invalidate the cache.
+        cache = TokenizationCache(cache_dir, get_parsing_parameters(mode, gran, identifiers_verbose)
+                                  + (subtokenize, decoding_errors), max_cache_size)
+    if shards == 0 and (shard_size is not None or shard_records is not None):
+        shards = 1
+    # The results of the workers are consumed in order as soon as they are ready and written
+    # right away, so only the files that are being parsed are kept in memory.
+    with Parallel(workers, return_as="generator") as pool, ExitStack() as stack:
+        sharded_writer = None
+        manifest = None
+        if shards == 0:
+            # Only the parameters that change the output files must be the same when resuming.
+            manifest = RunManifest(
+                output_dir, {"mode": mode, "gran": gran, "languages": languages, "local": local,
+                             "output_format": output_format,
+                             "identifiers_verbose": identifiers_verbose,
+                             "subtokenize": subtokenize, "decoding_errors": decoding_errors,
+                             "bare": bare, "compress": compress}, resume,
+                os.path.join(output_dir, TokenIdsWriter.VOCABULARY)
+                if output_format == "ids" else None)
+        else:
+            # The shard files are shared by all the batches.
+            sharded_writer = stack.enter_context(ShardedWriter(
+                OUTPUT_WRITERS[output_format], mode, gran, output_dir,
+                f"{output_format}_{mode}_{gran}", shards, shard_by, shard_size, shard_records,
+                compress))
         # Iterating over batches
         for count_batch, batch in enumerate(repositories_batches):
+            if manifest is not None and manifest.is_completed(count_batch, batch):
+                logging.info(f"Skipping completed batch {count_batch + 1} out of "
+                             f"{len(repositories_batches)}.")
+                continue
             logging.info(f"Tokenizing batch {count_batch + 1} out of {len(repositories_batches)}.")
-            reps2files = {}
             filename = f"{output_format}_{mode}_{gran}_{count_batch}.txt"
-            # Iterating over repositories in the batch
-            # TODO: add progress bar
-            for count_repository, repository in enumerate(batch):
-                logging.info(f"Tokenizing repository: {repository} ({count_repository + 1} "
-                             f"out of {len(batch)} in batch {count_batch + 1}).")
-                try:
-                    repository_name, files = tokenize_repository(repository, local, mode,
-                                                                 gran, languages, pool,
-                                                                 identifiers_verbose,
-                                                                 subtokenize)
-                except RepositoryError:
-                    logging.warning(f"{repository} is an incorrect link, skipping...")
-                    continue
-                reps2files[repository_name] = files
-            logging.info(f"Writing batch {count_batch + 1} out "
-                         f"of {len(repositories_batches)} to file.")
-            if len(reps2files.keys()) != 0:  # Skipping possible empty batches.
-                # Saving the batch in the necessary format.
-                OutputFormats(output_format, reps2files, mode, gran, output_dir, filename)
+            # The output file is only created with the first repository, skipping empty batches.
+            with nullcontext(sharded_writer) if sharded_writer is not None else \
+                    OUTPUT_WRITERS[output_format](mode, gran, output_dir, filename,
+                                                  compress) as writer:
+                if manifest is not None:
+                    # Removing the partial output of an interrupted run.
+                    for path in writer.get_paths():
+                        os.remove(path)
+                tokenized = []
+                # The files of all the repositories in the batch share the queue of the pool.
+                # TODO: add progress bar
+                for repository_name, files in tokenize_repositories(
+                        batch, local, mode, gran, languages, pool, identifiers_verbose,
+                        subtokenize, backend, decoding_errors, subtokenizer_cache_size,
+                        prefetch, clone_timeout, max_clone_size, chunk_size, cache, bare):
+                    writer.start_repository(repository_name)
+                    for file in files:
+                        writer.write_file(file)
+                    writer.finish_repository()
+                    tokenized.append({"name": repository_name,
+                                      "commit": get_repository_commit(repository_name, local)})
+            if manifest is not None:
+                manifest.add_batch(count_batch, batch, tokenized, writer.get_paths())
             logging.info(f"Finished batch {count_batch + 1} out of {len(repositories_batches)}.")
+    if cache is not None:
+        cache_info = cache.cache_info()
+        logging.info(f"Cached files: {cache_info.hits} hits, {cache_info.misses} misses, "
+                     f"{cache_info.repositories} repositories read from the cache entirely, "
+                     f"the size of the cache: {cache_info.currsize} out of {cache_info.maxsize} "
+                     f"bytes.")
     logging.info("Tokenization successfully completed.")
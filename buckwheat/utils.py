@@ -1,11 +1,17 @@
 """
 Auxiliary functionality.
 """
+from array import array
+from collections import Counter
+from contextlib import contextmanager
 import dataclasses
 from enum import Enum
+import mmap
 import os
 import subprocess
-from typing import Any, Dict, List, Optional, Tuple, Union
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 # TODO: better naming
 
@@ -26,7 +32,25 @@ PARSING_MODES = {"sequences", "counters"}
 GRANULARITIES = {"projects", "files", "classes", "functions"}
 
 # Supported output formats
-OUTPUT_FORMATS = {"wabbit", "json"}
+OUTPUT_FORMATS = {"wabbit", "json", "jsonl", "ids"}
+
+# Supported compressions of the output files and the extensions of the compressed files
+COMPRESSIONS = {"gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+# Supported ways of assigning the repositories to the shards of the output
+SHARDINGS = {"round_robin", "repository"}
+
+# Supported backends of extracting nodes from tree-sitter trees
+TREE_SITTER_BACKENDS = {"walker", "query"}
+
+# Supported ways of handling identifiers that are not valid UTF-8
+DECODING_ERRORS = {"strict", "replace", "skip"}
+
+# Files of this size in bytes and larger are memory-mapped instead of being read
+MMAP_THRESHOLD = 1024 * 1024
+
+# How often in seconds the timeout and the size of the directory are checked while cloning
+CLONE_POLL_INTERVAL = 0.5
 
 
 class ObjectTypes(Enum):
@@ -38,12 +62,33 @@ class IdentifiersTypes(Enum):
     """
     string = identifier itself
     verbose = IdentifierData class
+    counter = Counter object of identifiers and their counts
     """
     STRING = "string"
     VERBOSE = "verbose"
+    COUNTER = "counter"
+
+
+def add_slots(cls: type) -> type:
+    """
+    Recreate a dataclass with __slots__ for its fields, so that its instances don't have
+    a __dict__, like dataclass(slots=True) in Python 3.10.
+    :param cls: the dataclass.
+    :return: the new class with the same fields and methods.
+    """
+    namespace = dict(cls.__dict__)
+    names = tuple(field.name for field in dataclasses.fields(cls))
+    namespace["__slots__"] = names
+    for name in names:
+        # The default values are kept by the generated __init__.
+        namespace.pop(name, None)
+    namespace.pop("__dict__", None)
+    namespace.pop("__weakref__", None)
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
 
 
 # TODO: consider the differences between str and byte from the standpoint of coordinates
+@add_slots
 @dataclasses.dataclass
 class IdentifierData:
     """
@@ -55,6 +100,67 @@ class IdentifierData:
     start_column: int
 
 
+class IdentifierColumns:
+    """
+    Compact sequence of identifiers with their coordinates that behaves like a list of
+    IdentifierData objects: a table of unique tokens and the arrays of the indices of the tokens
+    in the table and of their coordinates. It is pickled as a few buffers instead of an object
+    per identifier, e.g. when the workers send the parsed files back.
+    """
+    __slots__ = ("tokens", "indices", "start_bytes", "start_lines", "start_columns")
+
+    def __init__(self, identifiers: Iterable[IdentifierData] = ()):
+        """
+        :param identifiers: the IdentifierData objects.
+        """
+        self.tokens = []  # type: List[str]
+        self.indices = array("I")
+        self.start_bytes = array("Q")
+        self.start_lines = array("I")
+        self.start_columns = array("I")
+        token_indices = {}
+        for identifier in identifiers:
+            index = token_indices.get(identifier.identifier)
+            if index is None:
+                index = token_indices[identifier.identifier] = len(self.tokens)
+                self.tokens.append(identifier.identifier)
+            self.indices.append(index)
+            self.start_bytes.append(identifier.start_byte)
+            self.start_lines.append(identifier.start_line)
+            self.start_columns.append(identifier.start_column)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[IdentifierData,
+                                                             List[IdentifierData]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return IdentifierData(self.tokens[self.indices[index]], self.start_bytes[index],
+                              self.start_lines[index], self.start_columns[index])
+
+    def __iter__(self) -> Iterator[IdentifierData]:
+        for index, start_byte, start_line, start_column in zip(
+                self.indices, self.start_bytes, self.start_lines, self.start_columns):
+            yield IdentifierData(self.tokens[index], start_byte, start_line, start_column)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (IdentifierColumns, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"IdentifierColumns({list(self)!r})"
+
+    def __getstate__(self) -> Tuple[List[str], array, array, array, array]:
+        return (self.tokens, self.indices, self.start_bytes, self.start_lines,
+                self.start_columns)
+
+    def __setstate__(self, state: Tuple[List[str], array, array, array, array]) -> None:
+        self.tokens, self.indices, self.start_bytes, self.start_lines, self.start_columns = state
+
+
+@add_slots
 @dataclasses.dataclass
 class ObjectData:
     """
@@ -62,19 +168,51 @@ class ObjectData:
     coordinates, language and identifiers.
     """
     object_type: ObjectTypes
-    content: str
+    content: Optional[str]  # None if the content wasn't gathered, see get_content.
     lang: str
-    identifiers: Union[List[IdentifierData], List[str]]
-    identifiers_type: IdentifiersTypes  # VERBOSE for IdentifierData, STRING for str.
+    identifiers: Union[List[IdentifierData], IdentifierColumns, List[str], Counter]
+    # VERBOSE for IdentifierData and IdentifierColumns, STRING for str, COUNTER for Counter.
+    identifiers_type: IdentifiersTypes
     start_byte: int
     start_line: int
     start_column: int
     end_byte: int
     end_line: int
     end_column: int
+    path: Optional[str] = None  # The file of the object as in the output, e.g. a link.
+    # The local path to the file or, in a bare repository, the hash of its blob, to read
+    # the content when needed. The clones of the remote repositories are deleted after
+    # tokenizing, so only the blobs stay available in the remote mode, through a bare clone.
+    source: Optional[str] = None
+
+    def get_content(self, reader: Optional["BlobReader"] = None,
+                    decoding_errors: str = "replace") -> str:
+        """
+        Get the source code of the object. If the content wasn't gathered during parsing,
+        it is read by the byte range of the object from the local file or, in a bare
+        repository, from the blob of the file.
+        :param reader: the reader of the bare repository of the object, the blob can be read
+                       from any clone of the repository.
+        :param decoding_errors: the handling of code that is not valid UTF-8: "strict" raises
+                                UnicodeDecodeError, other values put U+FFFD in place of invalid
+                                bytes, like for the content that is gathered during parsing.
+        :return: the source code of the object.
+        """
+        if self.content is not None:
+            return self.content
+        if self.source is None:
+            raise ValueError("The object has neither the content nor the source of its file!")
+        if reader is not None:
+            code = reader.read(self.source)[self.start_byte:self.end_byte]
+        else:
+            with open(self.source, "rb") as fin:
+                fin.seek(self.start_byte)
+                code = fin.read(self.end_byte - self.start_byte)
+        return code.decode("utf-8", "strict" if decoding_errors == "strict" else "replace")
 
 
 # TODO: think about the duplication of identifiers_type
+@add_slots
 @dataclasses.dataclass
 class FileData:
     """
@@ -83,8 +221,9 @@ class FileData:
     path: str
     lang: str
     objects: List[ObjectData]
-    identifiers: Union[List[IdentifierData], List[str]]
-    identifiers_type: IdentifiersTypes  # VERBOSE for IdentifierData, STRING for str.
+    identifiers: Union[List[IdentifierData], IdentifierColumns, List[str], Counter]
+    # VERBOSE for IdentifierData and IdentifierColumns, STRING for str, COUNTER for Counter.
+    identifiers_type: IdentifiersTypes
 
 
 class RepositoryError(ValueError):
@@ -104,6 +243,39 @@ def read_file(file: str) -> str:
         return fin.read()
 
 
+@contextmanager
+def read_code(file: str) -> Iterator[Union[bytes, mmap.mmap]]:
+    """
+    Get the raw contents of the file without decoding them, to be passed to the parsers.
+    Large files are memory-mapped, so the contents are only available within the context.
+    :param file: the path to the file.
+    :return: the contents of the file as bytes or as a memory-mapped file.
+    """
+    with open(file, "rb") as fin:
+        if os.fstat(fin.fileno()).st_size < MMAP_THRESHOLD:
+            yield fin.read()
+        else:
+            with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as code:
+                yield code
+
+
+def decode_identifier(identifier: bytes, decoding_errors: str = "strict") -> Optional[str]:
+    """
+    Decode an identifier from UTF-8.
+    :param identifier: the identifier in bytes.
+    :param decoding_errors: what to do if the identifier is not valid UTF-8: "strict" raises
+                            UnicodeDecodeError, "replace" puts U+FFFD in place of invalid bytes,
+                            "skip" returns None.
+    :return: the identifier as a string or None if it's skipped.
+    """
+    if decoding_errors == "skip":
+        try:
+            return identifier.decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+    return identifier.decode("utf-8", errors=decoding_errors)
+
+
 def to_batches(lst: List[Any], batch_size: int) -> List[List[Any]]:
     """
     Split a given list into sublists with a given maximum number of items.
@@ -114,6 +286,42 @@ def to_batches(lst: List[Any], batch_size: int) -> List[List[Any]]:
     return [lst[x:x + batch_size] for x in range(0, len(lst), batch_size)]
 
 
+def schedule_files(files: List[Tuple[str, str]], chunk_size: int,
+                   sizes: Optional[List[int]] = None) -> List[List[Tuple[str, str]]]:
+    """
+    Order the files for parsing from the largest to the smallest, so that a large file doesn't
+    start last and delay the whole repository, and group the small files into chunks of a given
+    total size, so that the pool doesn't dispatch every small file separately.
+    :param files: a list of tuples (full_path_to_file, lang).
+    :param chunk_size: the target total size of the files in a chunk in bytes. The files that
+                       are at least this large are put into chunks of their own, 0 puts every
+                       file into a chunk of its own.
+    :param sizes: the sizes of the files in bytes. If None, the files are checked on disk.
+    :return: a list of chunks, every chunk is a list of tuples (full_path_to_file, lang).
+    """
+    if sizes is None:
+        sizes = []
+        for file, _ in files:
+            try:
+                sizes.append(os.stat(file).st_size)
+            except OSError:  # The missing files are reported during parsing.
+                sizes.append(0)
+    chunks = []
+    chunk = []
+    chunk_bytes = 0
+    # The sorting is stable, so the files of the same size keep their order.
+    for index in sorted(range(len(files)), key=lambda i: -sizes[i]):
+        chunk.append(files[index])
+        chunk_bytes += sizes[index]
+        if chunk_bytes >= chunk_size:
+            chunks.append(chunk)
+            chunk = []
+            chunk_bytes = 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
 def assert_trailing_slash(link: str) -> str:
     """
     Add a trailing slash to a link if there isn't one.
@@ -127,20 +335,67 @@ def assert_trailing_slash(link: str) -> str:
         return link + "/"
 
 
-# TODO: maybe do it without modifying the link (consider GIT_TERMINAL_PROMT=0)
-def clone_repository(repository: str, directory: str) -> None:
+def get_directory_size(directory: str) -> int:
     """
-    Clone a given repository into a folder.
-    :param repository: a link to GitHub repository, either HTTP or HTTPs.
+    Get the total size of the files in a directory and its subdirectories.
+    :param directory: the path to the directory.
+    :return: the size in bytes.
+    """
+    size = 0
+    for root, _, files in os.walk(directory):
+        for file in files:
+            try:
+                size += os.lstat(os.path.join(root, file)).st_size
+            except FileNotFoundError:  # The files may be moved while cloning.
+                pass
+    return size
+
+
+def clone_repository(repository: str, directory: str, timeout: Optional[float] = None,
+                     max_size: Optional[int] = None, bare: bool = False) -> None:
+    """
+    Clone a given repository into a folder. Git never asks for credentials, so the private
+    and the missing repositories fail right away.
+    :param repository: a link to the repository: HTTP, HTTPS, or any other URL supported by Git,
+                       e.g. file:// for local bare repositories.
     :param directory: path to target directory to clone the repository.
+    :param timeout: if not None, the maximum duration of cloning in seconds.
+    :param max_size: if not None, the maximum size of the cloned directory in bytes.
+    :param bare: if True, the repository is cloned without checking out the files, they can be
+                 read with list_blobs and BlobReader.
     :return: none.
     """
-    if "://" in repository:
-        body = repository.split("://")[1]
-    else:
+    if "://" not in repository:
         raise RepositoryError(f"{repository} is not a valid link!")
-    repository = "https://user:password@" + body
-    os.system(f"git clone --quiet --depth 1 {repository} {directory}")
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    args = ["git", "clone", "--quiet", "--depth", "1"]
+    if bare:
+        args.append("--bare")
+    process = subprocess.Popen(args + [repository, directory], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, env=env)
+    start = time.monotonic()
+    try:
+        while True:
+            interval = CLONE_POLL_INTERVAL
+            if timeout is not None:
+                interval = min(interval, max(start + timeout - time.monotonic(), 0))
+            try:
+                process.wait(timeout=interval)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if timeout is not None and time.monotonic() - start >= timeout:
+                raise RepositoryError(f"Cloning {repository} took more than {timeout} seconds!")
+            if max_size is not None and get_directory_size(directory) > max_size:
+                raise RepositoryError(f"{repository} is larger than {max_size} bytes!")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    if process.returncode != 0:
+        raise RepositoryError(f"Unable to clone {repository}!")
+    if max_size is not None and get_directory_size(directory) > max_size:
+        raise RepositoryError(f"{repository} is larger than {max_size} bytes!")
 
 
 def get_latest_commit(directory: str) -> str:
@@ -149,8 +404,76 @@ def get_latest_commit(directory: str) -> str:
     :param directory: the path to a Git directory.
     :return: commit hash.
     """
-    command = f"cd {directory}; git rev-parse HEAD"
-    return subprocess.check_output(command, shell=True, text=True).rstrip()
+    return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=directory,
+                                   stderr=subprocess.DEVNULL, text=True).rstrip()
+
+
+def list_blobs(directory: str) -> List[Tuple[str, str, int]]:
+    """
+    List the files of the latest commit of a Git repository without reading them. The files
+    don't need to be checked out, so the repository can be bare. Symbolic links and
+    submodules are skipped.
+    :param directory: the path to a Git directory.
+    :return: a list of tuples (the path to the file in the repository, blob hash, size in bytes).
+    """
+    output = subprocess.check_output(["git", "ls-tree", "-r", "-z", "--long", "HEAD"],
+                                     cwd=directory)
+    blobs = []
+    for entry in output.split(b"\0"):
+        if not entry:
+            continue
+        info, path = entry.split(b"\t", 1)
+        mode, object_type, sha, size = info.split()
+        if object_type != b"blob" or mode == b"120000":
+            continue
+        blobs.append((os.fsdecode(path), sha.decode(), int(size)))
+    return blobs
+
+
+class BlobReader:
+    """
+    Reader of the files from the object database of a Git repository through a single
+    long-lived "git cat-file --batch" process. The reader can be shared by several threads.
+    """
+    def __init__(self, directory: str):
+        """
+        :param directory: the path to a Git directory, possibly bare.
+        """
+        self.process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=directory,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.lock = threading.Lock()
+
+    def read(self, name: str) -> bytes:
+        """
+        Read a file from the object database.
+        :param name: the name of the object: the hash of the blob, or "HEAD:path" for
+                     the path to the file in the latest commit.
+        :return: the contents of the file.
+        """
+        with self.lock:
+            self.process.stdin.write(name.encode() + b"\n")
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().split()
+            if len(header) != 3:
+                raise FileNotFoundError(f"There's no {name} in the repository!")
+            code = self.process.stdout.read(int(header[2]))
+            self.process.stdout.read(1)  # The trailing newline.
+        return code
+
+    def close(self) -> None:
+        """
+        Stop the Git process.
+        :return: None.
+        """
+        self.process.stdin.close()
+        self.process.wait()
+        self.process.stdout.close()
+
+    def __enter__(self) -> "BlobReader":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
 
 
 def get_full_path(file: str, directory: str) -> str: